@@ -0,0 +1,40 @@
+import pytest
+
+from twitter_guard import session
+from twitter_guard.apifree_bot import TwitterBot
+from twitter_guard.standin_server import StandinServer, StandinConfig, write_cookie_file
+
+
+@pytest.fixture
+def standin():
+    """
+    Starts stand-in servers with the given StandinConfig settings, e.g. standin(users=50, rate_limit=0), and stops them after the test.
+    """
+    servers = []
+
+    def start(**settings):
+        server = StandinServer(port=0, config=StandinConfig(**settings)).start()
+        servers.append(server)
+        # the guest sessions created internally follow the override too
+        session.use_base_url(server.url)
+        return server
+
+    yield start
+    session.use_base_url(None)
+    for server in servers:
+        server.stop()
+
+
+@pytest.fixture
+def make_bot(tmp_path):
+    """
+    Creates TwitterBots logged in to a stand-in server, with their files under the temporary directory of the test.
+    """
+
+    def make(server, **kwargs):
+        cookie_path = str(tmp_path / "cookies.txt")
+        write_cookie_file(cookie_path)
+        kwargs.setdefault("state_path", str(tmp_path / "state.json"))
+        return TwitterBot(cookie_path=cookie_path, base_url=server.url, **kwargs)
+
+    return make
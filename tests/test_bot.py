@@ -0,0 +1,47 @@
+import threading
+
+from twitter_guard.apifree_bot import TwitterUserProfile
+
+
+def profiles(count):
+    return {
+        10_000_000 + i: TwitterUserProfile(10_000_000 + i, f"synthetic_{i}", created_at="2020-01-01T00:00:00+0000", followers_count=i % 10)
+        for i in range(count)
+    }
+
+
+def test_two_bots_judge_concurrently(standin, make_bot, tmp_path):
+    server = standin(users=500, rate_limit=0)
+    lenient = make_bot(server, state_path=str(tmp_path / "lenient_state.json"))
+    strict = make_bot(server, state_path=str(tmp_path / "strict_state.json"))
+    lenient._filtering_rule = "followers_count < 2"
+    strict._filtering_rule = "followers_count < 8"
+    users = profiles(300)
+    results = dict()
+
+    def judge(name, bot):
+        results[name] = bot.judge_users(users, block=False)
+
+    threads = [threading.Thread(target=judge, args=item) for item in [("lenient", lenient), ("strict", strict)]]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for name, threshold in [("lenient", 2), ("strict", 8)]:
+        expected = {user_id: "bad" if user.followers_count < threshold else "good" for user_id, user in users.items()}
+        assert results[name] == expected
+
+
+def test_judge_users_keeps_one_pipeline(standin, make_bot):
+    server = standin(users=500, rate_limit=0)
+    bot = make_bot(server)
+    bot._filtering_rule = "followers_count < 2"
+    users = profiles(20)
+
+    first = bot.judge_users(dict(list(users.items())[:10]), block=False)
+    pipeline = bot._pipeline
+    second = bot.judge_users(dict(list(users.items())[10:]), block=False)
+
+    assert bot._pipeline is pipeline
+    assert {**first, **second} == {user_id: "bad" if user.followers_count < 2 else "good" for user_id, user in users.items()}
@@ -0,0 +1,51 @@
+import json
+import os
+
+from twitter_guard.eventlog import EventLog, INDEX_NAME
+
+DAY_MS = 86400 * 1000
+
+
+def events(start, count, step=1000):
+    return [{"time": start + i * step, "n": i} for i in range(count)]
+
+
+def test_read_range(tmp_path):
+    log = EventLog(str(tmp_path))
+    log.append(events(0, 3) + events(DAY_MS, 3))
+    assert len(log) == 6
+    assert [e["n"] for e in log.read(DAY_MS, None)] == [0, 1, 2]
+
+
+def test_stale_index_is_rebuilt(tmp_path):
+    log = EventLog(str(tmp_path))
+    log.append(events(0, 3))
+    with open(tmp_path / INDEX_NAME) as f:
+        stale_index = f.read()
+
+    # appended after the last index write that survived a crash
+    log.append(events(DAY_MS - 1000, 1) + events(5000, 2))
+    with open(tmp_path / INDEX_NAME, "w") as f:
+        f.write(stale_index)
+
+    reopened = EventLog(str(tmp_path))
+    assert len(reopened) == 6
+    # the stale "last" time would skip the segment for this range
+    assert [e["time"] for e in reopened.read(DAY_MS - 1000, DAY_MS)] == [DAY_MS - 1000]
+    with open(tmp_path / INDEX_NAME) as f:
+        assert sum(entry["count"] for entry in json.load(f).values()) == 6
+
+
+def test_missing_index_is_rebuilt(tmp_path):
+    EventLog(str(tmp_path)).append(events(0, 4))
+    os.remove(tmp_path / INDEX_NAME)
+    assert len(EventLog(str(tmp_path))) == 4
+
+
+def test_file_backup_log_path_is_appended_as_yaml(standin, make_bot, tmp_path):
+    backup_log_path = tmp_path / "backup_log.txt"
+    backup_log_path.write_text("")
+    bot = make_bot(standin(users=200, rate_limit=0), backup_log_path=str(backup_log_path))
+    assert bot._event_log is None
+    bot.check_notifications(block=False)
+    assert backup_log_path.read_text()
@@ -0,0 +1,66 @@
+import threading
+from time import perf_counter, sleep
+
+import pytest
+import requests
+
+from twitter_guard.hedging import Hedging, HedgeBudget
+from twitter_guard.session import CustomSession
+
+
+class FixedLatency:
+    # stands in for AdaptiveTimeouts
+    def __init__(self, latency):
+        self.latency = latency
+
+    def quantile_latency(self, endpoint, quantile):
+        return self.latency
+
+
+def slow(value, seconds):
+    sleep(seconds)
+    return value
+
+
+def test_slow_request_is_hedged():
+    hedging = Hedging(budget=HedgeBudget(ratio=1), max_workers=2)
+    result = hedging.call("e", FixedLatency(0.05), slow, "primary", 1.0, hedge_func=lambda value, seconds: "hedge")
+    assert result == "hedge"
+    assert hedging.stats()["hedge_wins"] == 1
+    hedging.shutdown()
+
+
+def test_failed_hedge_loses_to_the_primary():
+    def broken(*args):
+        raise RuntimeError("throttled")
+
+    hedging = Hedging(budget=HedgeBudget(ratio=1), max_workers=2)
+    assert hedging.call("e", FixedLatency(0.05), slow, "primary", 0.3, hedge_func=broken) == "primary"
+    assert hedging.stats()["hedges"] == 1
+    hedging.shutdown()
+
+
+def test_saturated_pool_runs_inline_without_hedging():
+    hedging = Hedging(budget=HedgeBudget(ratio=1), max_workers=1)
+    release = threading.Event()
+    blocker, started = hedging._try_submit(release.wait)
+    started.wait()
+
+    start = perf_counter()
+    assert hedging.call("e", FixedLatency(0.01), slow, "primary", 0.2) == "primary"
+    assert perf_counter() - start < 1
+    stats = hedging.stats()
+    assert stats["hedges"] == 0 and stats["saturated"] == 1
+
+    release.set()
+    blocker.result()
+    hedging.shutdown()
+
+
+def test_hedge_is_not_retried(standin):
+    server = standin(rate_limit=0, throttle_rate=1.0)
+    s = CustomSession(base_url=server.url)
+    start = perf_counter()
+    with pytest.raises(requests.exceptions.HTTPError):
+        s._hedge_get("https://api.twitter.com/2/badge_count/badge_count.json")
+    assert perf_counter() - start < 1
@@ -0,0 +1,69 @@
+import json
+
+from twitter_guard.session import CustomSession
+
+
+def test_circuit_open_response_is_a_twitter_error():
+    r = CustomSession._circuit_open_response("https://api.twitter.com/2/notifications/all.json", 0)
+    assert r.status_code == 429
+    assert r.json()["errors"][0]["code"] == 88
+    assert int(r.headers["content-length"]) == len(r.content)
+
+
+def test_rate_limited_poll_keeps_the_cursor(standin, make_bot):
+    server = standin(users=200, rate_limit=1)
+    bot = make_bot(server)
+
+    assert bot.check_notifications(block=False)
+    cursor, sortindex = bot._notification_cursor, bot.latest_sortindex
+    assert cursor is not None
+
+    # the governor fails fast with a local 429, which is not parsed as a page
+    assert bot.check_notifications(block=False) == {}
+    assert (bot._notification_cursor, bot.latest_sortindex) == (cursor, sortindex)
+
+
+def saved_state(bot):
+    bot._state.flush()
+    with open(bot._state.path) as f:
+        return json.load(f)
+
+
+def burst(server, count):
+    with server.state._lock:
+        server.state._generate_notifications(count)
+
+
+def test_catch_up_saves_the_cursor_once_complete(standin, make_bot):
+    server = standin(users=200, rate_limit=0)
+    bot = make_bot(server)
+    bot.check_notifications(block=False)
+    first = bot.latest_sortindex
+
+    # more than two pages arrive between two checks
+    burst(server, 120)
+    newest = server.state.notifications[-1]["sort_index"]
+    bot.check_notifications(block=False)
+    assert int(bot.latest_sortindex) > newest
+    assert saved_state(bot)["latest_sortindex"] == bot.latest_sortindex != first
+
+
+def test_throttled_catch_up_keeps_the_cursor(standin, make_bot):
+    # the first check, the poll and one catch-up page fit in the window
+    server = standin(users=200, rate_limit=3)
+    bot = make_bot(server)
+    bot.check_notifications(block=False)
+    cursor, sortindex = bot._notification_cursor, bot.latest_sortindex
+
+    burst(server, 120)
+    newest = server.state.notifications[-1]["sort_index"]
+    bot.check_notifications(block=False)
+    assert (bot._notification_cursor, bot.latest_sortindex) == (cursor, sortindex)
+    assert saved_state(bot)["latest_sortindex"] == sortindex
+
+    # once the window resets, the next check pages back over the same gap
+    server.state.config.rate_limit = 0
+    bot._session.governor._limits.clear()
+    bot.check_notifications(block=False)
+    assert int(bot.latest_sortindex) > newest
+    assert saved_state(bot)["latest_sortindex"] == bot.latest_sortindex
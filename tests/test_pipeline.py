@@ -0,0 +1,36 @@
+import threading
+
+from twitter_guard.pipeline import JudgeActPipeline
+
+
+def test_failing_skip_does_not_hang():
+    def skip(user_id):
+        if user_id == 3:
+            raise KeyError(user_id)
+        return False
+
+    acted = []
+    with JudgeActPipeline(lambda user_id, user: user % 2 == 1, act=acted.append, skip=skip, act_workers=2) as pipeline:
+        for user_id in range(6):
+            pipeline.submit(user_id, user_id)
+
+    assert 3 not in pipeline.judgements
+    assert sorted(pipeline.judgements) == [0, 1, 2, 4, 5]
+    assert sorted(acted) == [1, 5]
+
+
+def test_batches_share_the_threads():
+    acted = []
+    pipeline = JudgeActPipeline(lambda user_id, user: user < 0, act=acted.append, act_workers=2)
+    before = threading.active_count()
+
+    first = pipeline.run({1: -1, 2: 1})
+    second = pipeline.run({3: -1, 4: -1}, act=False)
+
+    assert threading.active_count() == before
+    assert first.judgements == {1: "bad", 2: "good"}
+    assert first.actions == {1: None}
+    assert second.judgements == {3: "bad", 4: "bad"}
+    assert second.actions == dict()
+    assert acted == [1]
+    pipeline.close()
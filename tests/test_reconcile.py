@@ -0,0 +1,88 @@
+import os
+
+import pytest
+import requests
+
+from twitter_guard.reconcile import BlockListReconciler
+from twitter_guard.standin_server import USER_ID_BASE
+
+
+def block_remotely(server, count):
+    for i in range(count):
+        server.state.block(USER_ID_BASE + i)
+
+
+def test_full_sync(standin, make_bot, tmp_path):
+    server = standin(users=500, rate_limit=0)
+    block_remotely(server, 100)
+    bot = make_bot(server)
+    # one stale local entry, and 10 remote blocks missing locally
+    bot._block_list.update({USER_ID_BASE + i: f"synthetic_{i}" for i in range(10, 100)})
+    bot._block_list[USER_ID_BASE + 400] = "synthetic_400"
+
+    report = BlockListReconciler(bot, str(tmp_path / "blocked.bin")).reconcile()
+    assert report.full and report.fetched == 100
+    assert report.only_local == [USER_ID_BASE + 400]
+    assert len(report.only_remote) == 10
+    assert sorted(bot._block_list) == [USER_ID_BASE + i for i in range(100)]
+
+
+def test_throttled_sync_changes_nothing(standin, make_bot, tmp_path):
+    # three pages of 20 before BlockedAccountsAll is throttled for the rest of the window
+    server = standin(users=500, rate_limit=3)
+    block_remotely(server, 100)
+    bot = make_bot(server)
+    local = {USER_ID_BASE + i: f"synthetic_{i}" for i in range(100)}
+    bot._block_list.update(local)
+    snapshot_path = str(tmp_path / "blocked.bin")
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        BlockListReconciler(bot, snapshot_path).reconcile()
+    # the 40 blocks beyond the third page are not taken for remote unblocks
+    assert bot._block_list == local
+    assert not os.path.exists(snapshot_path)
+
+
+def test_throttled_incremental_sync_keeps_the_snapshot(standin, make_bot, tmp_path):
+    server = standin(users=500, rate_limit=0)
+    block_remotely(server, 100)
+    bot = make_bot(server)
+    bot._block_list.update({USER_ID_BASE + i: f"synthetic_{i}" for i in range(100)})
+    reconciler = BlockListReconciler(bot, str(tmp_path / "blocked.bin"))
+    reconciler.reconcile()
+    with open(reconciler.snapshot_path, "rb") as f:
+        snapshot = f.read()
+
+    # 50 new blocks, and the next page already fails
+    for i in range(100, 150):
+        server.state.block(USER_ID_BASE + i)
+    server.state.config.throttle_rate = 1.0
+    with pytest.raises(requests.exceptions.HTTPError):
+        reconciler.reconcile()
+    with open(reconciler.snapshot_path, "rb") as f:
+        assert f.read() == snapshot
+    assert len(bot._block_list) == 100
+
+
+def test_changed_prefix_keeps_the_fetched_pages(standin, make_bot, tmp_path):
+    server = standin(users=500, rate_limit=0)
+    block_remotely(server, 100)
+    bot = make_bot(server)
+    bot._block_list.update({USER_ID_BASE + i: f"synthetic_{i}" for i in range(100)})
+    reconciler = BlockListReconciler(bot, str(tmp_path / "blocked.bin"))
+    reconciler.reconcile()
+
+    # 30 new blocks in front of the synced prefix, which lost one of its entries
+    server.state.block(USER_ID_BASE + 95, add=False)
+    for i in range(100, 130):
+        server.state.block(USER_ID_BASE + i)
+    get_blocked = bot.get_blocked
+    calls = []
+    bot.get_blocked = lambda *args, **kwargs: calls.append(1) or get_blocked(*args, **kwargs)
+
+    report = reconciler.reconcile()
+    # the paging went on from the changed prefix instead of starting over
+    assert len(calls) == 1
+    assert report.full and report.fetched == 129 and report.new_remote == 30
+    assert report.only_local == [USER_ID_BASE + 95]
+    assert sorted(bot._block_list) == [USER_ID_BASE + i for i in range(130) if i != 95]
@@ -0,0 +1,159 @@
+import sqlite3
+import threading
+
+import pytest
+import requests
+
+from twitter_guard import recorder as recorder_module
+from twitter_guard.recorder import Recorder, SCHEMA_VERSION, snowflake_id_from_timestamp
+
+
+def make_recorder(tmp_path):
+    return Recorder(str(tmp_path / "db" / "recorder.db"), batch_size=25)
+
+
+def count_posts(recorder, query):
+    return recorder.conn.execute("SELECT COUNT(*) FROM posts WHERE query = ?", (query,)).fetchone()[0]
+
+
+def create_old_database(tmp_path):
+    db_path = tmp_path / "db" / "recorder.db"
+    db_path.parent.mkdir()
+    conn = sqlite3.connect(db_path)
+    # the schema before versioning
+    conn.execute("CREATE TABLE queries (query text, latest_result_date text)")
+    conn.execute(
+        "CREATE TABLE users (user_id int PRIMARY KEY, screen_name text, created_at text, following_count integer, followers_count integer, tweet_count integer, favourites_count integer, media_count integer, last_seen_post_id integer, account_status text DEFAULT 'normal') WITHOUT ROWID"
+    )
+    conn.execute(
+        "CREATE TABLE posts (post_id int PRIMARY KEY, account_id integer, created_at text, source text, reply_count integer, retweet_count integer, like_count integer, quote_count integer, view_count integer, query text, content text) WITHOUT ROWID"
+    )
+    post_id = snowflake_id_from_timestamp(1690000000)
+    conn.execute("INSERT INTO queries VALUES ('cats', '2023-07-22T04:26:40+00:00')")
+    conn.execute("INSERT INTO users (user_id, screen_name, created_at) VALUES (1, 'someone', '2020-01-01 00:00:00')")
+    conn.execute("INSERT INTO posts (post_id, account_id, created_at, query) VALUES (?, 1, '2023-07-22T04:26:40+00:00', 'cats')", (post_id,))
+    conn.commit()
+    conn.close()
+    return db_path, post_id
+
+
+def test_migration_of_an_old_database(tmp_path):
+    db_path, post_id = create_old_database(tmp_path)
+
+    recorder = Recorder(str(db_path))
+    assert recorder.conn.execute("SELECT version FROM schema_version").fetchone()[0] == SCHEMA_VERSION
+    assert recorder.conn.execute("SELECT created_at_epoch FROM posts").fetchone()[0] == 1690000000
+    assert recorder.conn.execute("SELECT created_at_epoch FROM users").fetchone()[0] == 1577836800
+    assert recorder._query_watermark("cats") == post_id
+    # reopening does not migrate again
+    Recorder(str(db_path))
+
+
+
+def test_failed_migration_is_rolled_back(tmp_path, monkeypatch):
+    db_path, _ = create_old_database(tmp_path)
+    migrations = recorder_module.MIGRATIONS
+    version, statements = migrations[0]
+    monkeypatch.setattr(recorder_module, "MIGRATIONS", [(version, statements + ["ALTER TABLE missing ADD COLUMN x integer"])])
+
+    with pytest.raises(sqlite3.OperationalError):
+        Recorder(str(db_path))
+    conn = sqlite3.connect(db_path)
+    assert "created_at_epoch" not in [row[1] for row in conn.execute("PRAGMA table_info(posts)")]
+    conn.close()
+
+    # no duplicate column on the next open
+    monkeypatch.setattr(recorder_module, "MIGRATIONS", migrations)
+    recorder = Recorder(str(db_path))
+    assert recorder.conn.execute("SELECT version FROM schema_version").fetchone()[0] == SCHEMA_VERSION
+
+def test_since_id_fetches_only_new_posts(standin, make_bot, tmp_path):
+    server = standin(users=200, tweets=60, tweet_interval=60, rate_limit=0)
+    bot = make_bot(server)
+    recorder = make_recorder(tmp_path)
+
+    recorder.record(bot, "cats")
+    assert count_posts(recorder, "cats") == 60
+    watermark = recorder._query_watermark("cats")
+    assert watermark == server.state.tweet_id(0)
+
+    recorder.record(bot, "cats")
+    assert count_posts(recorder, "cats") == 60
+
+    # ten newer tweets
+    server.state.started_at += 570
+    recorder.record(bot, "cats")
+    assert count_posts(recorder, "cats") == 70
+    assert recorder._query_watermark("cats") == server.state.tweet_id(0)
+
+
+def test_throttled_record_keeps_the_watermark(standin, make_bot, tmp_path):
+    # three pages of 100 before SearchTimeline is throttled for the rest of the window
+    server = standin(users=200, tweets=500, rate_limit=3)
+    bot = make_bot(server)
+    recorder = make_recorder(tmp_path)
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        recorder.record(bot, "cats")
+    # the posts fetched so far are kept, but the search starts over next time
+    assert count_posts(recorder, "cats") == 300
+    assert recorder._query_watermark("cats") is None
+
+    server.state.config.rate_limit = 0
+    bot._session.governor._limits.clear()
+    recorder.record(bot, "cats")
+    assert count_posts(recorder, "cats") == 500
+    assert recorder._query_watermark("cats") == server.state.tweet_id(0)
+
+
+def test_record_many(standin, make_bot, tmp_path):
+    server = standin(users=200, tweets=60, rate_limit=0)
+    bot = make_bot(server)
+    recorder = make_recorder(tmp_path)
+    queries = ["cats", "dogs", "birds"]
+
+    assert recorder.record_many(bot, queries, max_workers=2, queue_size=10) == {query: 60 for query in queries}
+    # the stand-in returns the same tweets for every query
+    assert recorder.conn.execute("SELECT COUNT(*) FROM posts").fetchone()[0] == 60
+    for query in queries:
+        assert recorder._query_watermark(query) == server.state.tweet_id(0)
+    assert recorder.record_many(bot, queries) == {query: 0 for query in queries}
+
+
+def test_throttled_query_is_reported_as_failed(standin, make_bot, tmp_path):
+    # enough for one query of 200 tweets, the second one runs out of requests
+    server = standin(users=200, tweets=200, rate_limit=4)
+    bot = make_bot(server)
+    recorder = make_recorder(tmp_path)
+
+    counts = recorder.record_many(bot, ["cats", "dogs"], max_workers=1)
+    assert counts == {"cats": 200, "dogs": None}
+    assert recorder._query_watermark("cats") == server.state.tweet_id(0)
+    assert recorder._query_watermark("dogs") is None
+
+
+def test_record_many_reports_writer_failure(standin, make_bot, tmp_path):
+    server = standin(users=200, tweets=200, rate_limit=0)
+    bot = make_bot(server)
+    result = dict()
+
+    def run():
+        # sqlite objects stay on the thread that created them
+        recorder = make_recorder(tmp_path)
+        write_batch = recorder._write_batch
+
+        def failing_write_batch(user_rows, post_rows, conn=None, query_rows=()):
+            if conn is not None:
+                raise sqlite3.OperationalError("disk I/O error")
+            return write_batch(user_rows, post_rows, conn=conn, query_rows=query_rows)
+
+        recorder._write_batch = failing_write_batch
+        # a small queue, so that the searches would block on it without the drain
+        result.update(recorder.record_many(bot, ["cats", "dogs"], queue_size=5))
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout=60)
+    assert not thread.is_alive()
+    assert result == {"cats": None, "dogs": None}
+    assert make_recorder(tmp_path)._query_watermark("cats") is None
@@ -0,0 +1,23 @@
+from concurrent import futures
+
+from twitter_guard.rule_parser import rule_eval, rule_variables
+
+RULE = "(followers_count < 5) or (days < 180)"
+
+
+def test_rule_eval():
+    assert rule_eval(RULE, {"followers_count": 3, "days": 400})
+    assert not rule_eval(RULE, {"followers_count": 30, "days": 400})
+    assert rule_eval("3 >= F/C >=2", {"C": 2, "F": 5})
+    assert rule_variables(RULE) == {"followers_count", "days"}
+
+
+def test_concurrent_evaluations_do_not_mix_profiles():
+    profiles = [{"followers_count": i % 10, "days": 400} for i in range(600)]
+
+    def judge(profile):
+        return rule_eval(RULE, profile)
+
+    with futures.ThreadPoolExecutor(max_workers=8) as executor:
+        verdicts = list(executor.map(judge, profiles))
+    assert verdicts == [profile["followers_count"] < 5 for profile in profiles]
@@ -0,0 +1,67 @@
+from time import time
+
+import pytest
+
+from twitter_guard.governor import EndpointLimit, RateGovernor
+from twitter_guard.instrumentation import endpoint_name
+from twitter_guard.retry import CircuitBreaker
+from twitter_guard.session import CustomSession
+
+BADGE_URL = "https://api.twitter.com/2/badge_count/badge_count.json"
+
+
+def half_open_ready(breaker):
+    # an open breaker whose recovery time has passed, so that the next allow() takes the probe slot
+    breaker.state = CircuitBreaker.Open
+    breaker.open_until = time() - 1
+
+
+def test_breaker_recovers_after_rate_limited_fail_fast(standin):
+    server = standin(rate_limit=0)
+    s = CustomSession(base_url=server.url, governor=RateGovernor())
+    endpoint = endpoint_name(BADGE_URL)
+    breaker = s.breakers.get(endpoint)
+    half_open_ready(breaker)
+    s.governor._limits[endpoint] = EndpointLimit(100, 0, time() + 600)
+
+    r = s.get(BADGE_URL)
+    assert r.status_code == 429
+    assert r.reason == "Rate Limited"
+    # the fail-fast did not take the probe slot
+    assert breaker.state == CircuitBreaker.Open
+
+    s.governor._limits[endpoint].reset = time() - 1
+    r = s.get(BADGE_URL)
+    assert r.status_code == 200
+    assert breaker.state == CircuitBreaker.Closed
+
+
+def test_breaker_releases_probe_on_unexpected_error(standin, monkeypatch):
+    server = standin(rate_limit=0)
+    s = CustomSession(base_url=server.url)
+    breaker = s.breakers.get(endpoint_name(BADGE_URL))
+    half_open_ready(breaker)
+
+    def broken(*args, **kwargs):
+        raise ValueError("not a RequestException")
+
+    monkeypatch.setattr(s, "_request_once", broken)
+    with pytest.raises(ValueError):
+        s.get(BADGE_URL)
+    assert breaker.state == CircuitBreaker.Open
+
+    monkeypatch.undo()
+    assert s.get(BADGE_URL).status_code == 200
+    assert breaker.state == CircuitBreaker.Closed
+
+
+def test_breaker_opens_again_when_probe_fails(standin):
+    server = standin(rate_limit=0, error_rate=1.0)
+    s = CustomSession(base_url=server.url)
+    s.retry_policy.max_attempts = 1
+    breaker = s.breakers.get(endpoint_name(BADGE_URL))
+    half_open_ready(breaker)
+
+    assert s.get(BADGE_URL).status_code >= 500
+    assert breaker.state == CircuitBreaker.Open
+    assert breaker.open_until > time()
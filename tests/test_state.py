@@ -0,0 +1,24 @@
+import gc
+import json
+import weakref
+
+from twitter_guard import state
+from twitter_guard.state import StateStore
+
+
+def test_exit_hook_flushes_without_keeping_stores_alive(tmp_path):
+    path = str(tmp_path / "state.json")
+    store = StateStore(path, min_interval=60)
+    store.set("cursor", "a")
+    # within min_interval of the first write, the change waits for its timer
+    store.set("cursor", "b")
+
+    state._flush_open_stores()
+    with open(path) as f:
+        assert json.load(f) == {"cursor": "b"}
+
+    store.close()
+    ref = weakref.ref(store)
+    del store
+    gc.collect()
+    assert ref() is None
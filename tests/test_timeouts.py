@@ -0,0 +1,26 @@
+from twitter_guard.timeouts import AdaptiveTimeouts
+
+
+def test_timeout_raises_a_cold_endpoint():
+    timeouts = AdaptiveTimeouts(overrides={"e": 2}, multiplier=2.0, max_read=60)
+    timeouts.observe_timeout("e", 2)
+    assert timeouts.timeout_for("e")[1] == 4
+    timeouts.observe_timeout("e", 4)
+    assert timeouts.timeout_for("e")[1] == 8
+
+
+def test_timeout_is_bounded_by_max_read():
+    timeouts = AdaptiveTimeouts(default_read=40, multiplier=2.0, max_read=60)
+    timeouts.observe_timeout("e", 40)
+    assert timeouts.timeout_for("e")[1] == 60
+
+
+def test_timeout_sample_is_not_multiplied_twice():
+    timeouts = AdaptiveTimeouts(min_samples=4, quantile=0.99, multiplier=2.0)
+    for _ in range(3):
+        timeouts.observe("e", 0.5)
+    timeouts.observe_timeout("e", 3)
+    assert max(timeouts._samples["e"]) == 3
+    # the next recompute bases the timeout on the raw sample
+    timeouts.observe("e", 0.5, refresh=True)
+    assert timeouts.timeout_for("e")[1] == 6
@@ -0,0 +1,35 @@
+from twitter_guard.verdicts import VerdictCache
+
+RULE = "(followers_count < 5) or (days < 180)"
+
+
+def profile(**changes):
+    fields = {"followers_count": 3, "following_count": 10, "tweet_count": 100, "days": 400, "favourites_count": 50, "media_count": 2}
+    fields.update(changes)
+    return fields
+
+
+def test_fingerprint_ignores_fields_the_rule_does_not_use(tmp_path):
+    cache = VerdictCache(str(tmp_path / "verdicts.db"), RULE)
+    assert cache.variables == {"followers_count", "days"}
+    base = cache.fingerprint(profile())
+    assert cache.fingerprint(profile(tweet_count=101, favourites_count=51)) == base
+    assert cache.fingerprint(profile(followers_count=4)) != base
+
+
+def test_unchanged_fields_hit_after_activity(tmp_path):
+    cache = VerdictCache(str(tmp_path / "verdicts.db"), RULE)
+    cache.put(1, cache.fingerprint(profile()), True)
+    assert cache.get(1, cache.fingerprint(profile(tweet_count=200))) is True
+    assert cache.hits == 1
+
+
+def test_memory_is_bounded(tmp_path):
+    cache = VerdictCache(str(tmp_path / "verdicts.db"), RULE, memory_size=3)
+    fp = cache.fingerprint(profile())
+    for user_id in range(5):
+        cache.put(user_id, fp, False)
+    assert list(cache._memory) == [2, 3, 4]
+    # an evicted verdict is still served from the database
+    assert cache.get(0, fp) is False
+    assert len(cache._memory) == 3
@@ -0,0 +1,46 @@
+from twitter_guard.watcher import NotificationWatcher
+
+
+class FakeBot:
+    def __init__(self, badges):
+        self.badges = list(badges)
+        self.checks = 0
+
+    def get_badge_count(self):
+        badge = self.badges.pop(0)
+        if badge is None:
+            return 429, None
+        return 200, {"ntab_unread_count": badge}
+
+    def check_notifications(self, block=True, update_remote_cursor=False):
+        self.checks += 1
+        return dict()
+
+
+def test_badge_failure_backs_off():
+    bot = FakeBot([0, None, None, 3])
+    watcher = NotificationWatcher(bot, min_interval=5, max_interval=120, backoff=2, full_check_interval=900)
+
+    # the first poll always checks
+    assert watcher.poll_once()
+    interval = watcher.interval
+    assert not watcher.poll_once()
+    assert watcher.interval == interval * 2
+    assert not watcher.poll_once()
+    assert watcher.interval == interval * 4
+    assert bot.checks == 1
+
+    # a working badge with new notifications snaps back to min_interval
+    assert watcher.poll_once()
+    assert watcher.interval == 5
+    assert bot.checks == 2
+
+
+def test_badge_failure_still_runs_the_overdue_check():
+    bot = FakeBot([1, None])
+    watcher = NotificationWatcher(bot, full_check_interval=0)
+    watcher.poll_once()
+    assert watcher.poll_once()
+    assert bot.checks == 2
+    # the last known badge is kept
+    assert watcher._last_badge == 1
@@ -22,11 +22,23 @@ import random
 import re
 import secrets
 import copy
+import threading
+from types import MappingProxyType
+from concurrent import futures
 
 from .selenium_bot import SeleniumTwitterBot
 from .utils import *
 from .rule_parser import rule_eval
 from .session import CustomSession as Session
+from .singleflight import single_flight
+from .endpoints import GRAPHQL_ENDPOINTS, STANDARD_GRAPHQL_FEATURES
+from .instrumentation import endpoint_name
+from .lists import JournaledList, SQLiteListStore
+from .governor import RateGovernor
+from .pipeline import JudgeActPipeline
+from .verdicts import VerdictCache
+from .eventlog import EventLog
+from .state import StateStore
 
 # from .reporter import ReportHandler
 from time import sleep
@@ -82,8 +94,11 @@ def urllib_post(url, headers=None, payload=None, session=None):
     cookie_string = make_cookie_string(session.cookies)
     headers["Cookie"] = cookie_string
 
+    # urlopen takes a single timeout, applied to the connection and to every read
+    timeout = max(session.timeouts.timeout_for(endpoint_name(url)))
+
     req = Request(url, headers=headers, method="POST", data=json.dumps(payload).encode("utf-8"))
-    with urlopen(req, timeout=10) as response:
+    with urlopen(req, timeout=timeout) as response:
         headers = response.headers
         status_code = response.status
         content = response.read()
@@ -115,9 +130,11 @@ def genct0():
     return s
 
 
-def oracle(user, filtering_rule):
-    default_rule = "(followers_count < 5) or (days < 180)"
-    rule_eval_vars = {
+def oracle_vars(user):
+    """
+    The profile fields a filtering rule can refer to.
+    """
+    return {
         "followers_count": user.followers_count,
         "following_count": user.following_count,
         "tweet_count": user.tweet_count,
@@ -126,6 +143,11 @@ def oracle(user, filtering_rule):
         "media_count": user.media_count,
     }
 
+
+def oracle(user, filtering_rule):
+    default_rule = "(followers_count < 5) or (days < 180)"
+    rule_eval_vars = oracle_vars(user)
+
     try:
         result = rule_eval(filtering_rule, rule_eval_vars)
     except:
@@ -287,11 +309,83 @@ class TwitterList:
     user: TwitterUserProfile = field(default=None)
 
 
+@dataclass
+class BulkResult:
+    Done = "done"
+    Skipped = "skipped"
+    Failed = "failed"
+    Unresolved = "unresolved"
+
+    status: str
+    status_code: int = field(default=None)
+
+
 class SessionType:
     Authenticated = "Authenticated"
     Guest = "Guest"
 
 
+class GuestSession:
+    """
+    A login-free session and its headers, with a guest token that is renewed every renew_after uses.
+
+    Thread-safe: the activation happens under a lock, and every caller gets its own copy of the headers.
+    """
+
+    def __init__(self, headers, renew_after=100):
+        """
+        Parameters:
+        headers (dict): the headers of a logged in session; the auth specific ones are removed.
+        renew_after (int): the number of uses after which a new guest token is activated.
+        """
+        self._base_headers = dict(headers)
+        self.renew_after = renew_after
+
+        self._lock = threading.Lock()
+        self._session = None
+        self._headers = None
+        self._count = 0
+
+    def _activate(self):
+        session = Session()
+
+        headers = dict(self._base_headers)
+        headers.pop("x-csrf-token", None)
+        headers.pop("x-twitter-auth-type", None)
+
+        r = session.post("https://api.twitter.com/1.1/guest/activate.json", data=b"", headers=headers)
+        if r.status_code == 200:
+            headers["x-guest-token"] = r.json()["guest_token"]
+
+        # the ct0 value is just a random 32-character string generated from random bytes at client side
+        session.cookies.set("ct0", genct0())
+        # set the headers accordingly
+        headers["x-csrf-token"] = session.cookies.get("ct0")
+
+        headers["Content-Type"] = "application/json"
+        headers["Host"] = "twitter.com"
+        return session, headers
+
+    def session_headers(self):
+        """
+        Returns:
+            Tuple: the guest session and a copy of its headers.
+        """
+        with self._lock:
+            if self._count == 0:
+                self._session, self._headers = self._activate()
+            self._count = (self._count + 1) % self.renew_after
+            return self._session, dict(self._headers)
+
+
+# the guest session shared by the login-free methods, created on first use
+_guest_session = None
+_guest_session_lock = threading.Lock()
+
+# the cookie-less session of cdn_tweet_detail, created on first use
+_cdn_session = None
+
+
 class TwitterLoginBot:
     def __init__(self, email, password, screenname, phonenumber=None, cookie_path=None):
         self._headers = {
@@ -637,11 +731,17 @@ class TwitterLoginBot:
 
 
 class TwitterBot:
-    tmp_count = 0
+    """
+    Thread-safety: the class level forms and headers are read-only templates, the per-account state (session, cursor, lists, config) lives in the instance, and the filtering rule is evaluated without shared state (see rule_eval).
+    Several instances can therefore run in one process, e.g. one per protected account, and judge users at the same time.
+    A single instance may be shared by worker threads for the lookups and block/mute/unblock calls; the block list and config writes are serialized by locks.
+    The notification methods (get_interactions_from_notifications, check_notifications) advance the cursor of the instance and must not run concurrently on the same instance.
+    The login-free methods share one GuestSession, which is safe to use from any thread.
+    """
 
-    badge_form = {"supports_ntab_urt": "1"}
+    badge_form = MappingProxyType({"supports_ntab_urt": "1"})
 
-    notification_all_form = {
+    notification_all_form = MappingProxyType({
         "include_profile_interstitial_type": "1",
         "include_blocking": "1",
         "include_blocked_by": "1",
@@ -673,62 +773,20 @@ class TwitterBot:
         "count": "40",
         # "cursor": "DAABDAABCgABAAAAABZfed0IAAIAAAABCAADYinMQAgABFMKJicACwACAAAAC0FZWlhveW1SNnNFCAADjyMIvwAA",
         "ext": "mediaStats,highlightedLabel,hasNftAvatar,voiceInfo,birdwatchPivot,enrichments,superFollowMetadata,unmentionInfo,editControl,vibe",
-    }
-
-    adaptive_search_form = copy.deepcopy(notification_all_form)
-    adaptive_search_form["tweet_search_mode"] = "live"
-    adaptive_search_form["query_source"] = "typed_query"
-    adaptive_search_form["include_ext_edit_control"] = "true"
-    adaptive_search_form["spelling_corrections"] = "1"
-    adaptive_search_form["pc"] = "1"
-
-    standard_graphql_features = {
-        "responsive_web_twitter_blue_verified_badge_is_enabled": True,
-        "responsive_web_graphql_exclude_directive_enabled": False,
-        "verified_phone_label_enabled": False,
-        "responsive_web_graphql_timeline_navigation_enabled": True,
-        "responsive_web_graphql_skip_user_profile_image_extensions_enabled": False,
-        "tweetypie_unmention_optimization_enabled": True,
-        "vibe_api_enabled": True,
-        "responsive_web_edit_tweet_api_enabled": True,
-        "graphql_is_translatable_rweb_tweet_is_translatable_enabled": True,
-        "view_counts_everywhere_api_enabled": True,
-        "longform_notetweets_consumption_enabled": True,
-        "tweet_awards_web_tipping_enabled": False,
-        "freedom_of_speech_not_reach_fetch_enabled": False,
-        "standardized_nudges_misinfo": True,
-        "tweet_with_visibility_results_prefer_gql_limited_actions_policy_enabled": False,
-        "interactive_text_enabled": True,
-        "responsive_web_text_conversations_enabled": False,
-        "longform_notetweets_richtext_consumption_enabled": False,
-        "responsive_web_enhance_cards_enabled": False,
-        "rweb_lists_timeline_redesign_enabled": True,
-        "creator_subscriptions_tweet_preview_api_enabled": True,
-        "responsive_web_twitter_article_tweet_consumption_enabled": True,
-        "longform_notetweets_inline_media_enabled": True,
-    }
+    })
+
+    adaptive_search_form = MappingProxyType(
+        {
+            **notification_all_form,
+            "tweet_search_mode": "live",
+            "query_source": "typed_query",
+            "include_ext_edit_control": "true",
+            "spelling_corrections": "1",
+            "pc": "1",
+        }
+    )
 
-    combined_lists_form = {
-        "variables": {"userId": "86539341", "count": 100},
-        "features": standard_graphql_features,
-    }
-
-    tweet_detail_form = {
-        "variables": {
-            "focalTweetId": "1645587845359468551",
-            # "cursor": "NAEAAPAOHBn2IYDA0a2avq3WLYLA0ZnX8tjWLYCA0dGl664SAOHU4cC4sdYtgMDRgdCXrCQA0LW-7a3WLYyA06nn59ItAPAb0tWD1K7WLYiA0LGuv9bXLYLA0LGpxNbXLYyAtsGA0r-0LYCAvumX5fzXWgBAreXRsUgAUNPZgrGsWgBR0Pm3xNEJANDhpoOg2C2EwNTty-LiLQBQ1IXzgq4bAODUvbrLx9cthsDT7diluhIAUdLl5JnZCQBBkdTmp7QAMd2r4qIAUNKRwN7TCQDwB9DpxPLT1i2EwNPdmJ_Z1y2AwNPR8MkkAPABgNOhj_781i2-gL3F3ZzZo2MAMaW5kJkAUdClkaP9kADwB_GfvKzWLYzA0-m5htPWLSUCEhUEAAA",
-            "referrer": "tweet",
-            "with_rux_injections": False,
-            "includePromotedContent": True,
-            "withCommunity": True,
-            "withQuickPromoteEligibilityTweetFields": True,
-            "withBirdwatchNotes": True,
-            "withDownvotePerspective": False,
-            "withVoice": True,
-            "withV2Timeline": True,
-        },
-        "features": standard_graphql_features,
-    }
+    standard_graphql_features = STANDARD_GRAPHQL_FEATURES
 
     create_tweet_form = {
         "variables": {
@@ -743,46 +801,7 @@ class TwitterBot:
             "withReactionsPerspective": False,
             "semantic_annotation_ids": [],
         },
-        "features": standard_graphql_features,
-    }
-
-    following_followers_form = {
-        "variables": {
-            "userId": None,
-            "count": 100,
-            "includePromotedContent": False,
-            "withSuperFollowsUserFields": True,
-            "withDownvotePerspective": False,
-            "withReactionsMetadata": False,
-            "withReactionsPerspective": False,
-            "withSuperFollowsTweetFields": True,
-        },
-        "features": standard_graphql_features,
-    }
-
-    tweet_replies_form = {
-        "variables": {
-            "userId": "1629601029678309376",
-            "count": 100,
-            # "cursor": "HCaAgICU9oDCqS0AAA==",
-            "includePromotedContent": True,
-            "withCommunity": True,
-            # "withSuperFollowsUserFields": True,
-            # "withDownvotePerspective": False,
-            # "withReactionsMetadata": False,
-            # "withReactionsPerspective": False,
-            # "withSuperFollowsTweetFields": True,
-            "withVoice": True,
-            "withV2Timeline": True,
-        },
-        "features": standard_graphql_features,
-        "fieldToggles": {"withArticleRichContentState": False},
-    }
-
-    blocklist_form = {
-        "variables": {"count": 20, "includePromotedContent": False, "withSafetyModeUserFields": False},
-        "features": standard_graphql_features,
-        "fieldToggles": {"withAuxiliaryUserLabels": False, "withArticleRichContentState": False},
+        "features": dict(STANDARD_GRAPHQL_FEATURES),
     }
 
     default_headers = {
@@ -810,7 +829,7 @@ class TwitterBot:
         "TE": "trailers",
     }
 
-    def __init__(self, cookie_path=None, config_path=None, white_list_path=None, block_list_path=None, backup_log_path=None):
+    def __init__(self, cookie_path=None, config_path=None, white_list_path=None, block_list_path=None, backup_log_path=None, cassette=None, base_url=None, session=None, list_db_path=None, verdict_cache_path=None, state_path=None):
         """
         In order to save the list of newly blocked accounts, the block_list_path should be specified, even if you have not created that file.
 
@@ -818,12 +837,26 @@ class TwitterBot:
         cookie_path (str): the path of a python pickle file or a Netscape HTTP Cookie File in txt format of the requests session cookie. (mandatory)
         config_path (str): the path of the config file which contains login info and the filter setting. (optional)
         white_list_path (str): the path of the white list yaml file. (optional)
-        block_list_path (str): the path of the black list yaml file. (optional) when not provided, the blocked id will not be saved.
-        backup_log_path (str): the path to the notification log file. (optional) when not provided, the parsed interactions from notifications will not be saved.
+        block_list_path (str): the path of the black list yaml file. (optional) when not provided, the blocked id will not be saved. Changes are journaled to block_list_path.journal and compacted into the yaml file from time to time.
+        backup_log_path (str): the path to the notification log. (optional) when not provided, the parsed interactions from notifications will not be saved. A .yaml or .yml path, or any other existing file, is appended to as a single yaml file; any other path is the directory of an EventLog (json lines segments rotated daily).
+        cassette (Cassette): records or replays the traffic of the logged in session. (optional) use session.use_cassette to also cover guest sessions.
+        base_url (str): replaces the twitter hosts of the logged in session, e.g. to point at a local standin_server. (optional) use session.use_base_url to also cover guest sessions.
+        session (CustomSession): the session of the account, e.g. one sharing timeouts and pools with other accounts. (optional) cassette and base_url are ignored when it is given.
+        list_db_path (str): keep the block, white and mute lists in this SQLite database instead of yaml files. (optional) the yaml lists given by white_list_path and block_list_path are imported when the database lists are empty.
+        state_path (str): the json file keeping the notification cursor and other runtime state. (optional) defaults to <config name>_state.json next to the config file; without a config file the state is not saved. A latest_cursor of the config file is migrated on first use.
+        verdict_cache_path (str): remember the verdicts of the filtering rule in this SQLite database, so that repeat interactors are not judged again. (optional)
         """
         self._headers = copy.deepcopy(TwitterBot.default_headers)
 
-        self._session = Session()
+        self._session = session if session is not None else Session(cassette=cassette, base_url=base_url, governor=RateGovernor())
+
+        # guards the config file and the cursor; the lists have their own locks
+        self._lock = threading.RLock()
+        # the top cursor of the notifications; None fetches the latest ones
+        self._notification_cursor = None
+        # the judge and block threads, see judge_users
+        self._pipeline = None
+        self._pipeline_lock = threading.Lock()
 
         self._cookie_path = cookie_path
 
@@ -833,24 +866,57 @@ class TwitterBot:
         else:
             self._config_dict = dict()
 
-        if block_list_path is not None:
-            self._block_list_path = block_list_path
-            self._block_list = load_yaml(self._block_list_path)
+        if list_db_path is not None:
+            self._list_store = SQLiteListStore(list_db_path)
+            self._block_list = self._list_store.list("block")
+            self._white_list = self._list_store.list("white")
+            self._mute_list = self._list_store.list("mute")
+            for name, path in [("block", block_list_path), ("white", white_list_path)]:
+                if path is not None and os.path.exists(path) and len(self._list_store.list(name)) == 0:
+                    count = self._list_store.import_yaml(name, path)
+                    logger.info(f"imported {count} entries of {path} into the {name} list")
         else:
-            self._block_list = dict()
+            if block_list_path is not None:
+                self._block_list_path = block_list_path
+                self._block_list = JournaledList(self._block_list_path)
+            else:
+                self._block_list = dict()
 
-        if white_list_path is not None:
-            self._white_list_path = white_list_path
-            self._white_list = load_yaml(self._white_list_path)
-        else:
-            self._white_list = dict()
+            if white_list_path is not None:
+                self._white_list_path = white_list_path
+                self._white_list = load_yaml(self._white_list_path)
+            else:
+                self._white_list = dict()
+
+            self._mute_list = dict()
 
         if "filtering_rule" in self._config_dict:
             self._filtering_rule = self._config_dict["filtering_rule"]
         else:
             self._filtering_rule = "(followers_count < 5) or (days < 180)"
 
+        # verdicts of another filtering rule are dropped when the cache is opened
+        self._verdict_cache = VerdictCache(verdict_cache_path, self._filtering_rule) if verdict_cache_path is not None else None
+
         self._backup_log_path = backup_log_path
+        if backup_log_path is None or backup_log_path.endswith((".yaml", ".yml")):
+            self._event_log = None
+        elif os.path.isfile(backup_log_path):
+            # e.g. a backup log of an older version with another extension
+            logger.warning(f"{backup_log_path} is a file, appending to it as a yaml backup log; pass a directory to use an event log")
+            self._event_log = None
+        else:
+            self._event_log = EventLog(backup_log_path)
+
+        # runtime state lives in its own file, so that the config (and its credentials) is never rewritten by the polls
+        if state_path is None and config_path is not None:
+            state_path = os.path.splitext(config_path)[0] + "_state.json"
+        self._state = StateStore(state_path)
+        if "latest_cursor" not in self._state:
+            self._migrate_state()
+
+        # the sort index of the top cursor, i.e. how far the notifications were processed
+        self.latest_sortindex = self._state.get("latest_sortindex")
 
         try:
             self._load_cookies()
@@ -865,7 +931,7 @@ class TwitterBot:
         # display_session_cookies(self._session)
 
         # when disabled, will use the default cursor
-        if "latest_cursor" in self._config_dict:
+        if self._state.get("latest_cursor"):
             self._load_cursor()
 
         self._select_search_method()
@@ -949,24 +1015,37 @@ class TwitterBot:
     def get_badge_count(self):
         # display_session_cookies(self._session)
         url = "https://api.twitter.com/2/badge_count/badge_count.json"
-        badge_form = TwitterBot.badge_form
-        r = self._session.get(url, headers=self._headers, params=badge_form)
+        r = self._session.get(url, headers=self._headers, params=TwitterBot.badge_form)
         result = None
         if r.status_code == 200:
             result = r.json()
         return r.status_code, result
 
     def update_local_cursor(self, val):
-        TwitterBot.notification_all_form["cursor"] = val
-        self._config_dict["latest_cursor"] = val
-
-        if hasattr(self, "_config_path") and self._config_path is not None:
-            save_yaml(self._config_dict, self._config_path, "w")
+        with self._lock:
+            self._notification_cursor = val
+            # coalesced by the state store, at most one write per interval
+            self._state.set("latest_cursor", val)
 
     def _load_cursor(self):
-        if len(self._config_dict["latest_cursor"].strip()) > 0:
-            TwitterBot.notification_all_form["cursor"] = self._config_dict["latest_cursor"]
-        logger.info(f"after loading cursor:{TwitterBot.notification_all_form['cursor']}")
+        if len(self._state.get("latest_cursor").strip()) > 0:
+            self._notification_cursor = self._state.get("latest_cursor")
+        logger.info(f"after loading cursor:{self._notification_cursor}")
+
+    def _migrate_state(self):
+        """
+        Take over the cursor that older versions kept in the config file.
+        """
+        latest_cursor = self._config_dict.get("latest_cursor")
+        if latest_cursor:
+            self._state.update(latest_cursor=latest_cursor, latest_sortindex=self._config_dict.get("latest_sortindex"))
+            logger.info(f"migrated latest_cursor from the config file to {self._state.path}")
+
+    def _notification_form(self, cursor=None):
+        form = dict(TwitterBot.notification_all_form)
+        if cursor is not None:
+            form["cursor"] = cursor
+        return form
 
     def _update_remote_cursor(self, val):
         url = "https://api.twitter.com/2/notifications/all/last_seen_cursor.json"
@@ -985,9 +1064,13 @@ class TwitterBot:
         The badge will disappear after you refresh in a non-notification page
         """
 
-        self._update_remote_cursor(TwitterBot.notification_all_form["cursor"])
+        self._update_remote_cursor(self._notification_cursor)
 
     def block_user(self, user_id):
+        """
+        Returns:
+        int: the status code of the block request.
+        """
         user_id = self.numerical_id(user_id)
 
         url = "https://api.twitter.com/1.1/blocks/create.json"
@@ -997,10 +1080,9 @@ class TwitterBot:
         if r.status_code == 200:
             logger.info(f"block {user_id}: successfully sent block post!")
             response = r.json()
-                # update the block list
-            if hasattr(self, "_block_list_path"):
-                self._block_list[user_id] = response["screen_name"]
-                save_yaml(self._block_list, self._block_list_path, "w")
+            # update the block list; only the change is appended to the journal
+            self._block_list[user_id] = response["screen_name"]
+        return r.status_code
 
     def unblock_user(self, user_id):
         user_id = self.numerical_id(user_id)
@@ -1011,8 +1093,13 @@ class TwitterBot:
 
         if r.status_code == 200:
             logger.info(f"unbock {user_id}: successfully sent unblock post!")
+            self._block_list.pop(user_id, None)
 
     def mute_user(self, user_id):
+        """
+        Returns:
+        int: the status code of the mute request.
+        """
         user_id = self.numerical_id(user_id)
 
         url = "https://api.twitter.com/1.1/mutes/users/create.json"
@@ -1021,6 +1108,8 @@ class TwitterBot:
 
         if r.status_code == 200:
             logger.info(f"mute {user_id}: successfully sent mute post!")
+            self._mute_list[user_id] = r.json().get("screen_name")
+        return r.status_code
 
     def unmute_user(self, user_id):
         user_id = self.numerical_id(user_id)
@@ -1031,11 +1120,15 @@ class TwitterBot:
 
         if r.status_code == 200:
             logger.info(f"unmute {user_id}: successfully sent unmute post!")
+            self._mute_list.pop(user_id, None)
 
     def remove_follower(self, user_id):
         """
         Removes specific follower.
         The query will be successful even if the user is not following you.
+
+        Returns:
+        int: the status code of the request.
         """
         user_id = self.numerical_id(user_id)
         url = "https://twitter.com/i/api/graphql/QpNfg0kpPRfjROQ_9eOLXA/RemoveFollower"
@@ -1049,48 +1142,179 @@ class TwitterBot:
 
         if r.status_code == 200:
             logger.info(f"remove follower {user_id}: successfully removed!")
+        return r.status_code
 
-    def judge_users(self, users, block=False):
+    def _bulk_action(self, action, endpoint, users, done_list=None, max_workers=8):
         """
-        Examine users coming from the notifications one by one.
-        Block bad users. Update the local block list.
+        Run a single-user action for many users with bounded concurrency.
+
+        Parameters:
+        action (callable): takes a numerical user id and returns the status code.
+        endpoint (str): the endpoint name of the action, used to wait for its rate limit window.
+        users (iterable): user ids, screen names or TwitterUserProfile objects.
+        done_list (MutableMapping): users in this list are skipped. (optional)
+        max_workers (int): the maximum number of requests in flight.
+
+        Returns:
+        dict: the BulkResult of every user, keyed by numerical user id (or by the input when it cannot be resolved).
+        """
+        report = dict()
+        pending = []
+        for user in users:
+            if isinstance(user, TwitterUserProfile):
+                user_id = user.user_id
+                # the profile was fetched by this account, so blocked reflects its view
+                if user.blocked and done_list is self._block_list:
+                    self._block_list[user_id] = user.screen_name
+                    report[user_id] = BulkResult(BulkResult.Skipped)
+                    continue
+            else:
+                try:
+                    user_id = self.numerical_id(user)
+                except Exception:
+                    report[user] = BulkResult(BulkResult.Unresolved)
+                    continue
+            if user_id in report:
+                continue
+            if done_list is not None and user_id in done_list:
+                report[user_id] = BulkResult(BulkResult.Skipped)
+                continue
+            report[user_id] = None
+            pending.append(user_id)
+
+        governor = self._session.governor
+        in_flight = threading.BoundedSemaphore(max_workers)
+
+        def run(user_id):
+            try:
+                status_code = action(user_id)
+                report[user_id] = BulkResult(BulkResult.Done if status_code == 200 else BulkResult.Failed, status_code)
+            except Exception as e:
+                logger.warning(f"{endpoint} {user_id}: {e!r}")
+                report[user_id] = BulkResult(BulkResult.Failed)
+            finally:
+                in_flight.release()
+
+        with futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for user_id in pending:
+                in_flight.acquire()
+                if governor is not None:
+                    # wait here instead of letting every worker fail fast on a used up window
+                    wait = governor.wait_time(endpoint)
+                    if wait > 0:
+                        logger.info(f"{endpoint}: rate limit used up, bulk action paused for {wait:.0f}s")
+                        sleep(wait)
+                executor.submit(run, user_id)
+
+        done = sum(1 for result in report.values() if result.status == BulkResult.Done)
+        logger.info(f"{endpoint}: {done} of {len(report)} users done")
+        return report
+
+    def block_users(self, users, max_workers=8, skip_listed=True):
+        """
+        Block many users. Users in the local block list, and profiles that are already blocked, are skipped.
+
+        Parameters:
+        users (iterable): user ids, screen names or TwitterUserProfile objects.
+        max_workers (int): the maximum number of block requests in flight.
+        skip_listed (bool): skip the users in the local block list. Disable it to re-send blocks the account does not have.
+
+        Returns:
+        dict: the BulkResult of every user.
         """
+        done_list = self._block_list if skip_listed else None
+        return self._bulk_action(self.block_user, "/1.1/blocks/create.json", users, done_list=done_list, max_workers=max_workers)
 
-        # ignore user already in block_list or white_list
-        sorted_users = {user_id: users[user_id] for user_id in users if (user_id not in self._block_list) and (user_id not in self._white_list)}
-        users_judgements = dict()
+    def mute_users(self, users, max_workers=8):
+        """
+        Mute many users. Users in the local mute list are skipped.
+
+        Returns:
+        dict: the BulkResult of every user.
+        """
+        return self._bulk_action(self.mute_user, "/1.1/mutes/users/create.json", users, done_list=self._mute_list, max_workers=max_workers)
 
-        for user_id in sorted_users:
-            user = sorted_users[user_id]
+    def remove_followers(self, users, max_workers=8):
+        """
+        Remove many followers.
 
-            is_bad = oracle(user, self._filtering_rule)
+        Returns:
+        dict: the BulkResult of every user.
+        """
+        return self._bulk_action(self.remove_follower, "RemoveFollower", users, max_workers=max_workers)
+
+    def _judge_user(self, user_id, user):
+        cache = self._verdict_cache
+        if cache is not None:
+            user_fingerprint = cache.fingerprint(oracle_vars(user))
+            is_bad = cache.get(user_id, user_fingerprint)
+            if is_bad is not None:
+                logger.debug(f"cached verdict for {user_id}: {'bad' if is_bad else 'good'}")
+                return is_bad
+        is_bad = oracle(user, self._filtering_rule)
+        if cache is not None:
+            cache.put(user_id, user_fingerprint, is_bad)
+        conclusion_str = "bad" if is_bad else "good"
+        logger.info(
+            f"ORACLE TIME!: id {user.user_id:<25} name {user.screen_name:<16} followers_count {user.followers_count:<10} days_since_reg {user.days_since_registration:<5} is {conclusion_str}"
+        )
+        return is_bad
 
-            conclusion_str = "bad" if is_bad else "good"
+    def _skip_user(self, user_id):
+        # ignore user already in block_list or white_list
+        return (user_id in self._block_list) or (user_id in self._white_list)
+
+    def _judge_pipeline(self, max_workers):
+        # one pipeline per bot, started by the first call; its workers keep their connections between calls
+        with self._pipeline_lock:
+            if self._pipeline is None:
+                # block_user records the user in the block list
+                self._pipeline = JudgeActPipeline(
+                    self._judge_user,
+                    act=self.block_user,
+                    skip=self._skip_user,
+                    act_workers=max_workers,
+                    governor=self._session.governor,
+                    endpoint="/1.1/blocks/create.json",
+                )
+            return self._pipeline
 
-            if is_bad and block:
-                self.block_user(user_id)
+    def judge_users(self, users, block=False, max_workers=8):
+        """
+        Examine users coming from the notifications.
+        Block bad users. Update the local block list.
 
-                self._block_list[user.user_id] = user.screen_name
-                save_yaml(self._block_list, self._block_list_path, "w")
+        The blocks are sent by max_workers threads while the judging goes on, see JudgeActPipeline.
+        The threads are started by the first call and serve every later one, so only the first max_workers counts.
 
-            logger.info(
-                f"ORACLE TIME!: id {user.user_id:<25} name {user.screen_name:<16} followers_count {user.followers_count:<10} days_since_reg {user.days_since_registration:<5} is {conclusion_str}"
-            )
-            users_judgements[user_id] = conclusion_str
-        return users_judgements
+        Returns:
+        dict: the judgement ("good" or "bad") of every user that is not in the block or white list.
+        """
 
-    def get_interactions_from_notifications(self, update_remote_cursor=False):
+        return self._judge_pipeline(max_workers).run(users, act=block).judgements
+
+    def _fetch_notifications(self, cursor=None):
         url = "https://api.twitter.com/2/notifications/all.json"
-        notification_all_form = TwitterBot.notification_all_form
-        r = self._session.get(url, headers=self._headers, params=notification_all_form)
+        r = self._session.get(url, headers=self._headers, params=self._notification_form(cursor))
 
         logger.info("notifications/all.json")
-        logger.debug(f"status_code: {r.status_code}, length: {r.headers['content-length']}")
+        logger.debug(f"status_code: {r.status_code}, length: {r.headers.get('content-length')}")
 
+        if r.status_code != 200:
+            # e.g. a 429 of a used up rate limit or an open circuit; the cursor stays where it is
+            logger.warning(f"notifications/all.json: {r.status_code} {r.reason}")
+            return None
         result = r.json()
         logger.debug(f"{result}")
-        result = TwitterJSON(result)
+        return TwitterJSON(result)
 
+    def _parse_notifications(self, result):
+        """
+        Extract the interacting users of one page of notifications/all.json.
+
+        Returns:
+        Tuple: the interacting users keyed by entry id, the (sortIndex, value) of the cursors keyed by cursor type, and the sort indexes of the non-cursor entries.
+        """
         logger.debug(f"result keys: {result.keys()}")
 
         convo = set()
@@ -1214,52 +1438,190 @@ class TwitterBot:
         )
         print("number of convos", len(convo))
         """
+        cursors = dict()
         for entry in cursor_entries:
             cursor = entry.content.operation.cursor
             logger.debug(f"cursors: {entry.sortIndex} {cursor}")
-            if cursor.cursorType == "Top":
-                self.latest_sortindex = entry.sortIndex
+            cursors[cursor.cursorType] = (entry.sortIndex, cursor.value)
+        sort_indexes = [int(x.sortIndex) for x in non_cursor_entries]
+        return interacting_users, cursors, sort_indexes
+
+    def _update_top_cursor(self, cursors, update_remote_cursor=False):
+        if "Top" not in cursors:
+            return
+        sort_index, value = cursors["Top"]
+        with self._lock:
+            self.latest_sortindex = sort_index
+            self._notification_cursor = value
+            # saved together with the cursor, so that a restart knows how far the notifications were processed
+            self._state.update(latest_cursor=value, latest_sortindex=sort_index)
+        if update_remote_cursor:
+            self.update_remote_latest_cursor()  # will cause the badge to disappear
+
+    def _poll_notifications(self, update_remote_cursor=False, advance=True):
+        """
+        Parameters:
+        advance (bool): move the top cursor to the fetched page right away; otherwise the caller does it with _update_top_cursor.
+        """
+        result = self._fetch_notifications(self._notification_cursor)
+        if result is None:
+            return dict(), dict(), []
+        interacting_users, cursors, sort_indexes = self._parse_notifications(result)
+        if advance:
+            self._update_top_cursor(cursors, update_remote_cursor=update_remote_cursor)
+        return interacting_users, cursors, sort_indexes
 
-                self.update_local_cursor(cursor.value)
-                if update_remote_cursor:
-                    self.update_remote_latest_cursor()  # will cause the badge to disappear
-        return interacting_users
+    def get_interactions_from_notifications(self, update_remote_cursor=False):
+        return self._poll_notifications(update_remote_cursor=update_remote_cursor)[0]
+
+    def _backup_interactions(self, interacting_users):
+        if self._backup_log_path is None:
+            return
+        if self._event_log is not None:
+            events = []
+            for x in interacting_users.values():
+                user_dict = dtc_asdict(x["user"])
+                events.append(
+                    {
+                        "time": int(x["sort_index"]),
+                        "event_type": x["event_type"],
+                        "user": {key: value for (key, value) in user_dict.items() if value is not None},
+                    }
+                )
+            self._event_log.append(events)
+            return
+
+        backup_events = dict()
+        for entry_id in interacting_users:
+            # print(interacting_users[entry_id])
+            event_time = (
+                datetime.utcfromtimestamp(int(interacting_users[entry_id]["sort_index"]) // 1000).replace(tzinfo=timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+            )
+            user_dict = dtc_asdict(interacting_users[entry_id]["user"])
+            if event_time not in backup_events:
+                backup_events[event_time] = []
+            backup_events[event_time].append(
+                {
+                    "user": {key: value for (key, value) in user_dict.items() if value is not None},
+                    "event_type": interacting_users[entry_id]["event_type"],
+                }
+            )
+        if len(backup_events) > 0:
+            save_yaml(backup_events, self._backup_log_path, "a")
 
-    def check_notifications(self, block=True, update_remote_cursor=False):
+    def check_notifications(self, block=True, update_remote_cursor=False, catch_up=True):
         """
         Gets the recent notifications from the endpoint.
 
         Whenever there is new notification, or you perform operations like block/unblock, mute/unmute, you will get new stuff here.
 
         Updates latest_cursor using the top cursor fetched. After the update, if no new thing happens, then you will not get anything here.
+        When a catch-up is needed, the cursor is only updated once it reached the last processed notification, so that a catch-up cut short (e.g. throttled) is repeated by the next check.
 
         Block bad users.
 
+        Parameters:
+        catch_up (bool): when the page is full and older than the last processed notification, page backward until it is reached, see catch_up_notifications.
+
+        Returns:
+        dict: the judgement ("good" or "bad") of every new interacting user that is not in the block or white list.
         """
-        interacting_users = self.get_interactions_from_notifications(update_remote_cursor=update_remote_cursor)
+        previous_sortindex = self.latest_sortindex
+        interacting_users, cursors, sort_indexes = self._poll_notifications(advance=False)
 
         users_judgements = self.judge_users(
             {interacting_users[entry_id]["user_id"]: interacting_users[entry_id]["user"] for entry_id in interacting_users}, block=block
         )
+        self._backup_interactions(interacting_users)
+
+        # a full page that does not reach back to the last processed notification means some were missed (downtime or a burst)
+        page_size = int(TwitterBot.notification_all_form["count"])
+        if catch_up and previous_sortindex is not None and len(sort_indexes) >= page_size and min(sort_indexes) > int(previous_sortindex) and "Bottom" in cursors:
+            logger.info(f"notifications missed since sort index {previous_sortindex}, catching up")
+            caught_up, complete = self._catch_up(cursors["Bottom"][1], int(previous_sortindex), block=block, skip=users_judgements)
+            users_judgements.update(caught_up)
+            if not complete:
+                logger.warning(f"catch-up incomplete, the cursor stays at sort index {previous_sortindex}")
+                return users_judgements
+
+        self._update_top_cursor(cursors, update_remote_cursor=update_remote_cursor)
+        return users_judgements
 
-        backup_events = dict()
-        if self._backup_log_path is not None:
-            for entry_id in interacting_users:
-                # print(interacting_users[entry_id])
-                event_time = (
-                    datetime.utcfromtimestamp(int(interacting_users[entry_id]["sort_index"]) // 1000).replace(tzinfo=timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
-                )
-                user_dict = dtc_asdict(interacting_users[entry_id]["user"])
-                if event_time not in backup_events:
-                    backup_events[event_time] = []
-                backup_events[event_time].append(
-                    {
-                        "user": {key: value for (key, value) in user_dict.items() if value is not None},
-                        "event_type": interacting_users[entry_id]["event_type"],
-                    }
-                )
-            if len(backup_events) > 0:
-                save_yaml(backup_events, self._backup_log_path, "a")
+    def catch_up_notifications(self, since_sortindex=None, block=True, max_pages=25, batch_size=100, max_workers=8):
+        """
+        Judge the interactions newer than since_sortindex, following the Bottom cursor back from the newest notification.
+
+        The next page is fetched while the current one is judged, and the users are judged in batches of batch_size.
+
+        Parameters:
+        since_sortindex (int): the sort index of the last processed notification. (optional) defaults to the one saved with the cursor.
+        max_pages (int): the maximum number of pages fetched.
+
+        Returns:
+        dict: the judgement ("good" or "bad") of every interacting user that is not in the block or white list.
+        """
+        if since_sortindex is None:
+            since_sortindex = self.latest_sortindex
+        if since_sortindex is None:
+            raise ValueError("no sort index to catch up to")
+        return self._catch_up(None, int(since_sortindex), block=block, max_pages=max_pages, batch_size=batch_size, max_workers=max_workers)[0]
+
+    def _catch_up(self, cursor, stop_sortindex, block=True, max_pages=25, batch_size=100, max_workers=8, skip=None):
+        """
+        Page backward from cursor (None for the newest page) until an entry at or below stop_sortindex shows up.
+        When cursor is None, the top cursor is moved to the newest page once the paging is complete.
+
+        Returns:
+        Tuple: the judgements, and whether the paging is complete: stop_sortindex or the end of the notifications was reached, or max_pages were fetched. A failed page leaves it incomplete.
+        """
+        users_judgements = dict()
+        batch = dict()
+        pages = 0
+        reached = False
+        failed = False
+        top_cursors = None
+        with futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="notification-prefetch") as prefetcher:
+            pending = prefetcher.submit(self._fetch_notifications, cursor)
+            while pending is not None:
+                result = pending.result()
+                if result is None:
+                    failed = True
+                    break
+                pages += 1
+                interacting_users, cursors, sort_indexes = self._parse_notifications(result)
+                if cursor is None and pages == 1:
+                    top_cursors = cursors
+
+                pending = None
+                bottom = cursors.get("Bottom")
+                # an empty page or a repeated cursor is the end of the notifications
+                reached = not sort_indexes or min(sort_indexes) <= stop_sortindex or bottom is None or bottom[1] == cursor
+                if not reached and pages < max_pages:
+                    cursor = bottom[1]
+                    # prefetch the next page while this one is judged
+                    pending = prefetcher.submit(self._fetch_notifications, cursor)
+
+                new_interactions = {entry_id: x for entry_id, x in interacting_users.items() if int(x["sort_index"]) > stop_sortindex}
+                self._backup_interactions(new_interactions)
+                for x in new_interactions.values():
+                    if x["user_id"] not in users_judgements and (skip is None or x["user_id"] not in skip):
+                        batch[x["user_id"]] = x["user"]
+
+                if len(batch) >= batch_size or (pending is None and batch):
+                    users_judgements.update(self.judge_users(batch, block=block, max_workers=max_workers))
+                    batch = dict()
+
+        if batch:
+            # the users of the pages before a failed one
+            users_judgements.update(self.judge_users(batch, block=block, max_workers=max_workers))
+        if failed:
+            logger.warning(f"catch-up failed after {pages} pages before reaching sort index {stop_sortindex}")
+        elif not reached:
+            logger.warning(f"catch-up gave up after {pages} pages before reaching sort index {stop_sortindex}, older notifications are skipped")
+        if top_cursors is not None and not failed:
+            self._update_top_cursor(top_cursors)
+        logger.info(f"catch-up: {pages} pages, {len(users_judgements)} users judged")
+        return users_judgements, not failed
 
     @staticmethod
     def _cursor_from_entries(entries):
@@ -1492,16 +1854,27 @@ class TwitterBot:
         return headers
 
     @staticmethod
-    def _navigate_graphql_entries(session_type, url, form, session=None, headers=None):
+    def _navigate_graphql_entries(session_type, endpoint, variables, session=None, headers=None, strict=False):
+        """
+        Yields the entries of every page of a paginated GraphQL endpoint.
+
+        Parameters:
+        session_type (SessionType): whether the given session is used, or a guest session.
+        endpoint (GraphQLEndpoint): the endpoint from GRAPHQL_ENDPOINTS.
+        variables (dict): the variables of the first page; the cursor is updated in place for the following pages.
+        strict (bool): raise requests.exceptions.HTTPError when a page fails (e.g. throttled), instead of ending the paging as if the list was complete.
+        """
         while True:
-            encoded_params = urlencode({k: json.dumps(form[k], separators=(",", ":")) for k in form})
+            encoded_params = endpoint.encode(variables)
             # generate session and header for guest mode
             if session_type != SessionType.Authenticated:
                 session, headers = TwitterBot.tmp_session_headers()
-            r = session.get(url, headers=headers, params=encoded_params)
+            r = session.get(endpoint.url, headers=headers, params=encoded_params)
             if r.status_code != 200:
-                logger.debug(f"{r.request.url}")
+                logger.debug(f"{r.url}")
                 logger.debug(f"{headers}")
+                if strict:
+                    raise requests.exceptions.HTTPError(f"{endpoint.name}: {r.status_code}, paging stopped at cursor {variables.get('cursor')}", response=r)
                 break
 
             response = r.json()
@@ -1509,6 +1882,8 @@ class TwitterBot:
 
             data = response.data
             if len(data) == 0:
+                if strict and response.errors:
+                    raise requests.exceptions.HTTPError(f"{endpoint.name}: {response.errors[0].message}, paging stopped at cursor {variables.get('cursor')}", response=r)
                 return
 
             if data.retweeters_timeline:
@@ -1546,7 +1921,7 @@ class TwitterBot:
             # could happen when nagivating tweet threads
             if not bottom_cursor:
                 break
-            form["variables"]["cursor"] = bottom_cursor
+            variables["cursor"] = bottom_cursor
 
     #@staticmethod
     def get_user_lists(self, user_id):
@@ -1555,17 +1930,14 @@ class TwitterBot:
         """
         user_id = self.numerical_id(user_id)
 
-        url = "https://twitter.com/i/api/graphql/rIxum3avpCu7APi7mxTNjw/CombinedLists"
+        endpoint = GRAPHQL_ENDPOINTS["CombinedLists"]
         # tmp_session, tmp_headers = TwitterBot.tmp_session_headers()
         headers = self._json_headers()
 
-        form = copy.deepcopy(TwitterBot.combined_lists_form)
-        form["variables"]["userId"] = str(user_id)
-        form["features"]["blue_business_profile_image_shape_enabled"] = True
-        form["features"]["longform_notetweets_rich_text_read_enabled"] = True
+        variables = endpoint.variables(userId=str(user_id))
 
-        #for entries in TwitterBot._navigate_graphql_entries(SessionType.Guest, url, form):
-        for entries in self._navigate_graphql_entries(SessionType.Authenticated, url, form, session=self._session, headers=headers):
+        #for entries in TwitterBot._navigate_graphql_entries(SessionType.Guest, endpoint, variables):
+        for entries in self._navigate_graphql_entries(SessionType.Authenticated, endpoint, variables, session=self._session, headers=headers):
             yield from TwitterBot._text_from_entries(entries, user_id=user_id)
 
     # @staticmethod
@@ -1577,22 +1949,15 @@ class TwitterBot:
         user_id = self.numerical_id(user_id)
 
         headers = self._json_headers()
-        url = "https://twitter.com/i/api/graphql/ahLGvWSvDCr-57-E8GXGCQ/UserTweetsAndReplies"
+        endpoint = GRAPHQL_ENDPOINTS["UserTweetsAndReplies"]
 
         # tmp_session, tmp_headers = TwitterBot.tmp_session_headers()
 
-        form = copy.deepcopy(TwitterBot.tweet_replies_form)
+        variables = endpoint.variables(userId=str(user_id), count=batch_count)
 
-        form["variables"]["userId"] = str(user_id)
-        form["variables"]["count"] = batch_count
-        form["features"]["responsive_web_graphql_exclude_directive_enabled"] = True
-        form["features"]["responsive_web_twitter_article_tweet_consumption_enabled"] = False
-        form["features"]["tweet_with_visibility_results_prefer_gql_limited_actions_policy_enabled"] = True
-        form["features"]["longform_notetweets_rich_text_read_enabled"] = True
-
-        # for entries in TwitterBot._navigate_graphql_entries(SessionType.Guest, url, form):
+        # for entries in TwitterBot._navigate_graphql_entries(SessionType.Guest, endpoint, variables):
         #    yield from TwitterBot._text_from_entries(entries, user_id = user_id)
-        for entries in self._navigate_graphql_entries(SessionType.Authenticated, url, form, session=self._session, headers=headers):
+        for entries in self._navigate_graphql_entries(SessionType.Authenticated, endpoint, variables, session=self._session, headers=headers):
             yield from self._text_from_entries(entries, user_id=user_id)
 
     def get_following(self, user_id, batch_count=100):
@@ -1611,15 +1976,10 @@ class TwitterBot:
 
         headers = self._json_headers()
 
-        url = "https://twitter.com/i/api/graphql/AmvGuDw_fxEbJtEXie4OkA/Following"
-
-        form = copy.deepcopy(TwitterBot.following_followers_form)
-
-        # set userID in form
-        form["variables"]["userId"] = str(user_id)
-        form["variables"]["count"] = batch_count
+        endpoint = GRAPHQL_ENDPOINTS["Following"]
+        variables = endpoint.variables(userId=str(user_id), count=batch_count)
 
-        for entries in self._navigate_graphql_entries(SessionType.Authenticated, url, form, session=self._session, headers=headers):
+        for entries in self._navigate_graphql_entries(SessionType.Authenticated, endpoint, variables, session=self._session, headers=headers):
             yield from self._users_from_entries(entries)
 
     def get_followers(self, user_id, batch_count=100):
@@ -1638,15 +1998,10 @@ class TwitterBot:
 
         headers = self._json_headers()
 
-        url = "https://twitter.com/i/api/graphql/utPIvA97eaEvxfra_PQz_A/Followers"
+        endpoint = GRAPHQL_ENDPOINTS["Followers"]
+        variables = endpoint.variables(userId=str(user_id), count=batch_count)
 
-        form = copy.deepcopy(TwitterBot.following_followers_form)
-        form["variables"]["count"] = batch_count
-
-        # set userID in form
-        form["variables"]["userId"] = str(user_id)
-
-        for entries in self._navigate_graphql_entries(SessionType.Authenticated, url, form, session=self._session, headers=headers):
+        for entries in self._navigate_graphql_entries(SessionType.Authenticated, endpoint, variables, session=self._session, headers=headers):
             yield from self._users_from_entries(entries)
 
     def get_user_likes(self, user_id, batch_count=100):
@@ -1662,20 +2017,14 @@ class TwitterBot:
         """
         user_id = self.numerical_id(user_id)
 
-        url = "https://twitter.com/i/api/graphql/eSSNbhECHHWWALkkQq-YTA/Likes"
+        endpoint = GRAPHQL_ENDPOINTS["Likes"]
 
         headers = self._json_headers()
 
-        form = copy.deepcopy(TwitterBot.combined_lists_form)
-        form["variables"]["userId"] = str(user_id)
-        form["variables"]["count"] = batch_count
-        form["variables"]["includePromotedContent"] = False
-        form["features"]["rweb_video_timestamps_enabled"] = True
-        form["features"]["c9s_tweet_anatomy_moderator_badge_enabled"] = True
-        form["features"]["longform_notetweets_rich_text_read_enabled"] = True
+        variables = endpoint.variables(userId=str(user_id), count=batch_count)
 
-        #for entries in TwitterBot._navigate_graphql_entries(SessionType.Guest, url, form):
-        for entries in self._navigate_graphql_entries(SessionType.Authenticated, url, form, session=self._session, headers=headers):
+        #for entries in TwitterBot._navigate_graphql_entries(SessionType.Guest, endpoint, variables):
+        for entries in self._navigate_graphql_entries(SessionType.Authenticated, endpoint, variables, session=self._session, headers=headers):
             yield from TwitterBot._text_from_entries(entries)
 
     def get_retweeters(self, tweet_id, batch_count=100):
@@ -1693,17 +2042,10 @@ class TwitterBot:
 
         headers = self._json_headers()
 
-        url = "https://twitter.com/i/api/graphql/ViKvXirbgcKs6SfF5wZ30A/Retweeters"
-
-        form = copy.deepcopy(TwitterBot.following_followers_form)
-        del form["variables"]["userId"]
-        # del form["features"]["longform_notetweets_richtext_consumption_enabled"]
+        endpoint = GRAPHQL_ENDPOINTS["Retweeters"]
+        variables = endpoint.variables(tweetId=tweet_id, count=batch_count)
 
-        # set tweetId in form
-        form["variables"]["tweetId"] = tweet_id
-        form["variables"]["count"] = batch_count
-
-        for entries in self._navigate_graphql_entries(SessionType.Authenticated, url, form, session=self._session, headers=headers):
+        for entries in self._navigate_graphql_entries(SessionType.Authenticated, endpoint, variables, session=self._session, headers=headers):
             yield from self._users_from_entries(entries)
 
     def delete_tweet(self, tweet_id):
@@ -2015,73 +2357,51 @@ class TwitterBot:
     @staticmethod
     def tmp_session_headers():
         """
-        Update non-login session and headers used in non-login methods as necessary.
+        The non-login session and headers used in non-login methods, from the shared GuestSession.
 
         Returns:
             Tuple: A tuple containing the non-login session and the non-login headers.
                 - Session: A non-login session object used for making requests.
                 - dict: A dictionary containing non-login headers.
         """
-        if TwitterBot.tmp_count == 0:
-            tmp_session = Session()
-
-            tmp_headers = copy.deepcopy(TwitterBot.default_headers)
-
-            del tmp_headers["x-csrf-token"]
-            del tmp_headers["x-twitter-auth-type"]
-
-            r = tmp_session.post( "https://api.twitter.com/1.1/guest/activate.json", data=b"", headers=tmp_headers)
-            if r.status_code == 200:
-                tmp_headers["x-guest-token"] = r.json()["guest_token"]
-
-            # the ct0 value is just a random 32-character string generated from random bytes at client side
-            tmp_session.cookies.set("ct0", genct0())
-            # set the headers accordingly
-            tmp_headers["x-csrf-token"] = tmp_session.cookies.get("ct0")
+        global _guest_session
+        with _guest_session_lock:
+            if _guest_session is None:
+                _guest_session = GuestSession(TwitterBot.default_headers)
+        return _guest_session.session_headers()
 
-            tmp_headers["Content-Type"] = "application/json"
-            tmp_headers["Host"] = "twitter.com"
-
-            TwitterBot.tmp_session = tmp_session
-            TwitterBot.tmp_headers = tmp_headers
-
-        TwitterBot.tmp_count += 1
-
-        if TwitterBot.tmp_count == 100:
-            TwitterBot.tmp_count = 0
-
-        return TwitterBot.tmp_session, TwitterBot.tmp_headers
+    @staticmethod
+    def cdn_session():
+        """
+        The session used for the syndication cdn. It is kept, so that its connections and latency statistics are reused between calls.
+        """
+        global _cdn_session
+        with _guest_session_lock:
+            if _cdn_session is None:
+                _cdn_session = Session()
+        return _cdn_session
 
     # @staticmethod
     # def search_timeline_graphql(query):
-    def search_timeline_graphql(self, query, batch_count=100):
+    def search_timeline_graphql(self, query, batch_count=100, strict=False):
+        """
+        Parameters:
+        strict (bool): raise requests.exceptions.HTTPError when a page fails, instead of ending the results early.
+        """
         # tmp_session, tmp_headers = TwitterBot.tmp_session_headers()
         logger.info("search (graphql, logged in)")
 
-        # url = "https://twitter.com/i/api/graphql/gkjsKepM6gl_HmFWoWKfgg/SearchTimeline"
-        url = "https://twitter.com/i/api/graphql/WeHGEHYtJA0sfOOFIBMt8g/SearchTimeline"
-
-        form = {
-            "variables": {
-                "rawQuery": query,
-                "count": batch_count,
-                "product": "Latest",
-                "querySource": "typed_query",
-            },
-            "features": TwitterBot.standard_graphql_features,
-        }
-
-        form["features"]["blue_business_profile_image_shape_enabled"] = True
-        form["features"]["longform_notetweets_rich_text_read_enabled"] = True
+        endpoint = GRAPHQL_ENDPOINTS["SearchTimeline"]
+        variables = endpoint.variables(rawQuery=query, count=batch_count)
 
-        # for entries in TwitterBot._navigate_graphql_entries(SessionType.Guest, url, form):
-        for entries in self._navigate_graphql_entries(SessionType.Authenticated, url, form, session=self._session, headers=self._json_headers()):
+        # for entries in TwitterBot._navigate_graphql_entries(SessionType.Guest, endpoint, variables):
+        for entries in self._navigate_graphql_entries(SessionType.Authenticated, endpoint, variables, session=self._session, headers=self._json_headers(), strict=strict):
             yield from TwitterBot._text_from_entries(entries)
 
     # TODO: not finished
     def search_timeline_login_curl(self, query):
         url = "https://twitter.com/i/api/2/search/adaptive.json"
-        form = copy.deepcopy(TwitterBot.adaptive_search_form)
+        form = dict(TwitterBot.adaptive_search_form)
 
         form["q"] = query
         form["requestContext"] = "launch"
@@ -2106,14 +2426,14 @@ class TwitterBot:
         response = TwitterJSON(response)
         logger.debug(f"response (curl) {list(response.globalObjects.tweets)[0]}")
 
-    def search_timeline_login_legacy(self, query):
+    def search_timeline_login_legacy(self, query, strict=False):
         url = "https://twitter.com/i/api/2/search/adaptive.json"
 
         headers = copy.deepcopy(self._headers)
         headers["Referer"] = "https://twitter.com/search?q=" + quote(query.encode("utf-8")) + "&src=typed_query&f=live"
         del headers["Host"]  # default: api.twitter.com
 
-        form = copy.deepcopy(TwitterBot.adaptive_search_form)
+        form = dict(TwitterBot.adaptive_search_form)
         form["q"] = query
         # form['requestContext']="launch"
         form["include_ext_profile_image_shape"] = "1"
@@ -2121,6 +2441,8 @@ class TwitterBot:
         while True:
             r = self._session.get(url, headers=headers, params=form)
             if r.status_code != 200:
+                if strict:
+                    raise requests.exceptions.HTTPError(f"search: {r.status_code}, paging stopped", response=r)
                 break
 
             logger.info(
@@ -2219,21 +2541,18 @@ class TwitterBot:
         # tmp_session, tmp_headers = TwitterBot.tmp_session_headers()
         logger.debug("get tweet details")
 
-        url = "https://twitter.com/i/api/graphql/7d8fexGPbM0BRc5DkacJqA/TweetDetail"
-        form = copy.deepcopy(TwitterBot.tweet_detail_form)
+        endpoint = GRAPHQL_ENDPOINTS["TweetDetail"]
+        variables = endpoint.variables(focalTweetId=str(tweet_id))
 
-        form["variables"]["focalTweetId"] = str(tweet_id)
-        form["features"]["blue_business_profile_image_shape_enabled"] = False
-        form["features"]["longform_notetweets_rich_text_read_enabled"] = True
-
-        # for entries in TwitterBot._navigate_graphql_entries(SessionType.Guest, url, form):
-        for entries in self._navigate_graphql_entries(SessionType.Authenticated, url, form, session=self._session, headers=self._json_headers()):
+        # for entries in TwitterBot._navigate_graphql_entries(SessionType.Guest, endpoint, variables):
+        for entries in self._navigate_graphql_entries(SessionType.Authenticated, endpoint, variables, session=self._session, headers=self._json_headers()):
             if not entries:  # cannot use is None here because None is wrapped in TwitterJSON
                 return None
             else:
                 yield from TwitterBot._text_from_entries(entries)  # currently ignores post from advertiser even if it's the main post
 
     @staticmethod
+    @single_flight(key=lambda tweet_id: ("cdn_tweet_detail", int(tweet_id)))
     def cdn_tweet_detail(tweet_id):
         logger.debug("get tweet brief from twitter cdn")
         url = "https://cdn.syndication.twimg.com/tweet-result"
@@ -2253,7 +2572,7 @@ class TwitterBot:
             "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36",
         }
         try:
-            r = requests.get(url, headers=headers, params=form)
+            r = TwitterBot.cdn_session().get(url, headers=headers, params=form)
             r.raise_for_status()
             response = r.json()
             response = TwitterJSON(response)
@@ -2273,7 +2592,7 @@ class TwitterBot:
             otherinfo = dict()
             # if it's a retweet, platform.twitter will just return the tweet being retweeted
             # not a retweet
-            if this_id == tweet_id:
+            if this_id == int(tweet_id):
                 otherinfo["user"] = p
                 if response.in_reply_to_status_id_str:
                     otherinfo["replied_tweet_id"] = int(response.in_reply_to_status_id_str)
@@ -2322,20 +2641,20 @@ class TwitterBot:
         if r.status_code == 200:
             logger.info(f"{tweet_id} pinned!")
 
-    def get_blocked(self):
+    def get_blocked(self, strict=False):
         """
         Get the list of accounts blocked by the current account.
 
+        Parameters:
+        strict (bool): raise requests.exceptions.HTTPError when a page fails, so that a partial list is never taken for the whole one.
+
         Yields:
         TwitterUserProfile: blocked user.
         """
-        url = "https://twitter.com/i/api/graphql/kpS7GZQ96pe3n5dIzKS2wg/BlockedAccountsAll"
-        form = copy.deepcopy(TwitterBot.blocklist_form)
-        form["features"]["responsive_web_media_download_video_enabled"] = False
-        form["features"]["longform_notetweets_rich_text_read_enabled"] = True
+        endpoint = GRAPHQL_ENDPOINTS["BlockedAccountsAll"]
         headers = self._json_headers()
 
-        for entries in self._navigate_graphql_entries(SessionType.Authenticated, url, form, session=self._session, headers=headers):
+        for entries in self._navigate_graphql_entries(SessionType.Authenticated, endpoint, endpoint.variables(), session=self._session, headers=headers, strict=strict):
             yield from self._users_from_entries(entries)
 
     def get_muted(self):
@@ -2345,13 +2664,10 @@ class TwitterBot:
         Yields:
         TwitterUserProfile: muted user.
         """
-        url = "https://twitter.com/i/api/graphql/g40AoFEAdKggdYivmA2bSg/MutedAccounts"
-        form = copy.deepcopy(TwitterBot.blocklist_form)
-        form["features"]["responsive_web_media_download_video_enabled"] = False
-        form["features"]["longform_notetweets_rich_text_read_enabled"] = True
+        endpoint = GRAPHQL_ENDPOINTS["MutedAccounts"]
         headers = self._json_headers()
 
-        for entries in self._navigate_graphql_entries(SessionType.Authenticated, url, form, session=self._session, headers=headers):
+        for entries in self._navigate_graphql_entries(SessionType.Authenticated, endpoint, endpoint.variables(), session=self._session, headers=headers):
             yield from self._users_from_entries(entries)
 
     def get_current_id(self):
@@ -2409,6 +2725,7 @@ class TwitterBot:
                 logger.info(f"successfully changed protected status to {protected}")
 
     @staticmethod
+    @single_flight(key=lambda tweet_id: ("tweet_by_rest_id", int(tweet_id)))
     def tweet_by_rest_id(tweet_id):
         """
         Get the main post of tweet, ignoring all comments. Login-free.
@@ -2419,18 +2736,11 @@ class TwitterBot:
         Returns:
         Tweet: The main post of the tweet.
         """
-        url = "https://twitter.com/i/api/graphql/0hWvDhmW8YQ-S_ib3azIrw/TweetResultByRestId"
-        form = {
-            "variables":{"tweetId":str(tweet_id),"withCommunity":False,"includePromotedContent":False,"withVoice":False},
-            "features":TwitterBot.standard_graphql_features
-        }
-        form["features"]["responsive_web_media_download_video_enabled"] = False
-        form["features"]["longform_notetweets_rich_text_read_enabled"] = True
+        endpoint = GRAPHQL_ENDPOINTS["TweetResultByRestId"]
 
         tmp_session, tmp_headers = TwitterBot.tmp_session_headers()
-        encoded_params = urlencode({k: json.dumps(form[k], separators=(",", ":")) for k in form})
 
-        r = tmp_session.get(url, headers=tmp_headers, params=encoded_params)
+        r = tmp_session.get(endpoint.url, headers=tmp_headers, params=endpoint.params(tweetId=str(tweet_id)))
         if r.status_code == 200:
             response = r.json()
             response = TwitterJSON(response)
@@ -2439,6 +2749,7 @@ class TwitterBot:
 
     @staticmethod
     @cache
+    @single_flight(key=lambda screen_name: ("user_by_screen_name", screen_name.lower()))
     #def user_by_screen_name(self, screen_name):
     def user_by_screen_name(screen_name):
         """
@@ -2446,15 +2757,10 @@ class TwitterBot:
         """
         tmp_session, tmp_headers = TwitterBot.tmp_session_headers()
 
-        url = "https://twitter.com/i/api/graphql/k26ASEiniqy4eXMdknTSoQ/UserByScreenName"
-        form = copy.deepcopy(TwitterBot.tweet_replies_form)
-
-        form["variables"] = {"screen_name": screen_name, "withSafetyModeUserFields": True}
-        form["features"]["blue_business_profile_image_shape_enabled"] = False
+        endpoint = GRAPHQL_ENDPOINTS["UserByScreenName"]
 
-        encoded_params = urlencode({k: json.dumps(form[k], separators=(",", ":")) for k in form})
-        r = tmp_session.get(url, headers=tmp_headers, params=encoded_params)
-        #r = self._session.get(url, headers=self._json_headers(), params=encoded_params)
+        r = tmp_session.hedged_get(endpoint.url, headers=tmp_headers, params=endpoint.params(screen_name=screen_name))
+        #r = self._session.get(endpoint.url, headers=self._json_headers(), params=endpoint.params(screen_name=screen_name))
         if r.status_code == 200:
             response = r.json()
             response = TwitterJSON(response)
@@ -2462,6 +2768,8 @@ class TwitterBot:
 
     #@staticmethod
     @cache
+    # the viewer-dependent fields (e.g. blocked) make the result specific to the logged in session
+    @single_flight(key=lambda self, user_id: ("user_by_id", id(self), int(user_id)))
     def user_by_id(self, user_id):
     #def user_by_id(user_id):
         """
@@ -2469,15 +2777,11 @@ class TwitterBot:
         """
         #tmp_session, tmp_headers = TwitterBot.tmp_session_headers()
 
-        url = "https://twitter.com/i/api/graphql/nI8WydSd-X-lQIVo6bdktQ/UserByRestId"
-        form = copy.deepcopy(TwitterBot.tweet_replies_form)
-
-        form["variables"] = {"userId": str(user_id), "withSafetyModeUserFields": True}
-
-        encoded_params = urlencode({k: json.dumps(form[k], separators=(",", ":")) for k in form})
+        endpoint = GRAPHQL_ENDPOINTS["UserByRestId"]
+        encoded_params = endpoint.params(userId=str(user_id))
 
-        #r = tmp_session.get(url, headers=tmp_headers, params=encoded_params)
-        r = self._session.get(url, headers=self._json_headers(), params=encoded_params)
+        #r = tmp_session.get(endpoint.url, headers=tmp_headers, params=encoded_params)
+        r = self._session.hedged_get(endpoint.url, headers=self._json_headers(), params=encoded_params)
         if r.status_code == 200:
             response = r.json()
             response = TwitterJSON(response)
@@ -0,0 +1,146 @@
+import os
+import gzip
+import json
+import base64
+import threading
+from time import sleep
+from datetime import timedelta
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class CassetteMode:
+    Record = "record"
+    Replay = "replay"
+
+
+class CassetteMiss(requests.exceptions.ConnectionError):
+    """
+    Raised in replay mode when no recorded response matches the request.
+    """
+
+
+def request_key(method, url):
+    """
+    Normalize a request into the key used to look it up in a cassette.
+
+    The query string is decoded and sorted, so that the same parameters in a different order map to the same entry.
+    The request body is deliberately not part of the key: report and login flows embed random ids in their payloads.
+    """
+    parts = urlsplit(url)
+    params = sorted(parse_qsl(parts.query, keep_blank_values=True))
+    normalized = f"{parts.scheme}://{parts.netloc}{parts.path}"
+    if params:
+        normalized += "?" + urlencode(params)
+    return f"{method.upper()} {normalized}"
+
+
+class Cassette:
+    """
+    On-disk store of request/response pairs, written as gzip compressed json lines.
+
+    In record mode every response going through a CustomSession is appended to the file.
+    In replay mode responses are served from the file and no network access happens.
+    When the same request was recorded several times (e.g. polling notifications), the recorded responses are served in order, and the last one is repeated afterwards.
+    """
+
+    def __init__(self, path, mode=CassetteMode.Replay, latency=None):
+        """
+        Parameters:
+        path (str): the path of the cassette file, usually ending with .jsonl.gz
+        mode (str): CassetteMode.Record or CassetteMode.Replay.
+        latency (None | float | str): simulated latency in replay mode. None for no delay, a number of seconds for a fixed delay, or "recorded" to reuse the recorded elapsed time.
+        """
+        if mode not in (CassetteMode.Record, CassetteMode.Replay):
+            raise ValueError(f"unknown cassette mode: {mode}")
+
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+
+        self._lock = threading.Lock()
+        self._entries = dict()
+        self._positions = dict()
+
+        if self.mode == CassetteMode.Replay:
+            self._load()
+        else:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+    def _load(self):
+        count = 0
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                self._entries.setdefault(entry["key"], []).append(entry)
+                count += 1
+        logger.info(f"{count} recorded responses loaded from {self.path}")
+
+    def record(self, request, response):
+        """
+        Append a request/response pair to the cassette.
+        """
+        content = response.content
+        try:
+            body = {"text": content.decode("utf-8")}
+        except UnicodeDecodeError:
+            body = {"base64": base64.b64encode(content).decode("ascii")}
+
+        entry = {
+            "key": request_key(request.method, request.url),
+            "url": request.url,
+            "status_code": response.status_code,
+            "reason": response.reason,
+            # the recorded body is already decompressed
+            "headers": {k: v for k, v in response.headers.items() if k.lower() != "content-encoding"},
+            "elapsed": response.elapsed.total_seconds(),
+            **body,
+        }
+        line = json.dumps(entry, separators=(",", ":")) + "\n"
+
+        with self._lock:
+            # every append adds a gzip member; gzip readers concatenate them transparently
+            with gzip.open(self.path, "at", encoding="utf-8") as f:
+                f.write(line)
+
+    def replay(self, request):
+        """
+        Build a response for the request from the recorded entries.
+        """
+        key = request_key(request.method, request.url)
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                raise CassetteMiss(f"no recorded response for {key}", request=request)
+            position = self._positions.get(key, 0)
+            entry = entries[min(position, len(entries) - 1)]
+            self._positions[key] = position + 1
+
+        if self.latency == "recorded":
+            sleep(entry["elapsed"])
+        elif self.latency:
+            sleep(self.latency)
+
+        r = requests.Response()
+        r.status_code = entry["status_code"]
+        r.reason = entry["reason"]
+        r.headers = CaseInsensitiveDict(entry["headers"])
+        r.url = entry["url"]
+        r.request = request
+        r.encoding = requests.utils.get_encoding_from_headers(r.headers)
+        r.elapsed = timedelta(seconds=entry["elapsed"])
+        if "text" in entry:
+            r._content = entry["text"].encode("utf-8")
+        else:
+            r._content = base64.b64decode(entry["base64"])
+        return r
@@ -0,0 +1,202 @@
+import json
+from types import MappingProxyType
+from urllib.parse import urlencode
+
+
+def _compact_json(value):
+    return json.dumps(value, separators=(",", ":"))
+
+
+STANDARD_GRAPHQL_FEATURES = MappingProxyType(
+    {
+        "responsive_web_twitter_blue_verified_badge_is_enabled": True,
+        "responsive_web_graphql_exclude_directive_enabled": False,
+        "verified_phone_label_enabled": False,
+        "responsive_web_graphql_timeline_navigation_enabled": True,
+        "responsive_web_graphql_skip_user_profile_image_extensions_enabled": False,
+        "tweetypie_unmention_optimization_enabled": True,
+        "vibe_api_enabled": True,
+        "responsive_web_edit_tweet_api_enabled": True,
+        "graphql_is_translatable_rweb_tweet_is_translatable_enabled": True,
+        "view_counts_everywhere_api_enabled": True,
+        "longform_notetweets_consumption_enabled": True,
+        "tweet_awards_web_tipping_enabled": False,
+        "freedom_of_speech_not_reach_fetch_enabled": False,
+        "standardized_nudges_misinfo": True,
+        "tweet_with_visibility_results_prefer_gql_limited_actions_policy_enabled": False,
+        "interactive_text_enabled": True,
+        "responsive_web_text_conversations_enabled": False,
+        "longform_notetweets_richtext_consumption_enabled": False,
+        "responsive_web_enhance_cards_enabled": False,
+        "rweb_lists_timeline_redesign_enabled": True,
+        "creator_subscriptions_tweet_preview_api_enabled": True,
+        "responsive_web_twitter_article_tweet_consumption_enabled": True,
+        "longform_notetweets_inline_media_enabled": True,
+    }
+)
+
+
+class GraphQLEndpoint:
+    """
+    Immutable description of a GraphQL GET endpoint.
+
+    The features and fieldToggles never change between requests, so they are url-encoded once here; only the variables are encoded per request.
+    """
+
+    def __init__(self, name, query_id, default_variables=None, feature_overrides=None, field_toggles=None):
+        """
+        Parameters:
+        name (str): the operation name, e.g. SearchTimeline.
+        query_id (str): the query id in the url.
+        default_variables (dict): variables sent with every request, before the per-request ones are merged in. (optional)
+        feature_overrides (dict): changes to STANDARD_GRAPHQL_FEATURES for this endpoint. (optional)
+        field_toggles (dict): the fieldToggles parameter. (optional)
+        """
+        self.name = name
+        self.query_id = query_id
+        self.url = f"https://twitter.com/i/api/graphql/{query_id}/{name}"
+        self.default_variables = MappingProxyType(dict(default_variables or {}))
+        self.features = MappingProxyType({**STANDARD_GRAPHQL_FEATURES, **(feature_overrides or {})})
+        self.field_toggles = MappingProxyType(dict(field_toggles)) if field_toggles is not None else None
+
+        constant_params = {"features": _compact_json(dict(self.features))}
+        if self.field_toggles is not None:
+            constant_params["fieldToggles"] = _compact_json(dict(self.field_toggles))
+        self._encoded_constant_params = urlencode(constant_params)
+
+    def __repr__(self):
+        return f"GraphQLEndpoint({self.name}, {self.query_id})"
+
+    def variables(self, **variables):
+        """
+        Returns a new, mutable variables dictionary: the defaults updated with the given values.
+        """
+        return {**self.default_variables, **variables}
+
+    def encode(self, variables):
+        """
+        Returns the query string of a request with the given variables.
+        """
+        return urlencode({"variables": _compact_json(variables)}) + "&" + self._encoded_constant_params
+
+    def params(self, **variables):
+        return self.encode(self.variables(**variables))
+
+
+_USER_TIMELINE_VARIABLES = {
+    "count": 100,
+    "includePromotedContent": False,
+    "withSuperFollowsUserFields": True,
+    "withDownvotePerspective": False,
+    "withReactionsMetadata": False,
+    "withReactionsPerspective": False,
+    "withSuperFollowsTweetFields": True,
+}
+
+_ACCOUNT_LIST_VARIABLES = {"count": 20, "includePromotedContent": False, "withSafetyModeUserFields": False}
+_ACCOUNT_LIST_FEATURES = {"responsive_web_media_download_video_enabled": False, "longform_notetweets_rich_text_read_enabled": True}
+_ACCOUNT_LIST_TOGGLES = {"withAuxiliaryUserLabels": False, "withArticleRichContentState": False}
+
+_ARTICLE_TOGGLES = {"withArticleRichContentState": False}
+
+GRAPHQL_ENDPOINTS = MappingProxyType(
+    {
+        e.name: e
+        for e in [
+            GraphQLEndpoint(
+                "SearchTimeline",
+                "WeHGEHYtJA0sfOOFIBMt8g",
+                default_variables={"rawQuery": "", "count": 100, "product": "Latest", "querySource": "typed_query"},
+                feature_overrides={"blue_business_profile_image_shape_enabled": True, "longform_notetweets_rich_text_read_enabled": True},
+            ),
+            GraphQLEndpoint(
+                "TweetDetail",
+                "7d8fexGPbM0BRc5DkacJqA",
+                default_variables={
+                    "focalTweetId": None,
+                    "referrer": "tweet",
+                    "with_rux_injections": False,
+                    "includePromotedContent": True,
+                    "withCommunity": True,
+                    "withQuickPromoteEligibilityTweetFields": True,
+                    "withBirdwatchNotes": True,
+                    "withDownvotePerspective": False,
+                    "withVoice": True,
+                    "withV2Timeline": True,
+                },
+                feature_overrides={"blue_business_profile_image_shape_enabled": False, "longform_notetweets_rich_text_read_enabled": True},
+            ),
+            GraphQLEndpoint(
+                "TweetResultByRestId",
+                "0hWvDhmW8YQ-S_ib3azIrw",
+                default_variables={"tweetId": None, "withCommunity": False, "includePromotedContent": False, "withVoice": False},
+                feature_overrides={"responsive_web_media_download_video_enabled": False, "longform_notetweets_rich_text_read_enabled": True},
+            ),
+            GraphQLEndpoint(
+                "UserByScreenName",
+                "k26ASEiniqy4eXMdknTSoQ",
+                default_variables={"screen_name": None, "withSafetyModeUserFields": True},
+                feature_overrides={"blue_business_profile_image_shape_enabled": False},
+                field_toggles=_ARTICLE_TOGGLES,
+            ),
+            GraphQLEndpoint(
+                "UserByRestId",
+                "nI8WydSd-X-lQIVo6bdktQ",
+                default_variables={"userId": None, "withSafetyModeUserFields": True},
+                field_toggles=_ARTICLE_TOGGLES,
+            ),
+            GraphQLEndpoint(
+                "UserTweetsAndReplies",
+                "ahLGvWSvDCr-57-E8GXGCQ",
+                default_variables={
+                    "userId": None,
+                    "count": 100,
+                    "includePromotedContent": True,
+                    "withCommunity": True,
+                    "withVoice": True,
+                    "withV2Timeline": True,
+                },
+                feature_overrides={
+                    "responsive_web_graphql_exclude_directive_enabled": True,
+                    "responsive_web_twitter_article_tweet_consumption_enabled": False,
+                    "tweet_with_visibility_results_prefer_gql_limited_actions_policy_enabled": True,
+                    "longform_notetweets_rich_text_read_enabled": True,
+                },
+                field_toggles=_ARTICLE_TOGGLES,
+            ),
+            GraphQLEndpoint(
+                "CombinedLists",
+                "rIxum3avpCu7APi7mxTNjw",
+                default_variables={"userId": None, "count": 100},
+                feature_overrides={"blue_business_profile_image_shape_enabled": True, "longform_notetweets_rich_text_read_enabled": True},
+            ),
+            GraphQLEndpoint(
+                "Likes",
+                "eSSNbhECHHWWALkkQq-YTA",
+                default_variables={"userId": None, "count": 100, "includePromotedContent": False},
+                feature_overrides={
+                    "rweb_video_timestamps_enabled": True,
+                    "c9s_tweet_anatomy_moderator_badge_enabled": True,
+                    "longform_notetweets_rich_text_read_enabled": True,
+                },
+            ),
+            GraphQLEndpoint("Following", "AmvGuDw_fxEbJtEXie4OkA", default_variables={"userId": None, **_USER_TIMELINE_VARIABLES}),
+            GraphQLEndpoint("Followers", "utPIvA97eaEvxfra_PQz_A", default_variables={"userId": None, **_USER_TIMELINE_VARIABLES}),
+            GraphQLEndpoint("Retweeters", "ViKvXirbgcKs6SfF5wZ30A", default_variables={**_USER_TIMELINE_VARIABLES, "tweetId": None}),
+            GraphQLEndpoint(
+                "BlockedAccountsAll",
+                "kpS7GZQ96pe3n5dIzKS2wg",
+                default_variables=_ACCOUNT_LIST_VARIABLES,
+                feature_overrides=_ACCOUNT_LIST_FEATURES,
+                field_toggles=_ACCOUNT_LIST_TOGGLES,
+            ),
+            GraphQLEndpoint(
+                "MutedAccounts",
+                "g40AoFEAdKggdYivmA2bSg",
+                default_variables=_ACCOUNT_LIST_VARIABLES,
+                feature_overrides=_ACCOUNT_LIST_FEATURES,
+                field_toggles=_ACCOUNT_LIST_TOGGLES,
+            ),
+        ]
+    }
+)
@@ -0,0 +1,230 @@
+"""
+An append-only log of notification events, in JSON lines segments rotated by event time.
+
+    python -m twitter_guard.eventlog import backup_log.yaml events/
+    python -m twitter_guard.eventlog cat events/ --start 2023-08-01 --end 2023-09-01
+"""
+import os
+import gzip
+import json
+import argparse
+import threading
+from datetime import datetime, timezone
+
+import yaml
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PREFIX = "events-"
+SEGMENT_TIME_FORMAT = "%Y%m%dT%H%M%S"
+INDEX_NAME = "index.json"
+
+
+def epoch_ms(value):
+    """
+    Convert a datetime, a "YYYY-mm-dd[ HH:MM:SS]" string (UTC) or epoch milliseconds to epoch milliseconds.
+    """
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str):
+        fmt = "%Y-%m-%d %H:%M:%S" if " " in value else "%Y-%m-%d"
+        value = datetime.strptime(value, fmt).replace(tzinfo=timezone.utc)
+    return int(value.timestamp() * 1000)
+
+
+class EventLog:
+    """
+    Events are dicts with an integer "time" in epoch milliseconds, e.g. the sort index of a notification.
+
+    Every event goes to the segment file covering its time (one per segment_seconds, daily by default), so a range scan only opens the segments overlapping the range.
+    index.json keeps the first and last event time and the count of every segment, to skip segments without matching events. Thread-safe.
+    It also keeps the size and mtime of every segment, so that the entries of segments changed after the last index write (e.g. before a crash) are rebuilt when the log is opened.
+    """
+
+    def __init__(self, directory, segment_seconds=86400, compress=False):
+        """
+        Parameters:
+        directory (str): where the segments and the index are written, created if missing.
+        segment_seconds (int): the time span of a segment.
+        compress (bool): write new segments gzip compressed (.jsonl.gz).
+        """
+        self.directory = directory
+        self.segment_ms = segment_seconds * 1000
+        self.compress = compress
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._index_path = os.path.join(directory, INDEX_NAME)
+        self._index = self._load_index()
+
+    def _load_index(self):
+        saved = dict()
+        if os.path.exists(self._index_path):
+            try:
+                with open(self._index_path, "r") as f:
+                    saved = json.load(f)
+            except ValueError:
+                logger.warning(f"{self._index_path} is corrupt, rebuilding it")
+
+        index = dict()
+        for name in self._segment_names():
+            entry = saved.get(name)
+            stat = os.stat(os.path.join(self.directory, name))
+            if entry is None or entry.get("size") != stat.st_size or entry.get("mtime") != stat.st_mtime_ns:
+                logger.info(f"{name}: index entry missing or stale, rebuilding it")
+                entry = self._scan_segment(name)
+            index[name] = entry
+        if index != saved:
+            self._index = index
+            self._save_index()
+        return index
+
+    def _scan_segment(self, name):
+        first, last, count = None, None, 0
+        for event in self._read_segment(name):
+            t = event["time"]
+            first = t if first is None else min(first, t)
+            last = t if last is None else max(last, t)
+            count += 1
+        entry = {"first": first, "last": last, "count": count}
+        self._stat_segment(name, entry)
+        return entry
+
+    def _stat_segment(self, name, entry):
+        stat = os.stat(os.path.join(self.directory, name))
+        entry["size"] = stat.st_size
+        entry["mtime"] = stat.st_mtime_ns
+
+    def _save_index(self):
+        tmp_path = self._index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._index, f, indent=0)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._index_path)
+
+    def _segment_names(self):
+        return sorted(name for name in os.listdir(self.directory) if name.startswith(SEGMENT_PREFIX))
+
+    @staticmethod
+    def _segment_start(name):
+        stamp = name[len(SEGMENT_PREFIX) :].split(".", 1)[0]
+        return epoch_ms(datetime.strptime(stamp, SEGMENT_TIME_FORMAT).replace(tzinfo=timezone.utc))
+
+    def _segment_name(self, time_ms):
+        start = time_ms - time_ms % self.segment_ms
+        stamp = datetime.fromtimestamp(start / 1000, timezone.utc).strftime(SEGMENT_TIME_FORMAT)
+        # an existing segment keeps its format when the compress setting changes
+        for suffix in (".jsonl", ".jsonl.gz"):
+            if SEGMENT_PREFIX + stamp + suffix in self._index:
+                return SEGMENT_PREFIX + stamp + suffix
+        return SEGMENT_PREFIX + stamp + (".jsonl.gz" if self.compress else ".jsonl")
+
+    def _open(self, name, mode):
+        path = os.path.join(self.directory, name)
+        if name.endswith(".gz"):
+            return gzip.open(path, mode + "t", encoding="utf-8")
+        return open(path, mode, encoding="utf-8")
+
+    def append(self, events):
+        """
+        Append events, each a dict with an integer "time" in epoch milliseconds.
+        """
+        by_segment = dict()
+        for event in events:
+            by_segment.setdefault(self._segment_name(int(event["time"])), []).append(event)
+        if not by_segment:
+            return
+
+        with self._lock:
+            for name, segment_events in by_segment.items():
+                with self._open(name, "a") as f:
+                    f.write("".join(json.dumps(event, separators=(",", ":"), default=str) + "\n" for event in segment_events))
+                entry = self._index.setdefault(name, {"first": None, "last": None, "count": 0})
+                times = [int(event["time"]) for event in segment_events]
+                entry["first"] = min(times) if entry["first"] is None else min(entry["first"], min(times))
+                entry["last"] = max(times) if entry["last"] is None else max(entry["last"], max(times))
+                entry["count"] += len(times)
+                self._stat_segment(name, entry)
+            self._save_index()
+
+    def _read_segment(self, name):
+        with self._open(name, "r") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # a torn last line after a crash
+                    logger.warning(f"{name}: skipping a corrupt line")
+
+    def read(self, start=None, end=None):
+        """
+        Iterate the events with start <= time < end, segment by segment, in the order they were appended within a segment.
+
+        Parameters:
+        start, end: epoch milliseconds, datetimes or "YYYY-mm-dd[ HH:MM:SS]" strings in UTC. (optional) open ended when missing.
+        """
+        start, end = epoch_ms(start), epoch_ms(end)
+        for name in self._segment_names():
+            segment_start = self._segment_start(name)
+            if end is not None and segment_start >= end:
+                break
+            if start is not None and segment_start + self.segment_ms <= start:
+                continue
+            entry = self._index.get(name)
+            if entry is not None and entry["first"] is not None:
+                # segments written with another segment_seconds are filtered by their recorded range
+                if (start is not None and entry["last"] < start) or (end is not None and entry["first"] >= end):
+                    continue
+            for event in self._read_segment(name):
+                t = event["time"]
+                if (start is None or t >= start) and (end is None or t < end):
+                    yield event
+
+    def __len__(self):
+        return sum(entry["count"] for entry in self._index.values())
+
+    def import_yaml(self, yaml_path):
+        """
+        Append the events of a legacy backup_log_path yaml file.
+
+        Returns:
+        int: the number of events imported.
+        """
+        with open(yaml_path, "r") as f:
+            backup = yaml.load(f, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader)) or dict()
+        events = []
+        for event_time, entries in backup.items():
+            # the keys are "YYYY-mm-dd HH:MM:SS" strings, which yaml may load as datetimes
+            if isinstance(event_time, datetime) and event_time.tzinfo is None:
+                event_time = event_time.replace(tzinfo=timezone.utc)
+            time_ms = epoch_ms(event_time)
+            for entry in entries:
+                events.append({"time": time_ms, **entry})
+        self.append(events)
+        return len(events)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="work with notification event logs")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    import_parser = subparsers.add_parser("import", help="append the events of a legacy yaml backup log")
+    import_parser.add_argument("yaml_path")
+    import_parser.add_argument("directory")
+    import_parser.add_argument("--compress", action="store_true")
+    cat_parser = subparsers.add_parser("cat", help="print the events of a time range as json lines")
+    cat_parser.add_argument("directory")
+    cat_parser.add_argument("--start")
+    cat_parser.add_argument("--end")
+    args = parser.parse_args()
+
+    if args.command == "import":
+        count = EventLog(args.directory, compress=args.compress).import_yaml(args.yaml_path)
+        print(f"imported {count} events")
+    else:
+        for event in EventLog(args.directory).read(args.start, args.end):
+            print(json.dumps(event))
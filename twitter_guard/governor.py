@@ -0,0 +1,103 @@
+import threading
+from time import time
+
+from .retry import throttled_until
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class EndpointLimit:
+    def __init__(self, limit, remaining, reset):
+        self.limit = limit
+        self.remaining = remaining
+        # unix timestamp when the window ends
+        self.reset = reset
+
+
+class RateGovernor:
+    """
+    Keeps the requests of one account within its rate limits, per endpoint.
+
+    The limits are learned from the x-rate-limit-* headers of the responses. Every request takes one of the remaining requests locally before it is sent, so concurrent threads of the same account do not overshoot the window.
+    Endpoints that have not reported a limit yet are never held back.
+    """
+
+    def __init__(self, reserve=0):
+        """
+        Parameters:
+        reserve (int): requests per window left untouched, e.g. for using the account in the browser meanwhile.
+        """
+        self.reserve = reserve
+        self._lock = threading.Lock()
+        self._limits = dict()
+
+    def update(self, endpoint, response):
+        """
+        Learn the limit of the endpoint from a response.
+        """
+        headers = response.headers
+        try:
+            limit = int(headers["x-rate-limit-limit"])
+            remaining = int(headers["x-rate-limit-remaining"])
+            reset = float(headers["x-rate-limit-reset"])
+        except (KeyError, ValueError):
+            if response.status_code != 429:
+                return
+            limit, remaining, reset = None, 0, throttled_until(response)
+            if reset is None:
+                return
+        if response.status_code == 429:
+            remaining = 0
+
+        with self._lock:
+            current = self._limits.get(endpoint)
+            if current is not None and current.reset == reset:
+                # responses of the same window can arrive out of order, the lowest count is the latest one
+                current.remaining = min(current.remaining, remaining)
+            else:
+                self._limits[endpoint] = EndpointLimit(limit if limit is not None else getattr(current, "limit", None), remaining, reset)
+
+    def wait_time(self, endpoint):
+        """
+        Seconds until a request to the endpoint may be sent, 0 if it can go now.
+        """
+        with self._lock:
+            current = self._limits.get(endpoint)
+            if current is None:
+                return 0
+            now = time()
+            if current.reset <= now or current.remaining > self.reserve:
+                return 0
+            return current.reset - now
+
+    def acquire(self, endpoint):
+        """
+        Take one request of the current window.
+
+        Returns:
+        float: 0 if the request may be sent, otherwise the seconds until the window resets (nothing is taken then).
+        """
+        with self._lock:
+            current = self._limits.get(endpoint)
+            if current is None:
+                return 0
+            now = time()
+            if current.reset <= now:
+                # the new window is unknown until the next response arrives
+                return 0
+            if current.remaining > self.reserve:
+                current.remaining -= 1
+                return 0
+            return current.reset - now
+
+    def snapshot(self):
+        """
+        The known limits, keyed by endpoint.
+        """
+        with self._lock:
+            return {
+                endpoint: {"limit": l.limit, "remaining": l.remaining, "reset": l.reset}
+                for endpoint, l in self._limits.items()
+            }
@@ -0,0 +1,155 @@
+import threading
+from time import perf_counter
+from concurrent import futures
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class HedgeBudget:
+    """
+    Caps the extra traffic caused by hedging.
+
+    Every request earns ratio tokens and every hedge costs one, so at most about ratio x the requests are duplicated.
+    """
+
+    def __init__(self, ratio=0.05, burst=5):
+        """
+        Parameters:
+        ratio (float): the fraction of requests that may be hedged.
+        burst (float): the maximum number of tokens saved up while nothing is slow.
+        """
+        self.ratio = ratio
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._tokens = 0.0
+
+    def record_request(self):
+        with self._lock:
+            self._tokens = min(self._tokens + self.ratio, self.burst)
+
+    def try_acquire(self):
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+
+class Hedging:
+    """
+    Hedged requests for idempotent, latency-critical lookups.
+
+    The request runs on a worker thread. If it has not completed after the observed latency quantile of its endpoint, counted from when it started running, a duplicate is sent, which the connection pool serves on a different connection; whichever answer arrives first is returned.
+    The slower request is not cancelled, its response is discarded.
+    Requests and hedges only take idle workers: when every worker is busy, the request runs on the calling thread and is not hedged, so a queued request is never mistaken for a slow one.
+    """
+
+    def __init__(self, quantile=0.95, budget=None, max_workers=8, min_delay=0.05):
+        """
+        Parameters:
+        quantile (float): the latency quantile of the endpoint after which a hedge is sent.
+        budget (HedgeBudget): limits the fraction of hedged requests. (optional) defaults to 5%.
+        max_workers (int): the threads running the requests and their hedges.
+        min_delay (float): never hedge earlier than this, in seconds.
+        """
+        self.quantile = quantile
+        self.budget = budget if budget is not None else HedgeBudget()
+        self.max_workers = max_workers
+        self.min_delay = min_delay
+        self._executor = futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedging")
+
+        self._lock = threading.Lock()
+        # workers taken by a running or just submitted request
+        self._busy = 0
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.saturated = 0
+
+    def _try_submit(self, func, *args, **kwargs):
+        """
+        Run func on an idle worker. Returns the future and an event set when func starts running, or None when every worker is busy.
+        """
+        with self._lock:
+            if self._busy >= self.max_workers:
+                self.saturated += 1
+                return None
+            self._busy += 1
+        started = threading.Event()
+
+        def run():
+            started.started_at = perf_counter()
+            started.set()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._busy -= 1
+
+        return self._executor.submit(run), started
+
+    def call(self, endpoint, timeouts, func, *args, hedge_func=None, **kwargs):
+        """
+        Returns the result of func(*args, **kwargs), hedged when it is slower than usual for the endpoint.
+
+        Parameters:
+        endpoint (str): the endpoint name, see instrumentation.endpoint_name.
+        timeouts (AdaptiveTimeouts): provides the observed latencies of the endpoint.
+        func (callable): performs one request. It must be idempotent, it may run twice.
+        hedge_func (callable): sends the duplicate, e.g. without retries; raising makes it lose to the primary. (optional) defaults to func.
+        """
+        with self._lock:
+            self.requests += 1
+        self.budget.record_request()
+
+        delay = timeouts.quantile_latency(endpoint, self.quantile)
+        if delay is None:
+            # nothing known about the endpoint yet, no point in hedging
+            return func(*args, **kwargs)
+
+        submitted = self._try_submit(func, *args, **kwargs)
+        if submitted is None:
+            return func(*args, **kwargs)
+        primary, started = submitted
+
+        # the delay counts from the start of the request, not from its submission
+        started.wait()
+        remaining = max(delay, self.min_delay) - (perf_counter() - started.started_at)
+        try:
+            return primary.result(timeout=max(remaining, 0))
+        except futures.TimeoutError:
+            pass
+
+        if not self.budget.try_acquire():
+            return primary.result()
+        submitted = self._try_submit(hedge_func if hedge_func is not None else func, *args, **kwargs)
+        if submitted is None:
+            return primary.result()
+
+        logger.debug(f"{endpoint}: no answer after {delay:.3f}s, hedging")
+        hedge = submitted[0]
+        with self._lock:
+            self.hedges += 1
+
+        pending = {primary, hedge}
+        while True:
+            done, pending = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+            succeeded = [future for future in done if future.exception() is None]
+            if succeeded:
+                if hedge in succeeded and primary not in succeeded:
+                    with self._lock:
+                        self.hedge_wins += 1
+                return (primary if primary in succeeded else hedge).result()
+            # a failed request only counts when the other one failed as well
+            if not pending:
+                # the error of the primary is the meaningful one, the hedge may have failed only for being throttled
+                return primary.result()
+
+    def stats(self):
+        with self._lock:
+            return {"requests": self.requests, "hedges": self.hedges, "hedge_wins": self.hedge_wins, "saturated": self.saturated}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
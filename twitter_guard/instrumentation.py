@@ -0,0 +1,239 @@
+import os
+import json
+import threading
+from time import time
+from bisect import bisect_left
+from urllib.parse import urlsplit
+from dataclasses import dataclass, field, asdict
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def endpoint_name(url):
+    """
+    A short, stable label for the endpoint of a url: the operation name for GraphQL requests, the path otherwise.
+    """
+    path = urlsplit(url).path
+    if "/graphql/" in path:
+        return path.rsplit("/", 1)[-1]
+    return path
+
+
+@dataclass
+class RequestEvent:
+    endpoint: str
+    method: str
+    status_code: int
+    # seconds from sending the request to the end of reading the body
+    latency: float
+    # bytes of the (decompressed) response body
+    response_bytes: int
+    # seconds spent reading and decompressing the body after the headers arrived
+    decode_time: float
+    retries: int = field(default=0)
+    timestamp: float = field(default_factory=time)
+
+
+class LatencyHistogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        # the last slot counts the samples above the largest bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """
+        Upper bound of the bucket containing the q-th quantile. None if nothing has been observed.
+        """
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, bucket_count in zip(self.buckets, self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class EndpointStats:
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.status_codes = dict()
+        self.response_bytes = 0
+        self.decode_time = 0.0
+        self.retries = 0
+
+    def observe(self, event):
+        self.latency.observe(event.latency)
+        self.status_codes[event.status_code] = self.status_codes.get(event.status_code, 0) + 1
+        self.response_bytes += event.response_bytes
+        self.decode_time += event.decode_time
+        self.retries += event.retries
+
+    def summary(self):
+        return {
+            "count": self.latency.count,
+            "latency_sum": self.latency.sum,
+            "p50": self.latency.quantile(0.5),
+            "p95": self.latency.quantile(0.95),
+            "p99": self.latency.quantile(0.99),
+            "status_codes": dict(self.status_codes),
+            "response_bytes": self.response_bytes,
+            "decode_time": self.decode_time,
+            "retries": self.retries,
+        }
+
+
+class InMemoryStats:
+    """
+    Sink aggregating the events per endpoint.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.endpoints = dict()
+
+    def emit(self, event):
+        with self._lock:
+            if event.endpoint not in self.endpoints:
+                self.endpoints[event.endpoint] = EndpointStats()
+            self.endpoints[event.endpoint].observe(event)
+
+    def summary(self):
+        with self._lock:
+            return {endpoint: stats.summary() for endpoint, stats in self.endpoints.items()}
+
+
+class JSONLinesSink:
+    """
+    Sink appending every event to a json lines file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def emit(self, event):
+        line = json.dumps(asdict(event), separators=(",", ":")) + "\n"
+        with self._lock:
+            self._file.write(line)
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class PrometheusTextfileSink:
+    """
+    Sink exporting aggregated stats in the Prometheus text format, e.g. for the node_exporter textfile collector.
+    The file is rewritten atomically, at most once per interval.
+    """
+
+    def __init__(self, path, interval=15, pools=None):
+        """
+        Parameters:
+        path (str): the output file.
+        interval (float): the minimum number of seconds between two writes.
+        pools (ConnectionPools): also export the connection pool utilization. (optional)
+        """
+        self.path = path
+        self.interval = interval
+        self.pools = pools
+        self.stats = InMemoryStats()
+        self._last_write = 0
+
+    def emit(self, event):
+        self.stats.emit(event)
+        if time() - self._last_write >= self.interval:
+            self.flush()
+
+    def _lines(self):
+        lines = [
+            "# TYPE twitter_guard_request_duration_seconds histogram",
+        ]
+        with self.stats._lock:
+            endpoints = list(self.stats.endpoints.items())
+            for endpoint, stats in endpoints:
+                label = f'endpoint="{endpoint}"'
+                cumulative = 0
+                for bound, bucket_count in zip(stats.latency.buckets, stats.latency.counts):
+                    cumulative += bucket_count
+                    lines.append(f'twitter_guard_request_duration_seconds_bucket{{{label},le="{bound}"}} {cumulative}')
+                lines.append(f'twitter_guard_request_duration_seconds_bucket{{{label},le="+Inf"}} {stats.latency.count}')
+                lines.append(f"twitter_guard_request_duration_seconds_sum{{{label}}} {stats.latency.sum}")
+                lines.append(f"twitter_guard_request_duration_seconds_count{{{label}}} {stats.latency.count}")
+
+            lines.append("# TYPE twitter_guard_requests_total counter")
+            for endpoint, stats in endpoints:
+                for status_code, count in stats.status_codes.items():
+                    lines.append(f'twitter_guard_requests_total{{endpoint="{endpoint}",status="{status_code}"}} {count}')
+
+            for metric, attribute in [
+                ("twitter_guard_response_bytes_total", "response_bytes"),
+                ("twitter_guard_decode_seconds_total", "decode_time"),
+                ("twitter_guard_retries_total", "retries"),
+            ]:
+                lines.append(f"# TYPE {metric} counter")
+                for endpoint, stats in endpoints:
+                    lines.append(f'{metric}{{endpoint="{endpoint}"}} {getattr(stats, attribute)}')
+
+        if self.pools is not None:
+            pool_stats = self.pools.stats()
+            for metric, attribute in [
+                ("twitter_guard_pool_max_connections", "maxsize"),
+                ("twitter_guard_pool_connections_in_use", "in_use"),
+                ("twitter_guard_pool_connections_idle", "idle"),
+            ]:
+                lines.append(f"# TYPE {metric} gauge")
+                for host, stats in pool_stats.items():
+                    lines.append(f'{metric}{{host="{host}"}} {stats[attribute]}')
+            lines.append("# TYPE twitter_guard_pool_connections_opened_total counter")
+            for host, stats in pool_stats.items():
+                lines.append(f'twitter_guard_pool_connections_opened_total{{host="{host}"}} {stats["connections_opened"]}')
+        return lines
+
+    def flush(self):
+        self._last_write = time()
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                f.write("\n".join(self._lines()) + "\n")
+            os.replace(tmp_path, self.path)
+        except OSError:
+            logger.exception(f"cannot write {self.path}")
+
+
+class Instrumentation:
+    """
+    Fans request events out to the sinks. A sink is any object with an emit(event) method.
+    """
+
+    def __init__(self, *sinks):
+        self.sinks = list(sinks)
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+
+    def emit(self, event):
+        for sink in self.sinks:
+            try:
+                sink.emit(event)
+            except Exception:
+                logger.exception(f"instrumentation sink {sink} failed")
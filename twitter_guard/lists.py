@@ -0,0 +1,291 @@
+import os
+import json
+import sqlite3
+import threading
+from time import monotonic
+from collections.abc import MutableMapping
+
+import yaml
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# the libyaml bindings are an order of magnitude faster on large lists, when they are available
+_YAMLLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+_YAMLDumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+
+class JournaledList(MutableMapping):
+    """
+    A user_id -> screen_name list kept in a YAML snapshot plus an append-only journal.
+
+    Every change appends one json line to <path>.journal instead of rewriting the whole YAML file, and the journal is fsynced in batches.
+    Once the journal grows past compact_threshold lines, it is folded into the snapshot, which keeps the existing YAML format of the lists.
+    Loading reads the snapshot and replays the journal. Thread-safe.
+    """
+
+    def __init__(self, path, sync_every=64, sync_interval=1.0, compact_threshold=10000):
+        """
+        Parameters:
+        path (str): the YAML snapshot; the journal is written next to it.
+        sync_every (int): fsync the journal after this many changes.
+        sync_interval (float): fsync the journal when the last fsync is older than this, in seconds.
+        compact_threshold (int): journal lines that trigger a compaction.
+        """
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.compact_threshold = compact_threshold
+
+        self._lock = threading.RLock()
+        self._data = self._load()
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+        self._unsynced = 0
+        self._last_sync = monotonic()
+
+    def _load(self):
+        data = dict()
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                # an empty file loads as None
+                data = yaml.load(f, Loader=_YAMLLoader) or dict()
+
+        self._journal_lines = 0
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        # a torn last line after a crash
+                        logger.warning(f"{self.journal_path}: skipping a corrupt line")
+                        continue
+                    if event["op"] == "set":
+                        data[event["id"]] = event["name"]
+                    elif event["op"] == "del":
+                        data.pop(event["id"], None)
+                    self._journal_lines += 1
+        return data
+
+    def _append(self, event):
+        self._journal.write(json.dumps(event, separators=(",", ":")) + "\n")
+        # handed to the os right away, so that a crash of the process loses nothing; fsync is batched
+        self._journal.flush()
+        self._journal_lines += 1
+        self._unsynced += 1
+        if self._unsynced >= self.sync_every or monotonic() - self._last_sync >= self.sync_interval:
+            self._sync()
+        if self._journal_lines >= self.compact_threshold:
+            self.compact()
+
+    def _sync(self):
+        os.fsync(self._journal.fileno())
+        self._unsynced = 0
+        self._last_sync = monotonic()
+
+    def __getitem__(self, user_id):
+        return self._data[user_id]
+
+    def __setitem__(self, user_id, screen_name):
+        with self._lock:
+            if self._data.get(user_id, object()) == screen_name:
+                return
+            self._data[user_id] = screen_name
+            self._append({"op": "set", "id": user_id, "name": screen_name})
+
+    def __delitem__(self, user_id):
+        with self._lock:
+            del self._data[user_id]
+            self._append({"op": "del", "id": user_id})
+
+    def __contains__(self, user_id):
+        return user_id in self._data
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._data))
+
+    def remove_many(self, user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                if user_id in self._data:
+                    del self[user_id]
+
+    def __len__(self):
+        return len(self._data)
+
+    def compact(self):
+        """
+        Write the current list into the snapshot and empty the journal.
+        """
+        with self._lock:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                yaml.dump(self._data, f, Dumper=_YAMLDumper)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            # replaying the old journal on the new snapshot would be harmless, so a crash before the truncation is fine
+            self._journal.close()
+            self._journal = open(self.journal_path, "w", encoding="utf-8")
+            self._journal_lines = 0
+            self._unsynced = 0
+            self._last_sync = monotonic()
+
+    def flush(self):
+        with self._lock:
+            self._journal.flush()
+            self._sync()
+
+    def close(self):
+        with self._lock:
+            if self._journal.closed:
+                return
+            self.flush()
+            self._journal.close()
+
+
+class SQLiteListStore:
+    """
+    Block, white and mute lists in one SQLite database.
+
+    Membership checks are primary key lookups, so nothing is loaded into memory. The database is in WAL mode, so several threads and processes can read while one writes.
+    Every thread uses its own connection.
+    """
+
+    def __init__(self, db_path, timeout=30):
+        """
+        Parameters:
+        db_path (str): the database file, created if missing.
+        timeout (float): seconds to wait for the lock of another writer.
+        """
+        self.db_path = db_path
+        self.timeout = timeout
+        self._local = threading.local()
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS lists
+            (list text, user_id integer, screen_name text, PRIMARY KEY (list, user_id))
+            WITHOUT ROWID
+            """
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # autocommit; bulk changes open their own transaction
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def list(self, name):
+        """
+        Returns the SQLiteList view of the named list, e.g. "block", "white" or "mute".
+        """
+        return SQLiteList(self, name)
+
+    def import_yaml(self, name, yaml_path):
+        """
+        Add the entries of a user_id -> screen_name yaml file to the named list.
+
+        Returns:
+        int: the number of entries read.
+        """
+        with open(yaml_path, "r") as f:
+            entries = yaml.load(f, Loader=_YAMLLoader) or dict()
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN")
+            conn.executemany(
+                "INSERT OR REPLACE INTO lists (list, user_id, screen_name) VALUES (?, ?, ?)",
+                ((name, int(user_id), screen_name) for user_id, screen_name in entries.items()),
+            )
+        return len(entries)
+
+    def export_yaml(self, name, yaml_path):
+        """
+        Write the named list to a yaml file in the format of the block and white lists.
+        """
+        tmp_path = yaml_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            yaml.dump(dict(self.list(name).items()), f, Dumper=_YAMLDumper)
+        os.replace(tmp_path, yaml_path)
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class SQLiteList(MutableMapping):
+    """
+    A user_id -> screen_name mapping backed by one list of a SQLiteListStore.
+    """
+
+    def __init__(self, store, name):
+        self.store = store
+        self.name = name
+
+    def __getitem__(self, user_id):
+        row = self.store._conn().execute("SELECT screen_name FROM lists WHERE list = ? AND user_id = ?", (self.name, int(user_id))).fetchone()
+        if row is None:
+            raise KeyError(user_id)
+        return row[0]
+
+    def __setitem__(self, user_id, screen_name):
+        self.store._conn().execute("INSERT OR REPLACE INTO lists (list, user_id, screen_name) VALUES (?, ?, ?)", (self.name, int(user_id), screen_name))
+
+    def __delitem__(self, user_id):
+        cursor = self.store._conn().execute("DELETE FROM lists WHERE list = ? AND user_id = ?", (self.name, int(user_id)))
+        if cursor.rowcount == 0:
+            raise KeyError(user_id)
+
+    def update(self, entries):
+        """
+        Add or replace many entries in one transaction.
+        """
+        items = entries.items() if hasattr(entries, "items") else entries
+        conn = self.store._conn()
+        with conn:
+            conn.execute("BEGIN")
+            conn.executemany(
+                "INSERT OR REPLACE INTO lists (list, user_id, screen_name) VALUES (?, ?, ?)",
+                ((self.name, int(user_id), screen_name) for user_id, screen_name in items),
+            )
+
+    def remove_many(self, user_ids):
+        """
+        Remove many entries in one transaction; missing ones are ignored.
+        """
+        conn = self.store._conn()
+        with conn:
+            conn.execute("BEGIN")
+            conn.executemany("DELETE FROM lists WHERE list = ? AND user_id = ?", ((self.name, int(user_id)) for user_id in user_ids))
+
+    def __contains__(self, user_id):
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            return False
+        return self.store._conn().execute("SELECT 1 FROM lists WHERE list = ? AND user_id = ?", (self.name, user_id)).fetchone() is not None
+
+    def __iter__(self):
+        for (user_id,) in self.store._conn().execute("SELECT user_id FROM lists WHERE list = ? ORDER BY user_id", (self.name,)):
+            yield user_id
+
+    def items(self):
+        return self.store._conn().execute("SELECT user_id, screen_name FROM lists WHERE list = ? ORDER BY user_id", (self.name,)).fetchall()
+
+    def __len__(self):
+        return self.store._conn().execute("SELECT COUNT(*) FROM lists WHERE list = ?", (self.name,)).fetchone()[0]
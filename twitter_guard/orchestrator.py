@@ -0,0 +1,225 @@
+"""
+Runs the notification cycles of many protected accounts in one process.
+
+The accounts share the connection pools, the endpoint latency statistics, the guest session and the login-free lookup caches, while every account keeps its own session, cookies, lists, circuit breakers and rate limit governor.
+
+Example accounts file:
+    defaults:
+      interval: 60
+      block: true
+    accounts:
+      - name: alice
+        cookie_path: alice/cookies.txt
+        config_path: alice/config.yaml
+        block_list_path: alice/block_list.yaml
+      - name: bob
+        cookie_path: bob/cookies.txt
+
+    python -m twitter_guard.orchestrator accounts.yaml --workers 4
+"""
+import heapq
+import random
+import argparse
+import itertools
+import threading
+from time import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .apifree_bot import TwitterBot
+from .session import CustomSession, shared_pools
+from .timeouts import AdaptiveTimeouts
+from .governor import RateGovernor
+from .utils import load_yaml
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATIONS_ENDPOINT = "/2/notifications/all.json"
+
+# the longest pause after repeated failures of an account, in seconds
+MAX_FAILURE_DELAY = 900
+
+
+class Account:
+    def __init__(self, name, bot, governor, interval=60, block=True, update_remote_cursor=False):
+        self.name = name
+        self.bot = bot
+        self.governor = governor
+        self.interval = interval
+        self.block = block
+        self.update_remote_cursor = update_remote_cursor
+
+        self.cycles = 0
+        self.failures = 0
+        self.next_run = 0
+        self.last_error = None
+
+    def stats(self):
+        return {
+            "cycles": self.cycles,
+            "failures": self.failures,
+            "next_run": self.next_run,
+            "last_error": self.last_error,
+            "rate_limits": self.governor.snapshot(),
+        }
+
+
+class Orchestrator:
+    """
+    A shared scheduler running check_notifications of every account on a pool of worker threads.
+
+    At most one cycle per account is in flight at any time, as required by the TwitterBot thread-safety contract.
+    An account whose notifications rate limit is used up is postponed until the window resets, and failing accounts back off exponentially without delaying the others.
+    """
+
+    def __init__(self, workers=4, timeouts=None, pools=None):
+        """
+        Parameters:
+        workers (int): the number of account cycles running at the same time.
+        timeouts (AdaptiveTimeouts): shared by all the accounts, the latencies depend on the endpoint, not on the account. (optional)
+        pools (ConnectionPools): the connection pools of all the accounts. (optional) defaults to session.shared_pools.
+        """
+        self.workers = workers
+        self.timeouts = timeouts if timeouts is not None else AdaptiveTimeouts()
+        self.pools = pools if pools is not None else shared_pools
+        self.accounts = dict()
+
+        self._queue = []
+        # tie breaker for accounts due at the same time
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._executor = None
+        self._thread = None
+
+    def add_account(self, name, cookie_path, config_path=None, white_list_path=None, block_list_path=None, backup_log_path=None, verdict_cache_path=None, interval=60, block=True, update_remote_cursor=False):
+        """
+        Log in an account (from its cookie file) and schedule its cycles.
+
+        Parameters:
+        name (str): a unique label of the account, used in the logs and stats.
+        interval (float): seconds between two notification checks of the account.
+        block (bool): block the users judged as bad.
+        update_remote_cursor (bool): mark the notifications as read after every cycle.
+
+        The other parameters are the ones of TwitterBot.
+        """
+        if name in self.accounts:
+            raise ValueError(f"duplicate account {name}")
+
+        governor = RateGovernor()
+        session = CustomSession(timeouts=self.timeouts, pools=self.pools, governor=governor)
+        bot = TwitterBot(
+            cookie_path=cookie_path,
+            config_path=config_path,
+            white_list_path=white_list_path,
+            block_list_path=block_list_path,
+            backup_log_path=backup_log_path,
+            verdict_cache_path=verdict_cache_path,
+            session=session,
+        )
+        account = Account(name, bot, governor, interval=interval, block=block, update_remote_cursor=update_remote_cursor)
+        self.accounts[name] = account
+        # spread the first cycles, so that the accounts do not poll in lockstep
+        self._schedule(account, time() + random.uniform(0, min(interval, 30)))
+        return account
+
+    @classmethod
+    def from_yaml(cls, path, workers=4):
+        """
+        Create an orchestrator for the accounts listed in a yaml file, see the module docstring.
+        An account that cannot be loaded is logged and skipped.
+        """
+        spec = load_yaml(path) or dict()
+        defaults = spec.get("defaults") or dict()
+        orchestrator = cls(workers=workers)
+        for i, entry in enumerate(spec.get("accounts") or []):
+            options = {**defaults, **entry}
+            name = options.pop("name", None) or f"account_{i}"
+            try:
+                orchestrator.add_account(name, **options)
+            except Exception:
+                logger.exception(f"{name}: cannot load the account, skipped")
+        return orchestrator
+
+    def _schedule(self, account, when):
+        account.next_run = when
+        with self._condition:
+            heapq.heappush(self._queue, (when, next(self._sequence), account))
+            self._condition.notify()
+
+    def _run_cycle(self, account):
+        wait = account.governor.wait_time(NOTIFICATIONS_ENDPOINT)
+        if wait > 0:
+            logger.info(f"{account.name}: notifications rate limit used up, postponed by {wait:.0f}s")
+            self._schedule(account, time() + wait)
+            return
+
+        delay = account.interval
+        try:
+            account.bot.check_notifications(block=account.block, update_remote_cursor=account.update_remote_cursor)
+            account.cycles += 1
+            account.failures = 0
+            account.last_error = None
+        except Exception as e:
+            account.failures += 1
+            account.last_error = repr(e)
+            delay = min(account.interval * 2**account.failures, MAX_FAILURE_DELAY)
+            logger.exception(f"{account.name}: cycle failed, next try in {delay:.0f}s")
+        finally:
+            if not self._stopping:
+                self._schedule(account, time() + delay)
+
+    def _loop(self):
+        while True:
+            with self._condition:
+                while not self._stopping and (not self._queue or self._queue[0][0] > time()):
+                    timeout = self._queue[0][0] - time() if self._queue else None
+                    self._condition.wait(timeout)
+                if self._stopping:
+                    return
+                _, _, account = heapq.heappop(self._queue)
+            self._executor.submit(self._run_cycle, account)
+
+    def start(self):
+        self._stopping = False
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="account")
+        self._thread = threading.Thread(target=self._loop, name="orchestrator", daemon=True)
+        self._thread.start()
+
+    def stop(self, wait=True):
+        """
+        Stop scheduling. With wait, the running cycles are finished first.
+        """
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+
+    def run_forever(self):
+        self.start()
+        try:
+            while self._thread.is_alive():
+                self._thread.join(1)
+        except KeyboardInterrupt:
+            logger.info("stopping")
+        finally:
+            self.stop()
+
+    def stats(self):
+        return {name: account.stats() for name, account in self.accounts.items()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="run the notification cycles of many accounts in one process")
+    parser.add_argument("accounts", help="the yaml file listing the accounts")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    Orchestrator.from_yaml(args.accounts, workers=args.workers).run_forever()
@@ -0,0 +1,186 @@
+import queue
+import threading
+from time import sleep
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# marks the end of the input of a stage
+_DONE = object()
+
+
+class Batch:
+    """
+    The users of one run() and what became of them.
+    """
+
+    def __init__(self, act=True):
+        self.act = act
+        # user_id -> "good" or "bad"
+        self.judgements = dict()
+        # user_id -> status code of the action, None if it raised
+        self.actions = dict()
+        # users submitted but not judged yet, or judged bad and not acted on yet
+        self._pending = 0
+        self._cond = threading.Condition()
+
+    def _add(self):
+        with self._cond:
+            self._pending += 1
+
+    def _finish(self):
+        with self._cond:
+            self._pending -= 1
+            if self._pending == 0:
+                self._cond.notify_all()
+
+    def wait(self):
+        """
+        Wait until every user of the batch is judged and every action is sent.
+        """
+        with self._cond:
+            while self._pending:
+                self._cond.wait()
+
+
+class JudgeActPipeline:
+    """
+    Judges users and acts on the bad ones in two stages connected by bounded queues.
+
+    One thread judges the submitted users in order, while a pool of worker threads sends the actions (e.g. blocks), so a slow request never holds up the judging.
+    Both queues are bounded: submit() blocks when the judge is behind, and the judge blocks when every worker is busy and the action queue is full.
+    close() lets both stages drain and waits until every queued action has been sent.
+
+    The threads are meant to live as long as their owner: run() judges a batch of users and returns when the batch is done, so one pipeline serves any number of batches.
+    """
+
+    def __init__(self, judge, act=None, skip=None, act_workers=8, queue_size=64, governor=None, endpoint=None):
+        """
+        Parameters:
+        judge (callable): takes (user_id, user) and returns True for a bad user.
+        act (callable): takes a user_id and returns the status code of the action; None only judges. (optional)
+        skip (callable): takes a user_id and returns True for users that should not be judged at all. (optional)
+        act_workers (int): the maximum number of actions in flight.
+        queue_size (int): the capacity of each queue.
+        governor (RateGovernor): the rate limits of the account; the workers wait for the endpoint window instead of failing fast. (optional)
+        endpoint (str): the endpoint name of the action, as known to the governor. (optional)
+        """
+        self.judge = judge
+        self.act = act
+        self.skip = skip
+        self.governor = governor
+        self.endpoint = endpoint
+
+        # the users of submit(); judgements and actions are those of this batch
+        self._batch = Batch()
+        self.judgements = self._batch.judgements
+        self.actions = self._batch.actions
+
+        self._judge_queue = queue.Queue(maxsize=queue_size)
+        self._act_queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._closed = False
+
+        self._judge_thread = threading.Thread(target=self._judge_loop, name="judge", daemon=True)
+        self._judge_thread.start()
+        self._workers = []
+        if act is not None:
+            for i in range(act_workers):
+                worker = threading.Thread(target=self._act_loop, name=f"act-{i}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    def submit(self, user_id, user):
+        """
+        Queue a user for judging. Blocks while the queue is full.
+        """
+        self._put(user_id, user, self._batch)
+
+    def run(self, users, act=True):
+        """
+        Judge a batch of users and wait until they are judged and their actions are sent.
+        Several threads may run batches at once; each gets back only its own users.
+
+        Parameters:
+        users (dict): user_id -> user.
+        act (bool): False only judges the batch.
+
+        Returns:
+        Batch: the judgements and the actions of the batch.
+        """
+        batch = Batch(act=act)
+        for user_id in users:
+            self._put(user_id, users[user_id], batch)
+        batch.wait()
+        return batch
+
+    def _put(self, user_id, user, batch):
+        if self._closed:
+            raise RuntimeError("the pipeline is closed")
+        batch._add()
+        self._judge_queue.put((user_id, user, batch))
+
+    def _judge_loop(self):
+        try:
+            while True:
+                item = self._judge_queue.get()
+                if item is _DONE:
+                    break
+                user_id, user, batch = item
+                try:
+                    if user_id in batch.judgements or (self.skip is not None and self.skip(user_id)):
+                        batch._finish()
+                        continue
+                    is_bad = self.judge(user_id, user)
+                except Exception:
+                    logger.exception(f"judging {user_id} failed")
+                    batch._finish()
+                    continue
+                batch.judgements[user_id] = "bad" if is_bad else "good"
+                if is_bad and batch.act and self.act is not None:
+                    self._act_queue.put((user_id, batch))
+                else:
+                    batch._finish()
+        finally:
+            # the workers stop even if the judging dies, so close() does not hang
+            for _ in self._workers:
+                self._act_queue.put(_DONE)
+
+    def _act_loop(self):
+        while True:
+            item = self._act_queue.get()
+            if item is _DONE:
+                return
+            user_id, batch = item
+            if self.governor is not None and self.endpoint is not None:
+                wait = self.governor.wait_time(self.endpoint)
+                if wait > 0:
+                    logger.info(f"{self.endpoint}: rate limit used up, actions paused for {wait:.0f}s")
+                    sleep(wait)
+            try:
+                status_code = self.act(user_id)
+            except Exception as e:
+                logger.warning(f"{self.endpoint} {user_id}: {e!r}")
+                status_code = None
+            with self._lock:
+                batch.actions[user_id] = status_code
+            batch._finish()
+
+    def close(self):
+        """
+        Stop accepting users, then wait until every submitted user is judged and every action is sent.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._judge_queue.put(_DONE)
+        self._judge_thread.join()
+        for worker in self._workers:
+            worker.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,196 @@
+import os
+import json
+import heapq
+from array import array
+from time import time
+from dataclasses import dataclass, field
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def sorted_difference(a, b):
+    """
+    Compare two sorted sequences of unique ids in one pass.
+
+    Returns:
+    Tuple: the ids only in a, and the ids only in b, both sorted.
+    """
+    only_a, only_b = [], []
+    i, j = 0, 0
+    len_a, len_b = len(a), len(b)
+    while i < len_a and j < len_b:
+        x, y = a[i], b[j]
+        if x == y:
+            i += 1
+            j += 1
+        elif x < y:
+            only_a.append(x)
+            i += 1
+        else:
+            only_b.append(y)
+            j += 1
+    only_a.extend(a[i:])
+    only_b.extend(b[j:])
+    return only_a, only_b
+
+
+def sorted_union(a, b):
+    """
+    Merge two sorted sequences of unique ids into one sorted array without duplicates.
+    """
+    merged = array("q")
+    last = None
+    for x in heapq.merge(a, b):
+        if x != last:
+            merged.append(x)
+            last = x
+    return merged
+
+
+@dataclass
+class ReconcileReport:
+    # whether the whole remote block list was enumerated
+    full: bool
+    # remote blocks found since the last sync
+    new_remote: int = field(default=0)
+    # users blocked on twitter but missing from the local list
+    only_remote: list = field(default_factory=list)
+    # users in the local list but not blocked on twitter
+    only_local: list = field(default_factory=list)
+    # users fetched from BlockedAccountsAll
+    fetched: int = field(default=0)
+
+
+class BlockListReconciler:
+    """
+    Keeps the local block list of a TwitterBot in sync with the block list of the account.
+
+    BlockedAccountsAll lists the most recent blocks first. The sorted ids of the last sync and the most recent ids at that time are stored in a snapshot,
+    so an incremental sync only pages until it reaches the previously synced prefix, and the comparison with the local list is a merge of two sorted arrays.
+    Remote unblocks of older entries are only noticed by a full sync.
+    A sync whose paging is cut short (e.g. throttled) raises before anything is changed, since a partial list would look like remote unblocks.
+    """
+
+    def __init__(self, bot, snapshot_path, head_size=20):
+        """
+        Parameters:
+        bot (TwitterBot): the account to reconcile.
+        snapshot_path (str): where the ids of the last sync are stored; the metadata goes to snapshot_path.json.
+        head_size (int): the number of most recent ids remembered to recognize the synced prefix.
+        """
+        self.bot = bot
+        self.snapshot_path = snapshot_path
+        self.meta_path = snapshot_path + ".json"
+        self.head_size = head_size
+
+    def _load_snapshot(self):
+        if not (os.path.exists(self.snapshot_path) and os.path.exists(self.meta_path)):
+            return None, []
+        ids = array("q")
+        with open(self.snapshot_path, "rb") as f:
+            ids.frombytes(f.read())
+        with open(self.meta_path, "r") as f:
+            meta = json.load(f)
+        return ids, meta["head"]
+
+    def _save_snapshot(self, ids, head):
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            ids.tofile(f)
+        os.replace(tmp_path, self.snapshot_path)
+
+        tmp_path = self.meta_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"head": head, "count": len(ids), "synced_at": time()}, f)
+        os.replace(tmp_path, self.meta_path)
+
+    def _fetch(self, head):
+        """
+        Page through the remote block list until the synced prefix is recognized.
+        When the prefix changed, the paging goes on to the end of the list, so the pages already fetched are kept for the full sync.
+
+        Returns:
+        Tuple: the ids in remote order, their screen names, and whether the prefix was found; without the prefix, the ids are the whole list.
+
+        Raises:
+        requests.exceptions.HTTPError: a page failed, the ids are incomplete.
+        """
+        ids, names = [], dict()
+        blocked = self.bot.get_blocked(strict=True)
+        # the users matching the start of the prefix so far
+        matching = []
+        for user in blocked:
+            if head and user.user_id == head[len(matching)]:
+                matching.append(user)
+                if len(matching) == len(head):
+                    blocked.close()
+                    return ids, names, True
+                continue
+            if matching:
+                # the prefix changed (e.g. an unblock among the recent entries), enumerate everything instead
+                logger.info("synced prefix changed, falling back to a full sync")
+                head = []
+            for listed in matching + [user]:
+                ids.append(listed.user_id)
+                names[listed.user_id] = listed.screen_name
+            matching = []
+        # the list ended before the whole prefix was seen
+        for listed in matching:
+            ids.append(listed.user_id)
+            names[listed.user_id] = listed.screen_name
+        return ids, names, False
+
+    def reconcile(self, full=False, push_local=False, max_workers=8):
+        """
+        Sync the snapshot with the remote block list, then fix the differences with the local list.
+
+        Parameters:
+        full (bool): enumerate the whole remote block list instead of stopping at the synced prefix.
+        push_local (bool): block the users that are only in the local list; otherwise they are removed from the local list.
+        max_workers (int): the concurrency of the bulk block requests.
+
+        Returns:
+        ReconcileReport: what was found and fixed.
+
+        Raises:
+        requests.exceptions.HTTPError: the remote block list could not be enumerated; neither the lists nor the snapshot were changed.
+        """
+        snapshot, head = self._load_snapshot()
+
+        incremental = not full and snapshot is not None and head
+        new_ids, names, found_prefix = self._fetch(head if incremental else [])
+
+        if found_prefix:
+            remote = sorted_union(snapshot, sorted(set(new_ids)))
+            report = ReconcileReport(full=False, new_remote=len(new_ids), fetched=len(new_ids))
+            new_head = (new_ids + head)[: self.head_size]
+        else:
+            remote = array("q", sorted(set(new_ids)))
+            report = ReconcileReport(full=True, new_remote=len(new_ids) if snapshot is None else len(sorted_difference(remote, snapshot)[0]), fetched=len(new_ids))
+            new_head = new_ids[: self.head_size]
+
+        local_list = self.bot._block_list
+        local = sorted(int(user_id) for user_id in local_list)
+        report.only_local, report.only_remote = sorted_difference(local, remote)
+
+        if report.only_remote:
+            # a single transaction for SQLiteList
+            local_list.update({user_id: names.get(user_id) for user_id in report.only_remote})
+
+        if report.only_local:
+            if push_local:
+                results = self.bot.block_users(report.only_local, max_workers=max_workers, skip_listed=False)
+                remote = sorted_union(remote, [user_id for user_id, result in results.items() if result.status == "done"])
+            elif hasattr(local_list, "remove_many"):
+                local_list.remove_many(report.only_local)
+            else:
+                for user_id in report.only_local:
+                    local_list.pop(user_id, None)
+
+        self._save_snapshot(remote, new_head)
+        logger.info(
+            f"block list reconciled ({'full' if report.full else 'incremental'}): {report.fetched} fetched, {len(report.only_remote)} added locally, {len(report.only_local)} only local"
+        )
+        return report
@@ -1,6 +1,9 @@
 import os
 import json
+import queue
 import sqlite3
+import threading
+from concurrent import futures
 from .utils import *
 from .apifree_bot import TwitterBot
 import traceback
@@ -8,9 +11,65 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# posts with a smaller id predate snowflake ids, their time is taken from created_at
+SNOWFLAKE_MIN_ID = 1 << 40
+
+# the statements bringing the schema from version n - 1 to version n, applied in order
+MIGRATIONS = [
+    (
+        1,
+        [
+            # integer epochs, so that time ranges and ordering use an index instead of comparing text
+            "ALTER TABLE posts ADD COLUMN created_at_epoch integer",
+            "ALTER TABLE users ADD COLUMN created_at_epoch integer",
+            f"""
+            UPDATE posts SET created_at_epoch = CASE
+            WHEN post_id >= {SNOWFLAKE_MIN_ID} THEN ((post_id >> 22) + 1288834974657) / 1000
+            ELSE CAST(strftime('%s', created_at) AS integer) END
+            """,
+            "UPDATE users SET created_at_epoch = CAST(strftime('%s', created_at) AS integer)",
+            "CREATE INDEX IF NOT EXISTS posts_account_id ON posts (account_id, created_at_epoch)",
+            "CREATE INDEX IF NOT EXISTS posts_created_at_epoch ON posts (created_at_epoch)",
+            "CREATE INDEX IF NOT EXISTS posts_query ON posts (query)",
+            "CREATE INDEX IF NOT EXISTS users_screen_name ON users (screen_name)",
+            "CREATE INDEX IF NOT EXISTS users_account_status ON users (account_status)",
+        ],
+    ),
+    (
+        2,
+        [
+            # the highest post id recorded per query, sent as since_id so that the search only returns newer posts
+            "ALTER TABLE queries ADD COLUMN max_post_id integer",
+            "UPDATE queries SET max_post_id = (SELECT MAX(post_id) FROM posts WHERE posts.query = queries.query)",
+        ],
+    ),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def snowflake_id_from_timestamp(timestamp):
+    """
+    The highest snowflake id that can be generated within the second of the unix timestamp.
+    """
+    return ((int(timestamp) * 1000 + 999 - 1288834974657) << 22) | ((1 << 22) - 1)
+
+
+def post_epoch(post_id, created_at):
+    if post_id >= SNOWFLAKE_MIN_ID:
+        return int(snowflake_id_to_unix_timestamp(post_id))
+    return int(sns_timestamp_to_utc_datetime(created_at).timestamp())
+
+
 class Recorder:
-    def __init__(self, db_path):
+    def __init__(self, db_path, batch_size=200):
+        """
+        Parameters:
+        db_path (str): the SQLite database, created if missing.
+        batch_size (int): the number of tweets written per transaction by record.
+        """
         self.db_path = db_path
+        self.batch_size = batch_size
         self._create_db()
 
     def _create_table(self, create_table_sql):
@@ -29,6 +88,9 @@ class Recorder:
 
         self.conn = sqlite3.connect(self.db_path)
         self.conn.row_factory = sqlite3.Row
+        # commits of the WAL are not fsynced, the database stays consistent but the last commits can be lost in a power failure
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
         self._cursor = self.conn.cursor()
 
         create_queries_table_sql = """
@@ -64,120 +126,299 @@ class Recorder:
 
         # self._cursor.execute(drop_suspended_column_sql)
 
-    def record(self, bot, query):
-        """
-        Collect results incrementally
-        """
-        #results = TwitterBot.search_timeline(query)
-        results = bot.search_timeline(query)
+        self._migrate()
 
-        self._cursor.execute("SELECT rowid, latest_result_date from queries WHERE query = (?)", (query,))
-        self.conn.commit()
+    def _schema_version(self):
+        self._cursor.execute("CREATE TABLE IF NOT EXISTS schema_version (version integer)")
+        row = self._cursor.execute("SELECT version FROM schema_version").fetchone()
+        return row[0] if row is not None else 0
 
+    def _migrate(self):
+        """
+        Apply the migrations newer than the version of the database, each in its own transaction.
+        """
+        version = self._schema_version()
+        # sqlite3 only opens a transaction implicitly before DML, an ALTER TABLE would be committed on its own;
+        # the transactions are explicit, so that a failed migration leaves no column behind
+        isolation_level = self.conn.isolation_level
+        self.conn.isolation_level = None
+        try:
+            for target, statements in MIGRATIONS:
+                if target <= version:
+                    continue
+                logger.info(f"{self.db_path}: migrating the schema to version {target}")
+                self._cursor.execute("BEGIN")
+                try:
+                    for statement in statements:
+                        self._cursor.execute(statement)
+                    self._cursor.execute("DELETE FROM schema_version")
+                    self._cursor.execute("INSERT INTO schema_version VALUES (?)", (target,))
+                except BaseException:
+                    self._cursor.execute("ROLLBACK")
+                    raise
+                self._cursor.execute("COMMIT")
+                version = target
+        finally:
+            self.conn.isolation_level = isolation_level
+
+    def _query_watermark(self, query):
+        """
+        The highest post id recorded for the query, or None for a new query; a new query is added to the queries table.
+        """
+        self._cursor.execute("SELECT rowid, latest_result_date, max_post_id from queries WHERE query = (?)", (query,))
         query_record = self._cursor.fetchall()
 
-        # if the query is not new, get the timestamp for the latest post previously seen
+        max_post_id = None
         if len(query_record) != 0:
-            latest_result_date = query_record[0][1]
+            latest_result_date, max_post_id = query_record[0][1], query_record[0][2]
+            if max_post_id is None and latest_result_date != "1970-01-01T00:00:00+00:00":
+                # recorded before the ids were tracked, every post up to the latest date has been seen
+                max_post_id = snowflake_id_from_timestamp(sns_timestamp_to_utc_datetime(latest_result_date).timestamp())
         else:
-            latest_result_date = "1970-01-01T00:00:00+00:00"
-            self._cursor.execute("INSERT INTO queries VALUES (?,?)", (query, "1970-01-01T00:00:00+00:00"))
-            
+            self._cursor.execute("INSERT INTO queries (query, latest_result_date) VALUES (?,?)", (query, "1970-01-01T00:00:00+00:00"))
+        self.conn.commit()
+        return max_post_id
 
-        recorded_latest_timestamp = sns_timestamp_to_utc_datetime(latest_result_date) #2023-04-16T01:19:29+00:00
+    @staticmethod
+    def _search_query(query, max_post_id):
+        if max_post_id is None:
+            return query
+        return f"{query} since_id:{max_post_id}"
 
-        count = 0
-        for tweet in results:
-            # print(content)
-            user = tweet.user
-            user_id = int(user.user_id)
-            screen_name = user.screen_name
-            created_at = user.created_at
-            following_count = user.following_count
-            followers_count = user.followers_count
-            tweet_count = user.tweet_count
-            favourites_count = user.favourites_count
-            media_count = user.media_count
-
-            # tweet information
-            text_raw = tweet.text
-            post_id = tweet.tweet_id
-            posted_at = tweet.created_at
-            source = tweet.source
-
-            if get_source_label(source) != "Twitter Web App":
-                logger.info(f"{source:.>100}")
-
-            timestamp = sns_timestamp_to_utc_datetime(posted_at)
-            # if latest post in the current search
-            if count == 0:
-                # update the table if unseen
-                if timestamp > recorded_latest_timestamp:
-                    logger.info("new data seen!")
-                    self._cursor.execute("UPDATE queries SET latest_result_date=? WHERE query=?", (posted_at, query))
-
-            # compare the current timestamp with the recorded latest timestamp
-            if timestamp <= recorded_latest_timestamp:
-                logger.info(f"counter: {count}, reaches the point of last search")
-                break
-
-            logger.info(f"counter: {count:<6} timestamp: {posted_at:<25} user:{screen_name:<16} text: {text_raw}")
-
-            # tweet statistics
-            if tweet.view_count is not None:
-                view_count = tweet.view_count
-            else:
-                view_count = None
-            reply_count = tweet.reply_count
-            retweet_count = tweet.retweet_count
-            like_count = tweet.favorite_count
-            quote_count = tweet.quote_count
-
-            self._cursor.execute(
-                "INSERT OR REPLACE INTO users VALUES (?,?,?,?,?,?,?,?,?,?)",
-                (
-                    user_id,
-                    screen_name,
-                    created_at,
-                    following_count,
-                    followers_count,
-                    tweet_count,
-                    favourites_count,
-                    media_count,
-                    post_id,
-                    "normal",
-                ),
-            )
+    @staticmethod
+    def _tweet_rows(tweet, query):
+        """
+        Returns:
+        Tuple: the users row and the posts row of a tweet.
+        """
+        user = tweet.user
+        user_row = (
+            int(user.user_id),
+            user.screen_name,
+            user.created_at,
+            user.following_count,
+            user.followers_count,
+            user.tweet_count,
+            user.favourites_count,
+            user.media_count,
+            tweet.tweet_id,
+            "normal",
+            int(sns_timestamp_to_utc_datetime(user.created_at).timestamp()) if user.created_at else None,
+        )
+        post_row = (
+            tweet.tweet_id,
+            int(user.user_id),
+            tweet.created_at,
+            tweet.source,
+            tweet.reply_count,
+            tweet.retweet_count,
+            tweet.favorite_count,
+            tweet.quote_count,
+            tweet.view_count,
+            query,
+            tweet.text,
+            post_epoch(int(tweet.tweet_id), tweet.created_at),
+        )
+        return user_row, post_row
+
+    def record(self, bot, query):
+        """
+        Collect results incrementally
 
-            self._cursor.execute(
-                "UPDATE posts SET reply_count=?, retweet_count=?, like_count=?, quote_count=?, view_count=? WHERE post_id=?",
-                (reply_count, retweet_count, like_count, quote_count, view_count, post_id),
+        The watermark only moves when the search was paged to its end; when a page fails, the posts collected so far are kept and the error is raised, so the query is fetched again next time.
+        """
+        max_post_id = self._query_watermark(query)
+        #results = TwitterBot.search_timeline(query)
+        results = bot.search_timeline(self._search_query(query, max_post_id), strict=True)
+
+        user_rows, post_rows = [], []
+        newest = None
+        count = 0
+        try:
+            for tweet in results:
+                post_id = int(tweet.tweet_id)
+                posted_at = tweet.created_at
+                source = tweet.source
+
+                if get_source_label(source) != "Twitter Web App":
+                    logger.info(f"{source:.>100}")
+
+                # since_id already filters on the server, this only guards against results it let through
+                if max_post_id is not None and post_id <= max_post_id:
+                    logger.info(f"counter: {count}, reaches the point of last search")
+                    break
+
+                if newest is None or post_id > newest[0]:
+                    if newest is None:
+                        logger.info("new data seen!")
+                    newest = (post_id, posted_at)
+
+                logger.info(f"counter: {count:<6} timestamp: {posted_at:<25} user:{tweet.user.screen_name:<16} text: {tweet.text}")
+
+                user_row, post_row = self._tweet_rows(tweet, query)
+                user_rows.append(user_row)
+                post_rows.append(post_row)
+
+                count += 1
+                if len(post_rows) >= self.batch_size:
+                    self._write_batch(user_rows, post_rows)
+                    user_rows, post_rows = [], []
+        except BaseException:
+            # keep what was collected before the error, without moving the watermark
+            self._write_batch(user_rows, post_rows)
+            raise
+
+        # the watermark only moves with the last batch of a complete search
+        query_rows = [(newest[1], newest[0], query)] if newest is not None else []
+        self._write_batch(user_rows, post_rows, query_rows=query_rows)
+
+    def record_many(self, bot, queries, max_workers=8, queue_size=2000, flush_interval=0.5):
+        """
+        Record several queries at once.
+
+        The searches run concurrently, each on its own thread, and keep fetching their next page while the rows of the previous ones are written.
+        The parsed rows go through a bounded queue to a single writer thread, which writes them in batches of batch_size with its own connection.
+        The watermark (max_post_id) of a query is only advanced after its rows, so an interrupted query is fetched again next time.
+        When the writer fails, the searches stop and every query whose rows may not have been written is reported as failed.
+
+        Parameters:
+        bot (TwitterBot): the account used for the searches.
+        queries (list): the search queries.
+        max_workers (int): the number of searches running at the same time.
+        queue_size (int): the number of rows waiting for the writer before the searches are held back.
+        flush_interval (float): a partial batch is written once no row arrived for this long, in seconds.
+
+        Returns:
+        dict: the number of new posts of every query, None for the queries that failed.
+        """
+        watermarks = {query: self._query_watermark(query) for query in queries}
+        rows = queue.Queue(maxsize=queue_size)
+        writer_failed = threading.Event()
+        # the queries whose watermark has been committed
+        written = set()
+        writer = threading.Thread(target=self._writer_loop, args=(rows, flush_interval, writer_failed, written), name="recorder-writer", daemon=True)
+        writer.start()
+
+        def put(item):
+            while True:
+                if writer_failed.is_set():
+                    raise RuntimeError("the recorder writer failed")
+                try:
+                    rows.put(item, timeout=flush_interval)
+                    return
+                except queue.Full:
+                    pass
+
+        def fetch(query):
+            max_post_id = watermarks[query]
+            newest = None
+            count = 0
+            # a failed page raises, so the query is reported as failed and its watermark is not queued
+            for tweet in bot.search_timeline(self._search_query(query, max_post_id), strict=True):
+                post_id = int(tweet.tweet_id)
+                if max_post_id is not None and post_id <= max_post_id:
+                    break
+                if newest is None or post_id > newest[0]:
+                    newest = (post_id, tweet.created_at)
+                put(("post", *self._tweet_rows(tweet, query)))
+                count += 1
+            if newest is not None:
+                # after the rows of the query, so it is written in the same or a later transaction
+                put(("watermark", query, newest))
+            logger.info(f"{query}: {count} new posts")
+            return count
+
+        counts = dict()
+        try:
+            with futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="recorder-search") as executor:
+                running = {executor.submit(fetch, query): query for query in queries}
+                for future in futures.as_completed(running):
+                    query = running[future]
+                    try:
+                        counts[query] = future.result()
+                    except Exception:
+                        logger.exception(f"{query}: recording failed")
+                        counts[query] = None
+        finally:
+            rows.put(None)
+            writer.join()
+
+        if writer_failed.is_set():
+            for query, count in counts.items():
+                if count and query not in written:
+                    counts[query] = None
+        return counts
+
+    def _writer_loop(self, rows, flush_interval, failed, written):
+        """
+        Write the queued rows until None arrives. On an error, failed is set and the queue is drained, so that no search stays blocked on it.
+        """
+        conn = None
+        user_rows, post_rows, query_rows = [], [], []
+        try:
+            conn = sqlite3.connect(self.db_path, timeout=60)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            while True:
+                try:
+                    item = rows.get(timeout=flush_interval)
+                except queue.Empty:
+                    item = ()
+                if item is None:
+                    break
+                if item and item[0] == "post":
+                    user_rows.append(item[1])
+                    post_rows.append(item[2])
+                elif item and item[0] == "watermark":
+                    post_id, posted_at = item[2]
+                    query_rows.append((posted_at, post_id, item[1]))
+
+                if len(post_rows) >= self.batch_size or (not item and (post_rows or query_rows)):
+                    self._write_batch(user_rows, post_rows, conn=conn, query_rows=query_rows)
+                    written.update(query for _, _, query in query_rows)
+                    user_rows, post_rows, query_rows = [], [], []
+            self._write_batch(user_rows, post_rows, conn=conn, query_rows=query_rows)
+            written.update(query for _, _, query in query_rows)
+        except Exception:
+            logger.exception("recorder writer failed, the queued rows are dropped")
+            failed.set()
+            while rows.get() is not None:
+                pass
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def _write_batch(self, user_rows, post_rows, conn=None, query_rows=()):
+        """
+        Write the users and posts of a batch of tweets, and the new watermarks of the queries, in one transaction.
+        """
+        conn = conn if conn is not None else self.conn
+        with conn:
+            conn.executemany(
+                """
+                INSERT OR REPLACE INTO users
+                (user_id, screen_name, created_at, following_count, followers_count, tweet_count, favourites_count, media_count, last_seen_post_id, account_status, created_at_epoch)
+                VALUES (?,?,?,?,?,?,?,?,?,?,?)
+                """,
+                user_rows,
             )
-            self._cursor.execute(
-                "INSERT OR IGNORE INTO posts VALUES (?,?,?,?,?,?,?,?,?,?,?)",
-                (
-                    post_id,
-                    user_id,
-                    posted_at,
-                    source,
-                    reply_count,
-                    retweet_count,
-                    like_count,
-                    quote_count,
-                    view_count,
-                    query,
-                    text_raw,
-                ),
+            # a post seen before only gets its statistics updated
+            conn.executemany(
+                """
+                INSERT INTO posts
+                (post_id, account_id, created_at, source, reply_count, retweet_count, like_count, quote_count, view_count, query, content, created_at_epoch)
+                VALUES (?,?,?,?,?,?,?,?,?,?,?,?)
+                ON CONFLICT(post_id) DO UPDATE SET
+                reply_count=excluded.reply_count, retweet_count=excluded.retweet_count, like_count=excluded.like_count, quote_count=excluded.quote_count, view_count=excluded.view_count
+                """,
+                post_rows,
             )
-            self.conn.commit()
-
-            count += 1
+            conn.executemany("UPDATE queries SET latest_result_date=?, max_post_id=? WHERE query=?", query_rows)
 
     def delete_user(self, screen_name):
         # delete associated posts first
         account_id = TwitterBot.id_from_screen_name(screen_name)
         self._cursor.execute(
-            "DELETE from posts where account_id in (SELECT account_id FROM posts JOIN users ON (posts.account_id=users.user_id) WHERE users.screen_name=?)",
+            "DELETE from posts where account_id in (SELECT user_id FROM users WHERE screen_name=?)",
             (screen_name,),
         )
         # self._cursor.execute("DELETE from posts where account_id=?",(account_id,))
@@ -194,7 +435,7 @@ class Recorder:
     def show_suspended_users(self):
         # all suspended
         self._cursor.execute(
-            "SELECT users.screen_name, users.tweet_count, users.created_at as user_created_at, posts.created_at as last_seen_at FROM posts JOIN users ON (posts.post_id = users.last_seen_post_id) WHERE users.account_status='suspended' ORDER BY posts.created_at"
+            "SELECT users.screen_name, users.tweet_count, users.created_at as user_created_at, posts.created_at as last_seen_at FROM posts JOIN users ON (posts.post_id = users.last_seen_post_id) WHERE users.account_status='suspended' ORDER BY posts.created_at_epoch"
         )
         self.display_fetch()
 
@@ -216,7 +457,7 @@ class Recorder:
     def show_tweets_by_screen_name(self, screen_name):
         display_msg("check_tweets")
         self._cursor.execute(
-            "SELECT users.user_id, users.screen_name, posts.created_at as post_created_at,  posts.source, posts.content FROM (users JOIN posts ON users.user_id = posts.account_id) WHERE users.screen_name=? ORDER BY posts.created_at",
+            "SELECT users.user_id, users.screen_name, posts.created_at as post_created_at,  posts.source, posts.content FROM (users JOIN posts ON users.user_id = posts.account_id) WHERE users.screen_name=? ORDER BY posts.created_at_epoch",
             (screen_name,),
         )
         self.display_fetch()
@@ -239,8 +480,9 @@ class Recorder:
 
         # examine the status of exiting accounts
         # self._cursor.execute("SELECT users.user_id, users.screen_name, posts.created_at FROM (users JOIN posts ON users.last_seen_post_id = posts.post_id) WHERE users.account_status!='suspended' ORDER BY posts.created_at")
+        # 1672531200 is 2023-01-01
         self._cursor.execute(
-            "SELECT users.user_id, users.screen_name, posts.created_at as last_post_created_at, account_status FROM (users JOIN posts ON users.last_seen_post_id = posts.post_id)  WHERE (account_status!='suspended' and account_status!='does_not_exist') AND (posts.created_at>='2023-01-01') ORDER BY posts.created_at"
+            "SELECT users.user_id, users.screen_name, posts.created_at as last_post_created_at, account_status FROM (users JOIN posts ON users.last_seen_post_id = posts.post_id)  WHERE (account_status!='suspended' and account_status!='does_not_exist') AND (posts.created_at_epoch>=1672531200) ORDER BY posts.created_at_epoch"
         )
         # self._cursor.execute("SELECT users.user_id, users.screen_name, users.created_at as user_created_at, posts.created_at as last_post_created_at, posts.source as initially_recorded_source, users.suspended as account_suspended FROM (users JOIN posts ON users.last_seen_post_id = posts.post_id) WHERE (((posts.source LIKE '%easestrategy%') OR (posts.source LIKE '%Ruyitie%'))) ORDER BY posts.created_at")
         for user in self._cursor.fetchall():
@@ -0,0 +1,182 @@
+import random
+import threading
+from time import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+
+
+def throttled_until(response):
+    """
+    The unix timestamp until which the response says the endpoint is throttled, from Retry-After or x-rate-limit-reset. None if unknown.
+    """
+    headers = response.headers
+    retry_after = headers.get("Retry-After")
+    if retry_after:
+        try:
+            return time() + float(retry_after)
+        except ValueError:
+            try:
+                return parsedate_to_datetime(retry_after).astimezone(timezone.utc).timestamp()
+            except (TypeError, ValueError):
+                pass
+
+    reset = headers.get("x-rate-limit-reset")
+    if reset and (response.status_code == 429 or headers.get("x-rate-limit-remaining") == "0"):
+        try:
+            return float(reset)
+        except ValueError:
+            pass
+
+
+class RetryPolicy:
+    """
+    Decides whether and when a response is retried.
+
+    429 responses wait for Retry-After / x-rate-limit-reset when it is known, 5xx and transient 403 responses use full-jitter exponential backoff.
+    """
+
+    def __init__(
+        self,
+        max_attempts=5,
+        backoff_base=0.5,
+        backoff_cap=30,
+        max_wait=60,
+        retry_statuses=(429, 500, 502, 503, 504),
+        transient_403_retries=1,
+    ):
+        """
+        Parameters:
+        max_attempts (int): the maximum number of attempts for one request, including the first one. 1 disables retrying.
+        backoff_base (float): the first backoff step in seconds.
+        backoff_cap (float): the maximum backoff in seconds.
+        max_wait (float): never sleep longer than this for a single retry; a longer throttle fails the request and opens the circuit breaker instead.
+        retry_statuses (tuple): the status codes that are retried; 5xx codes are only retried for idempotent methods.
+        transient_403_retries (int): how many times a 403 is retried.
+        """
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.max_wait = max_wait
+        self.retry_statuses = retry_statuses
+        self.transient_403_retries = transient_403_retries
+
+    def backoff(self, attempt):
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2**attempt))
+
+    def wait_time(self, method, response, attempt):
+        """
+        Returns the seconds to sleep before the next attempt, or None if the response should be returned as is.
+
+        Parameters:
+        method (str): the http method of the request.
+        response (requests.Response): the response of the attempt.
+        attempt (int): 0 for the first attempt.
+        """
+        if attempt + 1 >= self.max_attempts:
+            return None
+
+        status = response.status_code
+        if status == 403:
+            if attempt < self.transient_403_retries:
+                return self.backoff(attempt)
+            return None
+
+        if status not in self.retry_statuses:
+            return None
+
+        if status == 429:
+            until = throttled_until(response)
+            if until is None:
+                return self.backoff(attempt)
+            # a little jitter so that the waiting threads do not wake up at once
+            wait = max(until - time(), 0) + random.uniform(0, 1)
+            return wait if wait <= self.max_wait else None
+
+        if method.upper() not in IDEMPOTENT_METHODS:
+            return None
+        return self.backoff(attempt)
+
+
+class CircuitBreaker:
+    Closed = "closed"
+    Open = "open"
+    HalfOpen = "half_open"
+
+    def __init__(self, failure_threshold=5, recovery_time=30):
+        """
+        Parameters:
+        failure_threshold (int): consecutive failures that open the breaker.
+        recovery_time (float): seconds the breaker stays open when the throttle end is unknown.
+        """
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+
+        self._lock = threading.Lock()
+        self.state = CircuitBreaker.Closed
+        self.failures = 0
+        self.open_until = 0
+
+    def allow(self):
+        """
+        Whether a request may go out now. When the breaker half-opens, exactly one probe request is let through until its outcome is recorded.
+        """
+        with self._lock:
+            if self.state == CircuitBreaker.Closed:
+                return True
+            if self.state == CircuitBreaker.Open and time() >= self.open_until:
+                self.state = CircuitBreaker.HalfOpen
+                return True
+            return False
+
+    def release(self):
+        """
+        Give back the probe slot of a half-open breaker when the probe was not sent or its outcome is unknown, so that the next request probes again.
+        """
+        with self._lock:
+            if self.state == CircuitBreaker.HalfOpen:
+                self.state = CircuitBreaker.Open
+
+    def record_success(self):
+        with self._lock:
+            self.state = CircuitBreaker.Closed
+            self.failures = 0
+
+    def record_failure(self, until=None):
+        """
+        Parameters:
+        until (float): the unix timestamp when the endpoint is known to recover; opens the breaker right away. (optional)
+        """
+        with self._lock:
+            self.failures += 1
+            if until is not None or self.state == CircuitBreaker.HalfOpen or self.failures >= self.failure_threshold:
+                self.state = CircuitBreaker.Open
+                self.open_until = until if until is not None else time() + self.recovery_time
+                logger.info(f"circuit open until {datetime.fromtimestamp(self.open_until, timezone.utc).isoformat()}")
+
+
+class CircuitBreakers:
+    """
+    One CircuitBreaker per endpoint.
+    """
+
+    def __init__(self, failure_threshold=5, recovery_time=30):
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self._lock = threading.Lock()
+        self._breakers = dict()
+
+    def get(self, endpoint):
+        with self._lock:
+            if endpoint not in self._breakers:
+                self._breakers[endpoint] = CircuitBreaker(self.failure_threshold, self.recovery_time)
+            return self._breakers[endpoint]
+
+    def states(self):
+        with self._lock:
+            return {endpoint: breaker.state for endpoint, breaker in self._breakers.items()}
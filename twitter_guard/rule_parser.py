@@ -1,3 +1,6 @@
+import threading
+from functools import lru_cache
+
 from pyparsing import (
     Word,
     nums,
@@ -8,20 +11,22 @@ from pyparsing import (
     Literal,
     CaselessLiteral,
     ParserElement,
+    ParseResults,
 )
 
 ParserElement.enablePackrat()
 
+_parse_lock = threading.Lock()
+
 class EvalOperand:
     "Class to evaluate a parsed constant or variable"
-    vars_ = {}
 
     def __init__(self, tokens):
         self.value = tokens[0]
 
-    def eval(self):
-        if self.value in EvalOperand.vars_:
-            return EvalOperand.vars_[self.value]
+    def eval(self, vars_):
+        if self.value in vars_:
+            return vars_[self.value]
         else:
             return eval(self.value)
 
@@ -41,13 +46,13 @@ class EvalMultOp:
     def __init__(self, tokens):
         self.value = tokens[0]
 
-    def eval(self):
-        prod = self.value[0].eval()
+    def eval(self, vars_):
+        prod = self.value[0].eval(vars_)
         for op, val in operatorOperands(self.value[1:]):
             if op == "*":
-                prod *= val.eval()
+                prod *= val.eval(vars_)
             if op == "/":
-                prod /= val.eval()
+                prod /= val.eval(vars_)
         return prod
 
 
@@ -57,13 +62,13 @@ class EvalAddOp:
     def __init__(self, tokens):
         self.value = tokens[0]
 
-    def eval(self):
-        s = self.value[0].eval()
+    def eval(self, vars_):
+        s = self.value[0].eval(vars_)
         for op, val in operatorOperands(self.value[1:]):
             if op == "+":
-                s += val.eval()
+                s += val.eval(vars_)
             if op == "-":
-                s -= val.eval()
+                s -= val.eval(vars_)
         return s
 
 class EvalAndOp:
@@ -72,10 +77,10 @@ class EvalAndOp:
     def __init__(self, tokens):
         self.value = tokens[0]
 
-    def eval(self):
-        c = self.value[0].eval()
+    def eval(self, vars_):
+        c = self.value[0].eval(vars_)
         for op, val in operatorOperands(self.value[1:]):
-            c = c and val.eval()
+            c = c and val.eval(vars_)
         return c
 
 class EvalOrOp:
@@ -84,10 +89,10 @@ class EvalOrOp:
     def __init__(self, tokens):
         self.value = tokens[0]
 
-    def eval(self):
-        c = self.value[0].eval()
+    def eval(self, vars_):
+        c = self.value[0].eval(vars_)
         for op, val in operatorOperands(self.value[1:]):
-            c = c or val.eval()
+            c = c or val.eval(vars_)
         return c
 
 
@@ -98,8 +103,8 @@ class EvalNotOp:
         #the first element in the tokens list is !/not, the next is the thing to be negated
         self.value = tokens[0][1]
 
-    def eval(self):
-        return not self.value.eval()
+    def eval(self, vars_):
+        return not self.value.eval(vars_)
 
 
 class EvalComparisonOp:
@@ -117,12 +122,12 @@ class EvalComparisonOp:
     def __init__(self, tokens):
         self.value = tokens[0]
 
-    def eval(self):
-        val1 = self.value[0].eval()
+    def eval(self, vars_):
+        val1 = self.value[0].eval(vars_)
         for op, val in operatorOperands(self.value[1:]):
             #print('EvalComparisonOp:',op,val)
             fn = EvalComparisonOp.opMap[op]
-            val2 = val.eval()
+            val2 = val.eval(vars_)
             if fn(val1, val2) == False:
                 return False
             val1 = val2
@@ -131,18 +136,7 @@ class EvalComparisonOp:
             return True
 
 
-def rule_eval(rule, vars_):
-    """
-    Evalute a logical expression with arithmatics and comparisons.
-    
-    Parameters:
-    rule (str): a string representing
-    vars_ (dict): a dictionary containing the names and the values of variables
-    
-    Returns:
-    boolean: evaluation result.
-    """
-
+def _rule_grammar():
     variable = CaselessLiteral("followers_count") | CaselessLiteral("following_count") | CaselessLiteral("tweet_count") \
     | CaselessLiteral("media_count") | CaselessLiteral("default_profile_image") \
     | CaselessLiteral("days") | CaselessLiteral("favourites_count") | Word(alphas, exact=1)
@@ -184,11 +178,58 @@ def rule_eval(rule, vars_):
             (orop, 2, opAssoc.LEFT,EvalOrOp),
         ],
     )
+    return logic_expr
+
 
-    #pass variables to variable eval
-    EvalOperand.vars_ = vars_
+@lru_cache(maxsize=64)
+def _parse_rule(rule):
+    """
+    The parsed expression of a rule. The variables are only looked up by eval(vars_), so a parsed rule is shared by every thread and every profile.
+    """
+    # the packrat cache of pyparsing is global, parse one rule at a time
+    with _parse_lock:
+        return _rule_grammar().parse_string(rule)[0]
+
+
+def rule_eval(rule, vars_):
+    """
+    Evalute a logical expression with arithmatics and comparisons.
+    The evaluation keeps no shared state, so it is safe to call from several threads.
+    
+    Parameters:
+    rule (str): a string representing
+    vars_ (dict): a dictionary containing the names and the values of variables
     
-    return logic_expr.parse_string(rule)[0].eval()
+    Returns:
+    boolean: evaluation result.
+    """
+
+    return _parse_rule(rule).eval(vars_)
+
+
+def _operand_values(node):
+    "generator to extract the operand tokens of a parsed expression"
+    if isinstance(node, EvalOperand):
+        yield node.value
+    elif isinstance(node, (ParseResults, list)):
+        for item in node:
+            yield from _operand_values(item)
+    elif hasattr(node, "value"):
+        yield from _operand_values(node.value)
+
+
+def rule_variables(rule):
+    """
+    The names of the variables a logical expression refers to.
+
+    Parameters:
+    rule (str): a string representing a logical expression, as in rule_eval
+
+    Returns:
+    set: the variable names, e.g. {"followers_count", "days"}.
+    """
+    parsed = _parse_rule(rule)
+    return {value for value in _operand_values(parsed) if not value.isdigit() and value not in ("True", "False")}
 
 
 def default_tests():  
@@ -1,6 +1,17 @@
+import json
+import threading
+from time import perf_counter, sleep, time
+from urllib.parse import urlsplit, urlunsplit
+
 import requests
 from requests.adapters import HTTPAdapter, Retry
 from requests.packages.urllib3.util.ssl_ import create_urllib3_context
+from requests.packages.urllib3.exceptions import HTTPError, ReadTimeoutError
+
+from .cassette import CassetteMode
+from .instrumentation import RequestEvent, endpoint_name
+from .retry import RetryPolicy, CircuitBreakers, throttled_until
+from .timeouts import AdaptiveTimeouts
 
 import logging
 
@@ -9,6 +20,60 @@ logger = logging.getLogger(__name__)
 CIPHERS = "ECDHE-ECDSA-AES128-GCM-SHA256:ECDHE-ECDSA-CHACHA20-POLY1305:ECDHE-RSA-AES128-GCM-SHA256:ECDHE-RSA-CHACHA20-POLY1305:ECDHE-ECDSA-AES256-GCM-SHA384:ECDHE-RSA-AES256-GCM-SHA384:ECDHE-ECDSA-AES128-SHA256:ECDHE-RSA-AES128-SHA256:ECDHE-ECDSA-AES256-SHA384:ECDHE-RSA-AES256-SHA384"
 DEFAULT_TIMEOUT = 5 # seconds
 
+# process-wide transport settings, picked up by every new CustomSession (including the guest sessions created internally)
+transport_defaults = {
+    "cassette": None,
+    "base_url": None,
+    "instrumentation": None,
+    "hedging": None,
+}
+
+# hosts whose traffic is redirected when a base_url override is set
+TWITTER_HOSTS = ("twitter.com", "api.twitter.com", "upload.twitter.com", "cdn.syndication.twimg.com")
+
+# connections kept open per host; the other hosts get DEFAULT_POOL_SIZE
+DEFAULT_POOL_SIZES = {
+    "api.twitter.com": 20,
+    "twitter.com": 20,
+    "upload.twitter.com": 4,
+    "cdn.syndication.twimg.com": 10,
+}
+DEFAULT_POOL_SIZE = 10
+
+# hedges are sent once: no retries, and no sleeping for the rate limit
+HEDGE_RETRY_POLICY = RetryPolicy(max_attempts=1, max_wait=0)
+
+def use_cassette(cassette):
+    """
+    Route every CustomSession created afterwards through the cassette. Pass None to go back to the network.
+    """
+    transport_defaults["cassette"] = cassette
+
+def use_base_url(base_url):
+    """
+    Redirect the twitter traffic of every CustomSession created afterwards to base_url, e.g. a local stand-in server. Pass None to go back to twitter.
+    """
+    transport_defaults["base_url"] = base_url
+
+def use_instrumentation(instrumentation):
+    """
+    Report the requests of every CustomSession created afterwards to the instrumentation. Pass None to stop.
+    """
+    transport_defaults["instrumentation"] = instrumentation
+
+def use_hedging(hedging):
+    """
+    Let every CustomSession created afterwards hedge its hedged_get calls with the Hedging instance. Pass None to stop.
+    """
+    transport_defaults["hedging"] = hedging
+
+def _is_read_timeout(e):
+    if isinstance(e, requests.exceptions.ReadTimeout):
+        return True
+    # once the adapter retries are exhausted, a read timeout surfaces as a ConnectionError wrapping MaxRetryError
+    reason = getattr(e.args[0], "reason", None) if e.args else None
+    return isinstance(reason, ReadTimeoutError)
+
 class DESAdapter(HTTPAdapter):
     """
     A TransportAdapter that re-enables 3DES support in Requests.
@@ -38,24 +103,308 @@ class TimeoutHTTPAdapter(HTTPAdapter):
             kwargs["timeout"] = self.timeout
         return super().send(request, **kwargs)
 
-class CustomSession(requests.Session):
-    def __init__(self):
-        super().__init__()
-        
-        # experimental
-        self.mount("https://twitter.com", DESAdapter())
+class ConnectionPools:
+    """
+    Transport adapters shared by every CustomSession, with one connection pool size per host.
+
+    Adapters hold no cookies or headers, so sessions of different accounts and guest sessions can share them; a new session then reuses the open (already TLS-handshaken) connections instead of starting cold.
+    """
+
+    def __init__(self, pool_sizes=None, default_pool_size=DEFAULT_POOL_SIZE, pool_block=False):
+        """
+        Parameters:
+        pool_sizes (dict): the maximum number of kept-alive connections per host. (optional) defaults to DEFAULT_POOL_SIZES.
+        default_pool_size (int): the pool size of the other https hosts.
+        pool_block (bool): when a pool is exhausted, wait for a free connection instead of opening a connection that is thrown away afterwards.
+        """
+        self.pool_sizes = dict(DEFAULT_POOL_SIZES if pool_sizes is None else pool_sizes)
+        self.default_pool_size = default_pool_size
+        self.pool_block = pool_block
+
+        self._lock = threading.Lock()
+        self._adapters = None
+
+    def _create_adapters(self):
+        # only connection errors are retried here; status codes are handled by the retry policy
+        # a read timeout is retried once, so that a hung call does not block for 5 x the timeout
         retries = Retry(total=5,
+                        connect=3,
+                        read=1,
                         backoff_factor=0.1,
-                        status_forcelist=[ 500, 502, 503, 504])
-        self.mount('https://', TimeoutHTTPAdapter(max_retries=retries))
+                        status_forcelist=None)
+        adapters = {
+            "https://": TimeoutHTTPAdapter(max_retries=retries, pool_maxsize=self.default_pool_size, pool_block=self.pool_block),
+            # plain http is only used with a base_url override, e.g. a local standin_server
+            "http://": TimeoutHTTPAdapter(max_retries=retries, pool_maxsize=self.default_pool_size, pool_block=self.pool_block),
+        }
+        for host, size in self.pool_sizes.items():
+            if host == "twitter.com":
+                # experimental
+                adapter = DESAdapter(pool_connections=1, pool_maxsize=size, pool_block=self.pool_block)
+            else:
+                adapter = TimeoutHTTPAdapter(max_retries=retries, pool_connections=1, pool_maxsize=size, pool_block=self.pool_block)
+            adapters[f"https://{host}"] = adapter
+        return adapters
+
+    @property
+    def adapters(self):
+        with self._lock:
+            if self._adapters is None:
+                self._adapters = self._create_adapters()
+            return self._adapters
+
+    def mount(self, session):
+        for prefix, adapter in self.adapters.items():
+            session.mount(prefix, adapter)
+
+    def owns(self, adapter):
+        return self._adapters is not None and any(adapter is a for a in self._adapters.values())
 
-    def request(self, *args, **kwargs):
-        r = super(CustomSession, self).request(*args, **kwargs)
-        logger.debug(f"DEBUG: {r.status_code} {r.text}")
+    def _adapter_for(self, url):
+        prefixes = sorted((p for p in self.adapters if url.startswith(p)), key=len, reverse=True)
+        return self.adapters[prefixes[0]]
+
+    def prewarm(self, hosts=None, connections=2, connect_timeout=3.05):
+        """
+        Open connections (including the TLS handshake) ahead of the first requests.
+
+        Parameters:
+        hosts (list): the hosts to connect to. (optional) defaults to the hosts with an explicit pool size.
+        connections (int): the number of connections opened per host, at most the pool size.
+        """
+        def warm(host):
+            url = f"https://{host}/"
+            pool = self._adapter_for(url).poolmanager.connection_from_url(url)
+            opened = []
+            try:
+                for _ in range(min(connections, pool.pool.maxsize)):
+                    conn = pool._get_conn()
+                    # returned to the pool even if connecting fails, otherwise the slot would be lost
+                    opened.append(conn)
+                    if conn.sock is None:
+                        conn.timeout = connect_timeout
+                        conn.connect()
+            except (OSError, HTTPError) as e:
+                logger.warning(f"cannot prewarm {host}: {e}")
+            finally:
+                for conn in opened:
+                    pool._put_conn(conn)
+
+        threads = [threading.Thread(target=warm, args=(host,), daemon=True) for host in (hosts or self.pool_sizes)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    def stats(self):
+        """
+        Utilization of every open connection pool, keyed by host.
+        """
+        result = dict()
+        for adapter in self.adapters.values():
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is None or pool.pool is None:
+                    continue
+                maxsize = pool.pool.maxsize
+                # the queue is pre-filled with maxsize placeholders; a checked out connection leaves a gap
+                in_use = maxsize - pool.pool.qsize()
+                result[pool.host] = {
+                    "maxsize": maxsize,
+                    "in_use": in_use,
+                    "idle": sum(1 for conn in list(pool.pool.queue) if conn is not None),
+                    "utilization": in_use / maxsize,
+                    "connections_opened": pool.num_connections,
+                    "requests": pool.num_requests,
+                }
+        return result
+
+# the pools shared by the sessions that are not given their own
+shared_pools = ConnectionPools()
+
+class CustomSession(requests.Session):
+    def __init__(self, cassette=None, base_url=None, instrumentation=None, log_bodies=False, retry_policy=None, breakers=None, timeouts=None, hedging=None, pools=None, governor=None):
+        """
+        Parameters:
+        cassette (Cassette): records or replays the traffic of this session. (optional) defaults to transport_defaults["cassette"].
+        base_url (str): scheme and host (e.g. http://127.0.0.1:8080) replacing the twitter hosts in every request. (optional) defaults to transport_defaults["base_url"].
+        instrumentation (Instrumentation): receives a RequestEvent for every request. (optional) defaults to transport_defaults["instrumentation"].
+        log_bodies (bool): log every response body at debug level. Decoding the bodies is costly, so it is off by default.
+        retry_policy (RetryPolicy): decides which responses are retried and how long to wait. (optional) RetryPolicy(max_attempts=1) disables retrying.
+        breakers (CircuitBreakers): per-endpoint circuit breakers; share one instance between sessions of the same account. (optional)
+        timeouts (AdaptiveTimeouts): per-endpoint (connect, read) timeouts used when a request does not pass its own timeout. (optional)
+        hedging (Hedging): hedges the slow hedged_get calls. (optional) defaults to transport_defaults["hedging"]; without it hedged_get is a plain get.
+        pools (ConnectionPools): the transport adapters of the session. (optional) defaults to shared_pools.
+        governor (RateGovernor): holds requests back when the rate limit of the account is used up. (optional)
+        """
+        super().__init__()
+
+        self.cassette = cassette if cassette is not None else transport_defaults["cassette"]
+        self.base_url = base_url if base_url is not None else transport_defaults["base_url"]
+        self.instrumentation = instrumentation if instrumentation is not None else transport_defaults["instrumentation"]
+        self.log_bodies = log_bodies
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.breakers = breakers if breakers is not None else CircuitBreakers()
+        self.timeouts = timeouts if timeouts is not None else AdaptiveTimeouts()
+        self.hedging = hedging if hedging is not None else transport_defaults["hedging"]
+        self.pools = pools if pools is not None else shared_pools
+        self.pools.mount(self)
+        self.governor = governor
+
+    def close(self):
+        # the shared adapters stay open for the other sessions
+        for adapter in self.adapters.values():
+            if not self.pools.owns(adapter):
+                adapter.close()
+
+    def request(self, method, url, *args, retry_policy=None, **kwargs):
+        """
+        Parameters:
+        retry_policy (RetryPolicy): replaces the retry policy of the session for this request. (optional)
+        """
+        endpoint = endpoint_name(url)
+        retry_policy = retry_policy if retry_policy is not None else self.retry_policy
+
+        # the rate limit is checked first, so that a request failing fast here never takes the probe slot of a half-open breaker
+        if self.governor is not None:
+            wait = self.governor.acquire(endpoint)
+            if wait > retry_policy.max_wait:
+                logger.info(f"{endpoint}: rate limit used up for {wait:.0f}s, failing fast")
+                return self._circuit_open_response(url, time() + wait, reason="Rate Limited")
+            if wait > 0:
+                logger.info(f"{endpoint}: rate limit used up, waiting {wait:.1f}s")
+                sleep(wait)
+
+        breaker = self.breakers.get(endpoint)
+        if not breaker.allow():
+            logger.info(f"{endpoint}: circuit open, failing fast")
+            return self._circuit_open_response(url, breaker.open_until)
+
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeouts.timeout_for(endpoint)
+
+        recorded = False
+        try:
+            attempt = 0
+            while True:
+                try:
+                    r = self._request_once(method, url, endpoint, attempt, *args, **kwargs)
+                except requests.exceptions.RequestException as e:
+                    if _is_read_timeout(e) and isinstance(kwargs["timeout"], tuple):
+                        self.timeouts.observe_timeout(endpoint, kwargs["timeout"][1])
+                    breaker.record_failure()
+                    recorded = True
+                    raise
+
+                wait = retry_policy.wait_time(method, r, attempt)
+                if wait is None:
+                    break
+                logger.info(f"{endpoint}: {r.status_code}, retrying in {wait:.1f}s")
+                sleep(wait)
+                attempt += 1
+
+            if r.status_code == 429 or r.status_code >= 500:
+                breaker.record_failure(until=throttled_until(r) if r.status_code == 429 else None)
+            else:
+                breaker.record_success()
+            recorded = True
+            return r
+        finally:
+            if not recorded:
+                # e.g. an exception that is not a RequestException; a half-open breaker must not keep its probe slot forever
+                breaker.release()
+
+    def _request_once(self, method, url, endpoint, attempt, *args, **kwargs):
+        start = perf_counter()
+        r = super(CustomSession, self).request(method, url, *args, **kwargs)
+        latency = perf_counter() - start
+
+        if r.status_code < 500:
+            self.timeouts.observe(endpoint, latency)
+        if self.governor is not None:
+            self.governor.update(endpoint, r)
+
+        if self.instrumentation is not None:
+            retries = getattr(getattr(r.raw, "retries", None), "history", ())
+            self.instrumentation.emit(
+                RequestEvent(
+                    endpoint,
+                    method,
+                    r.status_code,
+                    latency,
+                    # the body has already been read, so this does not decode anything
+                    len(r.content),
+                    max(latency - r.elapsed.total_seconds(), 0.0),
+                    retries=len(retries) + (1 if attempt > 0 else 0),
+                )
+            )
+
+        if self.log_bodies and logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"{r.status_code} {r.text}")
+        return r
+
+    @staticmethod
+    def _circuit_open_response(url, open_until, reason="Circuit Open"):
+        """
+        A local 429 response, so that callers handle an open circuit (or a used up rate limit) like any other throttled request.
+        The body is the error twitter sends with its own 429, so that r.json() works too.
+        """
+        body = json.dumps({"errors": [{"code": 88, "message": "Rate limit exceeded"}]}).encode("utf-8")
+        r = requests.Response()
+        r.status_code = 429
+        r.reason = reason
+        r.url = url
+        r.encoding = "utf-8"
+        r.headers = requests.structures.CaseInsensitiveDict(
+            {
+                "Retry-After": str(max(int(open_until - time()), 0)),
+                "x-rate-limit-remaining": "0",
+                "x-rate-limit-reset": str(int(open_until)),
+                "content-type": "application/json;charset=utf-8",
+                "content-length": str(len(body)),
+            }
+        )
+        r._content = body
+        return r
+
+    def _rewrite_url(self, url):
+        parts = urlsplit(url)
+        if parts.hostname not in TWITTER_HOSTS:
+            return url
+        base = urlsplit(self.base_url)
+        return urlunsplit((base.scheme, base.netloc, parts.path, parts.query, parts.fragment))
+
+    def prepare_request(self, request):
+        if self.base_url:
+            request.url = self._rewrite_url(request.url)
+        return super(CustomSession, self).prepare_request(request)
+
+    def send(self, request, **kwargs):
+        if self.cassette is not None and self.cassette.mode == CassetteMode.Replay:
+            return self.cassette.replay(request)
+        r = super(CustomSession, self).send(request, **kwargs)
+        if self.cassette is not None and self.cassette.mode == CassetteMode.Record:
+            self.cassette.record(request, r)
         return r
 
     def get(self, *args, **kwargs):
         return self.request("GET", *args, **kwargs)
 
     def post(self, *args, **kwargs):
-        return self.request("POST", *args, **kwargs)
\ No newline at end of file
+        return self.request("POST", *args, **kwargs)
+
+    def hedged_get(self, url, **kwargs):
+        """
+        A GET that is duplicated when it takes longer than usual for its endpoint. Only use it for idempotent lookups.
+        """
+        if self.hedging is None:
+            return self.get(url, **kwargs)
+        return self.hedging.call(endpoint_name(url), self.timeouts, self.get, url, hedge_func=self._hedge_get, **kwargs)
+
+    def _hedge_get(self, url, **kwargs):
+        # the duplicate never waits for a rate limit or retries, and a throttled or failed answer must not win over the primary
+        r = self.get(url, retry_policy=HEDGE_RETRY_POLICY, **kwargs)
+        if r.status_code == 429 or r.status_code >= 500:
+            raise requests.exceptions.HTTPError(f"hedge: {r.status_code}", response=r)
+        return r
\ No newline at end of file
@@ -0,0 +1,80 @@
+import threading
+import functools
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces duplicate in-flight calls.
+
+    While a call for a key is running, other callers with the same key wait for it and get the same result (or the same exception) instead of issuing their own request.
+    Nothing is cached once the call finishes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = dict()
+
+    def do(self, key, func, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+            else:
+                call.waiters += 1
+
+        if not leader:
+            logger.debug(f"joined in-flight call {key}")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+
+def single_flight(key):
+    """
+    Decorator coalescing concurrent calls of a function.
+
+    Parameters:
+    key (callable): receives the arguments of the call and returns the hashable key of the normalized request.
+    """
+
+    def decorator(func):
+        group = SingleFlight()
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return group.do(key(*args, **kwargs), func, *args, **kwargs)
+
+        wrapper.single_flight = group
+        return wrapper
+
+    return decorator
@@ -0,0 +1,621 @@
+"""
+A lightweight local http server imitating the twitter endpoints used by TwitterBot.
+
+The data is synthetic and generated deterministically from the configured scale, so that pagination, retry and rate limit handling can be load tested without touching twitter.
+
+Example:
+    python -m twitter_guard.standin_server --port 8080 --users 100000 --error-rate 0.01 --throttle-rate 0.01
+"""
+import re
+import json
+import random
+import secrets
+import argparse
+import threading
+from time import sleep, time
+from datetime import datetime, timezone
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+SNOWFLAKE_EPOCH = 1288834974657
+USER_ID_BASE = 10_000_000
+SEQUENCE_MASK = (1 << 22) - 1
+
+USER_NOTIFICATION_ELEMENTS = [
+    "users_liked_your_tweet",
+    "user_liked_multiple_tweets",
+    "users_retweeted_your_tweet",
+    "follow_from_recommended_user",
+]
+
+
+def tweet_timestamp(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%a %b %d %H:%M:%S +0000 %Y")
+
+
+def snowflake_id(timestamp_ms, sequence):
+    return ((timestamp_ms - SNOWFLAKE_EPOCH) << 22) | (sequence & SEQUENCE_MASK)
+
+
+class StandinConfig:
+    def __init__(
+        self,
+        users=10000,
+        tweets=10000,
+        seed=0,
+        tweet_interval=60,
+        notifications_per_poll=5,
+        notification_rate=0.0,
+        rate_limit=500,
+        rate_window=900,
+        error_rate=0.0,
+        throttle_rate=0.0,
+        latency=0.0,
+        latency_jitter=0.0,
+        owner_id=1,
+    ):
+        """
+        Parameters:
+        users (int): the number of synthetic accounts; also the length of follower/following lists.
+        tweets (int): the number of synthetic tweets returned by searches.
+        seed (int): seed of the data and fault generators.
+        tweet_interval (int): seconds between two consecutive synthetic tweets.
+        notifications_per_poll (int): new interactions generated every time notifications/all.json is requested.
+        notification_rate (float): new interactions generated per second in the background, so that the badge count changes between polls.
+        rate_limit (int): requests allowed per endpoint within a rate window; 0 disables rate limiting.
+        rate_window (int): length of the rate window in seconds.
+        error_rate (float): probability of answering with a random 5xx error.
+        throttle_rate (float): probability of answering with 429 even when the rate limit is not reached.
+        latency (float): base latency added to every response, in seconds.
+        latency_jitter (float): uniformly distributed extra latency, in seconds.
+        owner_id (int): the id of the logged in account.
+        """
+        self.users = users
+        self.tweets = tweets
+        self.seed = seed
+        self.tweet_interval = tweet_interval
+        self.notifications_per_poll = notifications_per_poll
+        self.notification_rate = notification_rate
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.owner_id = owner_id
+
+
+class SyntheticTwitter:
+    """
+    The state behind the stand-in server: synthetic users and tweets, the notification stream, the block and mute lists, and the rate windows.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.started_at = int(time())
+
+        self._lock = threading.Lock()
+        self._fault_rng = random.Random(config.seed)
+        self._notification_rng = random.Random(config.seed + 1)
+
+        self.blocked = dict()
+        self.muted = dict()
+        self.notifications = []
+        self._last_seen_sort_index = 0
+        self._last_generated = time()
+
+        self._rate_windows = dict()
+
+    # ------------------------------ synthetic data ------------------------------
+    def user_index(self, user_id):
+        index = int(user_id) - USER_ID_BASE
+        if 0 <= index < self.config.users:
+            return index
+
+    def user_legacy(self, index):
+        rng = random.Random(self.config.seed * 1_000_003 + index)
+        user_id = USER_ID_BASE + index
+        return {
+            "id": user_id,
+            "id_str": str(user_id),
+            "screen_name": f"synthetic_{index}",
+            "name": f"Synthetic {index}",
+            "created_at": tweet_timestamp(self.started_at - rng.randint(1, 4000) * 86400),
+            "friends_count": rng.randint(0, 2000),
+            "followers_count": int(rng.paretovariate(1.2)) - 1,
+            "statuses_count": rng.randint(0, 20000),
+            "media_count": rng.randint(0, 500),
+            "favourites_count": rng.randint(0, 50000),
+            "protected": rng.random() < 0.05,
+            "blocking": user_id in self.blocked,
+        }
+
+    def user_result(self, index):
+        legacy = self.user_legacy(index)
+        return {"__typename": "User", "rest_id": legacy["id_str"], "legacy": legacy}
+
+    def tweet_id(self, k):
+        """
+        The id of the k-th newest synthetic tweet.
+        """
+        timestamp_ms = (self.started_at - k * self.config.tweet_interval) * 1000
+        return snowflake_id(timestamp_ms, k)
+
+    def tweet_result(self, tweet_id):
+        tweet_id = int(tweet_id)
+        sequence = tweet_id & SEQUENCE_MASK
+        timestamp = ((tweet_id >> 22) + SNOWFLAKE_EPOCH) // 1000
+        index = (sequence * 2654435761) % self.config.users
+        user = self.user_result(index)
+        return {
+            "__typename": "Tweet",
+            "rest_id": str(tweet_id),
+            "core": {"user_results": {"result": user}},
+            "source": '<a href="https://mobile.twitter.com" rel="nofollow">Twitter Web App</a>',
+            "views": {"count": str(sequence * 7 % 10000)},
+            "legacy": {
+                "full_text": f"synthetic tweet {sequence} by {user['legacy']['screen_name']}",
+                "created_at": tweet_timestamp(timestamp),
+                "lang": "en",
+                "user_id_str": user["rest_id"],
+                "is_quote_status": False,
+                "in_reply_to_status_id_str": None,
+                "favorite_count": sequence % 100,
+                "reply_count": sequence % 7,
+                "retweet_count": sequence % 13,
+                "quote_count": sequence % 3,
+                "bookmark_count": 0,
+                "entities": {"hashtags": [], "user_mentions": []},
+            },
+        }
+
+    def cdn_tweet(self, tweet_id):
+        result = self.tweet_result(tweet_id)
+        legacy = result["legacy"]
+        user = result["core"]["user_results"]["result"]["legacy"]
+        created_at = datetime.strptime(legacy["created_at"], "%a %b %d %H:%M:%S +0000 %Y").replace(tzinfo=timezone.utc)
+        return {
+            "__typename": "Tweet",
+            "id_str": result["rest_id"],
+            "created_at": created_at.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+            "text": legacy["full_text"],
+            "lang": legacy["lang"],
+            "entities": legacy["entities"],
+            "user": {"id_str": user["id_str"], "screen_name": user["screen_name"], "name": user["name"]},
+        }
+
+    # ------------------------------ timelines ------------------------------
+    @staticmethod
+    def _cursor_entries(top, bottom):
+        return [
+            {"entryId": f"cursor-top-{top}", "content": {"entryType": "TimelineTimelineCursor", "cursorType": "Top", "value": str(top)}},
+            {"entryId": f"cursor-bottom-{bottom}", "content": {"entryType": "TimelineTimelineCursor", "cursorType": "Bottom", "value": str(bottom)}},
+        ]
+
+    @staticmethod
+    def _page_bounds(variables, total):
+        start = int(variables.get("cursor") or 0)
+        count = int(variables.get("count") or 20)
+        return start, min(start + count, total)
+
+    def _timeline(self, entries, top, bottom):
+        return {"instructions": [{"type": "TimelineAddEntries", "entries": entries + self._cursor_entries(top, bottom)}]}
+
+    def user_timeline(self, variables, total, index_at):
+        """
+        One page of a user list of the given length; index_at maps a position in the list to a user index.
+        """
+        start, end = self._page_bounds(variables, total)
+        entries = [
+            {
+                "entryId": f"user-{USER_ID_BASE + index_at(i)}",
+                "content": {"entryType": "TimelineTimelineItem", "itemContent": {"user_results": {"result": self.user_result(index_at(i))}}},
+            }
+            for i in range(start, end)
+        ]
+        return self._timeline(entries, start, end)
+
+    def tweet_timeline(self, tweet_ids):
+        entries = [
+            {
+                "entryId": f"tweet-{tweet_id}",
+                "content": {
+                    "entryType": "TimelineTimelineItem",
+                    "itemContent": {"__typename": "TimelineTweet", "tweet_results": {"result": self.tweet_result(tweet_id)}},
+                },
+            }
+            for tweet_id in tweet_ids
+        ]
+        return entries
+
+    def search(self, variables):
+        total = self.config.tweets
+        since_id = re.search(r"since_id:(\d+)", variables.get("rawQuery") or "")
+        if since_id is not None:
+            # the tweets are newest first, only the ones above since_id match
+            since_id = int(since_id.group(1))
+            total = next((k for k in range(total) if self.tweet_id(k) <= since_id), total)
+        start, end = self._page_bounds(variables, total)
+        tweet_ids = [self.tweet_id(k) for k in range(start, end)]
+        return self._timeline(self.tweet_timeline(tweet_ids), start, end)
+
+    def tweet_detail(self, variables):
+        focal = int(variables["focalTweetId"])
+        start = int(variables.get("cursor") or 0)
+        # the focal tweet followed by a few pages of replies
+        replies = 40
+        end = min(start + 20, replies)
+        tweet_ids = [focal] if start == 0 else []
+        tweet_ids += [self.tweet_id(k) for k in range(start + 1, end + 1)]
+        return self._timeline(self.tweet_timeline(tweet_ids), start, end)
+
+    # ------------------------------ graphql ------------------------------
+    def graphql(self, operation, variables):
+        users = self.config.users
+        if operation == "UserByRestId":
+            index = self.user_index(variables["userId"])
+            return {"data": {"user": {"result": self.user_result(index)} if index is not None else {}}}
+        if operation == "UserByScreenName":
+            name = variables["screen_name"]
+            index = int(name.split("_")[-1]) if name.startswith("synthetic_") else None
+            if index is None or index >= users:
+                return {"data": {"user": {}}}
+            return {"data": {"user": {"result": self.user_result(index)}}}
+        if operation in ("Followers", "Following"):
+            # a different but stable ordering for the two lists; 7919 is a prime, so the mapping is a permutation unless it divides users
+            step = 1 if operation == "Followers" else 7919
+            timeline = self.user_timeline(variables, users, lambda i: (i * step) % users)
+            return {"data": {"user": {"result": {"__typename": "User", "timeline": {"timeline": timeline}}}}}
+        if operation == "BlockedAccountsAll":
+            with self._lock:
+                # newest block first
+                indices = [self.user_index(x) for x in reversed(self.blocked)]
+            timeline = self.user_timeline(variables, len(indices), indices.__getitem__)
+            return {"data": {"viewer": {"timeline": {"timeline": timeline}}}}
+        if operation == "MutedAccounts":
+            with self._lock:
+                indices = [self.user_index(x) for x in reversed(self.muted)]
+            timeline = self.user_timeline(variables, len(indices), indices.__getitem__)
+            return {"data": {"viewer": {"muting_timeline": {"timeline": timeline}}}}
+        if operation == "SearchTimeline":
+            return {"data": {"search_by_raw_query": {"search_timeline": {"timeline": self.search(variables)}}}}
+        if operation == "TweetDetail":
+            return {"data": {"threaded_conversation_with_injections_v2": self.tweet_detail(variables)}}
+        if operation == "TweetResultByRestId":
+            return {"data": {"tweetResult": {"result": self.tweet_result(variables["tweetId"])}}}
+        if operation == "RemoveFollower":
+            return {"data": {"remove_follower": {"unfollow_success_reason": "Unfollowed"}}}
+
+    # ------------------------------ notifications ------------------------------
+    def _generate_due_notifications(self):
+        """
+        Generate the background notifications of the time elapsed since the last call. Must hold the lock.
+        """
+        if not self.config.notification_rate:
+            return
+        now = time()
+        due = int((now - self._last_generated) * self.config.notification_rate)
+        if due > 0:
+            self._generate_notifications(due)
+            self._last_generated += due / self.config.notification_rate
+
+    def _generate_notifications(self, count=None):
+        now_ms = int(time() * 1000)
+        last = self.notifications[-1]["sort_index"] if self.notifications else 0
+        for i in range(self.config.notifications_per_poll if count is None else count):
+            sort_index = max(now_ms + i, last + 1)
+            last = sort_index
+            user_ids = [USER_ID_BASE + self._notification_rng.randrange(self.config.users) for _ in range(self._notification_rng.randint(1, 3))]
+            self.notifications.append(
+                {
+                    "id": secrets.token_hex(8),
+                    "sort_index": sort_index,
+                    "element": self._notification_rng.choice(USER_NOTIFICATION_ELEMENTS),
+                    "user_ids": user_ids,
+                }
+            )
+
+    def notifications_all(self, params):
+        count = int(params.get("count", 40))
+        cursor = params.get("cursor", "")
+        with self._lock:
+            self._generate_due_notifications()
+            self._generate_notifications()
+            if cursor.startswith("top-"):
+                newer_than = int(cursor[4:])
+                page = [x for x in self.notifications if x["sort_index"] > newer_than][-count:]
+            elif cursor.startswith("bottom-"):
+                older_than = int(cursor[7:])
+                page = [x for x in self.notifications if x["sort_index"] < older_than][-count:]
+            else:
+                page = self.notifications[-count:]
+
+        page = list(reversed(page))
+        users = dict()
+        notifications = dict()
+        entries = []
+        for x in page:
+            for user_id in x["user_ids"]:
+                legacy = self.user_legacy(self.user_index(user_id))
+                users[str(user_id)] = legacy
+            notifications[x["id"]] = {
+                "id": x["id"],
+                "message": {"text": "", "entities": [{"ref": {"user": {"id": str(user_id)}}} for user_id in x["user_ids"]]},
+            }
+            entries.append(
+                {
+                    "entryId": f"notification-{x['id']}",
+                    "sortIndex": str(x["sort_index"]),
+                    "content": {"item": {"content": {"notification": {"id": x["id"]}}, "clientEventInfo": {"element": x["element"]}}},
+                }
+            )
+
+        if page:
+            top, bottom = page[0]["sort_index"], page[-1]["sort_index"]
+        elif cursor.startswith("top-"):
+            top = bottom = int(cursor[4:])
+        else:
+            top = bottom = 0
+        entries.insert(0, {"entryId": f"cursor-top-{top}", "sortIndex": str(top + 1), "content": {"operation": {"cursor": {"value": f"top-{top}", "cursorType": "Top"}}}})
+        entries.append({"entryId": f"cursor-bottom-{bottom}", "sortIndex": str(bottom - 1), "content": {"operation": {"cursor": {"value": f"bottom-{bottom}", "cursorType": "Bottom"}}}})
+
+        return {
+            "globalObjects": {"users": users, "tweets": {}, "notifications": notifications},
+            "timeline": {"id": "Notifications-All", "instructions": [{"addEntries": {"entries": entries}}]},
+        }
+
+    def badge_count(self):
+        with self._lock:
+            self._generate_due_notifications()
+            unread = len([x for x in self.notifications if x["sort_index"] > self._last_seen_sort_index])
+        return {"ntab_unread_count": unread, "dm_unread_count": 0, "total_unread_count": unread, "is_from_urt": True}
+
+    def mark_seen(self, cursor):
+        if cursor.startswith("top-"):
+            with self._lock:
+                self._last_seen_sort_index = max(self._last_seen_sort_index, int(cursor[4:]))
+        return {}
+
+    # ------------------------------ actions ------------------------------
+    def _action(self, target, user_id, add):
+        index = self.user_index(user_id)
+        if index is None:
+            return None
+        legacy = self.user_legacy(index)
+        with self._lock:
+            if add:
+                target[int(user_id)] = legacy["screen_name"]
+            else:
+                target.pop(int(user_id), None)
+        return legacy
+
+    def block(self, user_id, add=True):
+        return self._action(self.blocked, user_id, add)
+
+    def mute(self, user_id, add=True):
+        return self._action(self.muted, user_id, add)
+
+    # ------------------------------ faults ------------------------------
+    def rate_headers(self, endpoint, account=None):
+        """
+        Count the request against the rate window of the endpoint. Like on twitter, every account (or guest token) has its own windows.
+
+        Returns:
+        Tuple: a dictionary of x-rate-limit-* headers, and whether the limit has been exceeded.
+        """
+        limit, window = self.config.rate_limit, self.config.rate_window
+        if not limit:
+            return {}, False
+        now = int(time())
+        with self._lock:
+            reset, used = self._rate_windows.get((account, endpoint), (now + window, 0))
+            if now >= reset:
+                reset, used = now + window, 0
+            used += 1
+            self._rate_windows[(account, endpoint)] = (reset, used)
+        headers = {
+            "x-rate-limit-limit": str(limit),
+            "x-rate-limit-remaining": str(max(limit - used, 0)),
+            "x-rate-limit-reset": str(reset),
+        }
+        return headers, used > limit
+
+    def fault(self):
+        """
+        Returns the injected status code for this request, or None.
+        """
+        with self._lock:
+            delay = self.config.latency + self._fault_rng.uniform(0, self.config.latency_jitter)
+            roll = self._fault_rng.random()
+            status = None
+            if roll < self.config.error_rate:
+                status = self._fault_rng.choice([500, 502, 503, 504])
+            elif roll < self.config.error_rate + self.config.throttle_rate:
+                status = 429
+        if delay > 0:
+            sleep(delay)
+        return status
+
+
+class StandinRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json;charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _params(self):
+        parts = urlsplit(self.path)
+        params = {k: v[-1] for k, v in parse_qs(parts.query, keep_blank_values=True).items()}
+        return parts.path, params
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length == 0:
+            return dict()
+        raw = self.rfile.read(length)
+        try:
+            return json.loads(raw)
+        except ValueError:
+            return {k: v[-1] for k, v in parse_qs(raw.decode("utf-8")).items()}
+
+    def _handle(self, method):
+        state = self.server.state
+        path, params = self._params()
+        body = self._body() if method == "POST" else dict()
+
+        if "/graphql/" in path:
+            endpoint = path.split("/")[-1]
+        else:
+            endpoint = path
+
+        # the cookies of the twitter domains are not sent to the stand-in host, the csrf header identifies the session instead
+        account = self.headers.get("x-guest-token") or self.headers.get("x-csrf-token")
+        rate_headers, exceeded = state.rate_headers(endpoint, account)
+        status = state.fault()
+        if exceeded or status == 429:
+            return self._send_json(429, {"errors": [{"code": 88, "message": "Rate limit exceeded"}]}, rate_headers)
+        if status is not None:
+            return self._send_json(status, {"errors": [{"message": "Internal error"}]}, rate_headers)
+
+        payload = self._route(state, method, path, endpoint, params, body)
+        if payload is None:
+            return self._send_json(404, {"errors": [{"code": 34, "message": "Sorry, that page does not exist."}]}, rate_headers)
+        self._send_json(200, payload, rate_headers)
+
+    def _route(self, state, method, path, endpoint, params, body):
+        if "/graphql/" in path:
+            if method == "GET":
+                variables = json.loads(params.get("variables", "{}"))
+            else:
+                variables = body.get("variables", dict())
+            return state.graphql(endpoint, variables)
+        if path.endswith("/notifications/all.json"):
+            return state.notifications_all(params)
+        if path.endswith("/notifications/all/last_seen_cursor.json"):
+            return state.mark_seen(params.get("cursor", ""))
+        if path.endswith("/badge_count/badge_count.json"):
+            return state.badge_count()
+        if path.endswith("/guest/activate.json"):
+            return {"guest_token": str(secrets.randbelow(10**19))}
+        if path.endswith("/report/flow.json"):
+            return {
+                "flow_token": f"g;{secrets.randbelow(10**18)}:-{int(time() * 1000)}:{secrets.token_urlsafe(16)}:0",
+                "status": "success",
+                "subtasks": [{"subtask_id": "single-selection", "choice_selection": {"choices": [{"id": "next"}]}}],
+            }
+        if path == "/tweet-result":
+            return state.cdn_tweet(params["id"])
+        for suffix, action, add in [
+            ("/blocks/create.json", state.block, True),
+            ("/blocks/destroy.json", state.block, False),
+            ("/mutes/users/create.json", state.mute, True),
+            ("/mutes/users/destroy.json", state.mute, False),
+        ]:
+            if path.endswith(suffix):
+                return action(params.get("user_id") or body.get("user_id"), add=add)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+
+class StandinServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, config=None):
+        """
+        Parameters:
+        host (str): the interface to listen on.
+        port (int): the port to listen on; 0 picks a free port.
+        config (StandinConfig): the scale and the fault settings. (optional)
+        """
+        super().__init__((host, port), StandinRequestHandler)
+        self.state = SyntheticTwitter(config or StandinConfig())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """
+        Serve from a background thread.
+        """
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        logger.info(f"stand-in server listening on {self.url}")
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def write_cookie_file(cookie_path, user_id=1):
+    """
+    Write a Netscape cookie file that TwitterBot accepts when pointed at the stand-in server.
+    """
+    with open(cookie_path, "w") as f:
+        f.write("# Netscape HTTP Cookie File\n")
+        for name, value in [("ct0", secrets.token_hex(16)), ("auth_token", secrets.token_hex(20)), ("twid", f'"u={user_id}"')]:
+            f.write(f".twitter.com\tTRUE\t/\tTRUE\t2147483647\t{name}\t{value}\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="local stand-in for the twitter endpoints used by TwitterBot")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--tweets", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--notifications-per-poll", type=int, default=5)
+    parser.add_argument("--notification-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=int, default=500)
+    parser.add_argument("--rate-window", type=int, default=900)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--latency-jitter", type=float, default=0.0)
+    parser.add_argument("--cookie-path", default=None, help="also write a matching Netscape cookie file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    config = StandinConfig(
+        users=args.users,
+        tweets=args.tweets,
+        seed=args.seed,
+        notifications_per_poll=args.notifications_per_poll,
+        notification_rate=args.notification_rate,
+        rate_limit=args.rate_limit,
+        rate_window=args.rate_window,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        latency=args.latency,
+        latency_jitter=args.latency_jitter,
+    )
+    if args.cookie_path:
+        write_cookie_file(args.cookie_path)
+    server = StandinServer(args.host, args.port, config)
+    logger.info(f"serving on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
@@ -0,0 +1,119 @@
+import os
+import json
+import atexit
+import threading
+import weakref
+from time import monotonic
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# the stores with a file; one exit hook flushes them all without keeping them alive
+_open_stores = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_open_stores():
+    # a change still waiting for its timer is written at exit
+    for store in list(_open_stores):
+        store.flush()
+
+
+class StateStore:
+    """
+    Small runtime state (the notification cursor, the last processed sort index) in a json file of its own, away from the config and its credentials.
+
+    Changes are kept in memory and written at most once per min_interval seconds; a pending change is written by a timer, by flush() or by close().
+    Every write goes to a temporary file that replaces the state file, so a crash leaves either the old or the new state. Thread-safe.
+    """
+
+    def __init__(self, path=None, min_interval=5.0):
+        """
+        Parameters:
+        path (str): the state file. (optional) when not provided, the state is only kept in memory.
+        min_interval (float): the minimum number of seconds between two writes.
+        """
+        self.path = path
+        self.min_interval = min_interval
+        self.writes = 0
+
+        self._lock = threading.Lock()
+        self._state = self._load()
+        self._dirty = False
+        self._last_write = None
+        self._timer = None
+        if path is not None:
+            _open_stores.add(self)
+
+    def _load(self):
+        if self.path is None or not os.path.exists(self.path):
+            return dict()
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except ValueError:
+            logger.warning(f"{self.path} is corrupt, starting from an empty state")
+            return dict()
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self._state.get(key, default)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._state
+
+    def update(self, **changes):
+        """
+        Set several keys at once; they are written together.
+        """
+        with self._lock:
+            changed = {key: value for key, value in changes.items() if self._state.get(key) != value}
+            if not changed:
+                return
+            self._state.update(changed)
+            self._dirty = True
+            self._schedule()
+
+    def set(self, key, value):
+        self.update(**{key: value})
+
+    def _schedule(self):
+        # holds the lock
+        if self.path is None or self._timer is not None:
+            return
+        elapsed = None if self._last_write is None else monotonic() - self._last_write
+        if elapsed is None or elapsed >= self.min_interval:
+            self._write()
+        else:
+            self._timer = threading.Timer(self.min_interval - elapsed, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _write(self):
+        # holds the lock
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._state, f, indent=2, sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+        self._last_write = monotonic()
+        self.writes += 1
+
+    def flush(self):
+        """
+        Write the pending changes now.
+        """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._dirty and self.path is not None:
+                self._write()
+
+    def close(self):
+        self.flush()
+        _open_stores.discard(self)
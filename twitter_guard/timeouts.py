@@ -0,0 +1,128 @@
+import threading
+from collections import deque
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# read timeouts in seconds used until enough latencies have been observed for an endpoint
+DEFAULT_READ_TIMEOUTS = {
+    "/2/badge_count/badge_count.json": 2,
+    "/2/notifications/all.json": 5,
+    "/1.1/onboarding/task.json": 10,
+    "/i/media/upload.json": 30,
+    "Followers": 15,
+    "Following": 15,
+    "BlockedAccountsAll": 15,
+    "MutedAccounts": 15,
+    "SearchTimeline": 15,
+    "TweetDetail": 10,
+}
+
+
+class AdaptiveTimeouts:
+    """
+    Per-endpoint (connect, read) timeouts derived from the observed latencies.
+
+    The read timeout follows a high quantile of the recent latencies of the endpoint times a safety multiplier, clamped between min_read and max_read.
+    Slow paginated endpoints therefore get long timeouts, while hung calls to cheap endpoints are cut off early.
+    """
+
+    def __init__(
+        self,
+        connect_timeout=3.05,
+        default_read=5,
+        min_read=1,
+        max_read=60,
+        quantile=0.99,
+        multiplier=2.0,
+        window=200,
+        min_samples=20,
+        overrides=None,
+    ):
+        """
+        Parameters:
+        connect_timeout (float): the connect timeout of every request, in seconds.
+        default_read (float): the read timeout of endpoints without samples or override.
+        min_read (float): the lower bound of the adaptive read timeout.
+        max_read (float): the upper bound of the adaptive read timeout.
+        quantile (float): the latency quantile the read timeout is based on.
+        multiplier (float): safety factor applied to the quantile.
+        window (int): the number of recent latencies kept per endpoint.
+        min_samples (int): samples needed before the timeout adapts.
+        overrides (dict): initial read timeouts per endpoint name. (optional) defaults to DEFAULT_READ_TIMEOUTS.
+        """
+        self.connect_timeout = connect_timeout
+        self.default_read = default_read
+        self.min_read = min_read
+        self.max_read = max_read
+        self.quantile = quantile
+        self.multiplier = multiplier
+        self.window = window
+        self.min_samples = min_samples
+        self.overrides = dict(DEFAULT_READ_TIMEOUTS if overrides is None else overrides)
+
+        self._lock = threading.Lock()
+        self._samples = dict()
+        self._read_timeouts = dict()
+        self._pending = dict()
+
+    def _samples_of(self, endpoint):
+        # holds the lock
+        samples = self._samples.get(endpoint)
+        if samples is None:
+            samples = self._samples[endpoint] = deque(maxlen=self.window)
+        return samples
+
+    def observe(self, endpoint, latency, refresh=False):
+        """
+        Record the latency of a completed request.
+
+        Parameters:
+        refresh (bool): recompute the read timeout right away instead of every few samples.
+        """
+        with self._lock:
+            samples = self._samples_of(endpoint)
+            samples.append(latency)
+            # recomputing the quantile on every request is wasteful; refresh every few samples
+            self._pending[endpoint] = self._pending.get(endpoint, 0) + 1
+            if len(samples) >= self.min_samples and (refresh or self._pending[endpoint] >= max(self.min_samples // 4, 1)):
+                self._pending[endpoint] = 0
+                self._read_timeouts[endpoint] = self._compute(samples)
+
+    def observe_timeout(self, endpoint, read_timeout):
+        """
+        Record a read timeout, so that an endpoint that became slower gets a longer timeout.
+
+        The request took at least read_timeout, which is kept as its sample. The read timeout of the endpoint is raised to read_timeout times the multiplier right away, even before min_samples latencies are known.
+        """
+        with self._lock:
+            self._samples_of(endpoint).append(read_timeout)
+            current = self._read_timeouts.get(endpoint, self.overrides.get(endpoint, self.default_read))
+            self._read_timeouts[endpoint] = max(current, min(read_timeout * self.multiplier, self.max_read))
+
+    def _compute(self, samples):
+        ordered = sorted(samples)
+        index = min(int(self.quantile * len(ordered)), len(ordered) - 1)
+        return min(max(ordered[index] * self.multiplier, self.min_read), self.max_read)
+
+    def quantile_latency(self, endpoint, quantile):
+        """
+        The observed latency quantile of the endpoint, or None without enough samples.
+        """
+        with self._lock:
+            samples = self._samples.get(endpoint)
+            if not samples or len(samples) < self.min_samples:
+                return None
+            ordered = sorted(samples)
+        return ordered[min(int(quantile * len(ordered)), len(ordered) - 1)]
+
+    def timeout_for(self, endpoint):
+        """
+        Returns the (connect, read) timeout tuple for the endpoint.
+        """
+        with self._lock:
+            read = self._read_timeouts.get(endpoint)
+        if read is None:
+            read = self.overrides.get(endpoint, self.default_read)
+        return (self.connect_timeout, read)
@@ -0,0 +1,136 @@
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+from time import time
+from collections import OrderedDict
+
+from .rule_parser import rule_variables
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def rule_hash(rule):
+    return hashlib.blake2b(rule.encode(), digest_size=8).hexdigest()
+
+
+def fingerprint(rule, rule_vars, variables=None):
+    """
+    A hash of the filtering rule and the profile fields it is evaluated on. The verdict of a user can only change when the fingerprint does.
+
+    Parameters:
+    variables (set): the names of the fields the rule refers to; the other fields of rule_vars are left out, so that their changes keep the verdict. (optional) all fields when missing.
+    """
+    if variables is not None:
+        rule_vars = {name: value for name, value in rule_vars.items() if name in variables}
+    payload = json.dumps([rule, sorted(rule_vars.items())], separators=(",", ":"), default=str)
+    return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+
+class VerdictCache:
+    """
+    Remembers the oracle verdicts of users across runs, in a SQLite database.
+
+    An entry is keyed by user_id and only matches while the fingerprint of the rule and of the rule-relevant profile fields is unchanged, so a changed profile or rule is judged again.
+    Entries expire after ttl seconds. Entries of other rules are deleted when the cache is opened, and lookups of the memory_size most recently seen users are served from memory.
+    """
+
+    def __init__(self, db_path, rule, ttl=7 * 86400, timeout=30, memory_size=100000):
+        """
+        Parameters:
+        db_path (str): the database file, created if missing.
+        rule (str): the current filtering rule.
+        ttl (float): seconds a verdict stays valid.
+        timeout (float): seconds to wait for the lock of another writer.
+        memory_size (int): the number of verdicts kept in memory, least recently used first out.
+        """
+        self.db_path = db_path
+        self.rule = rule
+        self.rule_hash = rule_hash(rule)
+        try:
+            self.variables = rule_variables(rule)
+        except Exception:
+            # the oracle falls back to the default rule then, fingerprint every field
+            logger.warning(f"cannot parse the filtering rule {rule!r}, fingerprinting every profile field")
+            self.variables = None
+        self.ttl = ttl
+        self.timeout = timeout
+        self.memory_size = memory_size
+        self._local = threading.local()
+        self._memory_lock = threading.Lock()
+        # user_id -> (fingerprint, is_bad, expires), least recently used first
+        self._memory = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS verdicts
+            (user_id integer PRIMARY KEY, rule_hash text, fingerprint text, is_bad integer, expires real)
+            """
+        )
+        cursor = conn.execute("DELETE FROM verdicts WHERE rule_hash != ? OR expires <= ?", (self.rule_hash, time()))
+        if cursor.rowcount:
+            logger.info(f"{db_path}: dropped {cursor.rowcount} verdicts of other rules or expired")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def fingerprint(self, rule_vars):
+        return fingerprint(self.rule, rule_vars, self.variables)
+
+    def _remember(self, user_id, entry):
+        with self._memory_lock:
+            self._memory[user_id] = entry
+            self._memory.move_to_end(user_id)
+            if len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def get(self, user_id, fingerprint):
+        """
+        Returns:
+        bool: the cached verdict (True for bad), or None when there is no valid one.
+        """
+        with self._memory_lock:
+            entry = self._memory.get(user_id)
+            if entry is not None:
+                self._memory.move_to_end(user_id)
+        if entry is None:
+            row = self._conn().execute("SELECT fingerprint, is_bad, expires FROM verdicts WHERE user_id = ?", (user_id,)).fetchone()
+            if row is not None:
+                entry = (row[0], bool(row[1]), row[2])
+                self._remember(user_id, entry)
+        if entry is None or entry[0] != fingerprint or entry[2] <= time():
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[1]
+
+    def put(self, user_id, fingerprint, is_bad):
+        expires = time() + self.ttl
+        self._remember(user_id, (fingerprint, bool(is_bad), expires))
+        self._conn().execute(
+            "INSERT OR REPLACE INTO verdicts (user_id, rule_hash, fingerprint, is_bad, expires) VALUES (?, ?, ?, ?, ?)",
+            (user_id, self.rule_hash, fingerprint, int(bool(is_bad)), expires),
+        )
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
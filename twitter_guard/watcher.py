@@ -0,0 +1,144 @@
+"""
+Watches the notifications of one account continuously, polling the unread badge and fetching the notifications only when it changes.
+
+    python -m twitter_guard.watcher --cookie-path cookies.txt --config-path config.yaml --block-list-path block_list.yaml
+"""
+import argparse
+import threading
+from time import monotonic
+
+from .apifree_bot import TwitterBot
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationWatcher:
+    """
+    Watches the notifications of a TwitterBot continuously.
+
+    The cheap badge_count endpoint is polled, and notifications/all.json is only fetched when the unread count changes (or after full_check_interval as a safety net).
+    The poll interval drops to min_interval as soon as something happens and grows by backoff after every quiet poll, up to max_interval.
+    A failed badge poll (e.g. throttled) backs off like a quiet one, and the notifications are then only checked when the full check is due.
+    The cursor is only written when new notifications were fetched.
+    """
+
+    def __init__(self, bot, min_interval=5, max_interval=120, backoff=1.5, full_check_interval=900, block=True, update_remote_cursor=False):
+        """
+        Parameters:
+        bot (TwitterBot): the account to watch.
+        min_interval (float): seconds between polls during activity.
+        max_interval (float): seconds between polls when nothing happens.
+        backoff (float): factor applied to the interval after a quiet poll.
+        full_check_interval (float): fetch the notifications at least this often, even if the badge did not change.
+        block (bool): block the users judged as bad.
+        update_remote_cursor (bool): mark the notifications as read, which also resets the badge.
+        """
+        self.bot = bot
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.full_check_interval = full_check_interval
+        self.block = block
+        self.update_remote_cursor = update_remote_cursor
+
+        self.interval = min_interval
+        self._last_badge = None
+        self._last_check = None
+        self._stop = threading.Event()
+
+        self.polls = 0
+        self.checks = 0
+
+    def _badge(self):
+        status_code, result = self.bot.get_badge_count()
+        if status_code != 200 or not result:
+            return None
+        return result.get("ntab_unread_count")
+
+    def poll_once(self):
+        """
+        Poll the badge, and check the notifications if needed.
+
+        Returns:
+        bool: whether the notifications were checked.
+        """
+        self.polls += 1
+        badge = self._badge()
+        now = monotonic()
+
+        if badge is None:
+            # the badge endpoint failed, most likely throttled; polling harder would only make it worse
+            logger.info("badge poll failed, backing off")
+            changed = False
+        else:
+            changed = badge != self._last_badge and badge > 0
+        overdue = self._last_check is None or now - self._last_check >= self.full_check_interval
+
+        if not (changed or overdue):
+            self.interval = min(self.interval * self.backoff, self.max_interval)
+            return False
+
+        judgements = self.bot.check_notifications(block=self.block, update_remote_cursor=self.update_remote_cursor)
+        self.checks += 1
+        self._last_check = now
+        # with update_remote_cursor the badge is reset by the check, so compare against 0 next time
+        if self.update_remote_cursor:
+            self._last_badge = 0
+        elif badge is not None:
+            self._last_badge = badge
+
+        if changed:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * self.backoff, self.max_interval)
+        logger.info(f"badge {badge}: {len(judgements or {})} new users judged, next poll in {self.interval:.1f}s")
+        return True
+
+    def run_forever(self):
+        """
+        Poll until stop() is called. Errors are logged and retried at max_interval.
+        """
+        self._stop.clear()
+        while not self._stop.is_set():
+            try:
+                self.poll_once()
+            except Exception:
+                logger.exception("watcher poll failed")
+                self.interval = self.max_interval
+            self._stop.wait(self.interval)
+
+    def start(self):
+        thread = threading.Thread(target=self.run_forever, name="notification-watcher", daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop.set()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="watch the notifications of an account and block bad users")
+    parser.add_argument("--cookie-path", required=True)
+    parser.add_argument("--config-path")
+    parser.add_argument("--white-list-path")
+    parser.add_argument("--block-list-path")
+    parser.add_argument("--min-interval", type=float, default=5)
+    parser.add_argument("--max-interval", type=float, default=120)
+    parser.add_argument("--no-block", action="store_true", help="only judge, do not block")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    bot = TwitterBot(
+        cookie_path=args.cookie_path,
+        config_path=args.config_path,
+        white_list_path=args.white_list_path,
+        block_list_path=args.block_list_path,
+    )
+    watcher = NotificationWatcher(bot, min_interval=args.min_interval, max_interval=args.max_interval, block=not args.no_block)
+    try:
+        watcher.run_forever()
+    except KeyboardInterrupt:
+        watcher.stop()